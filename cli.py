@@ -3,21 +3,38 @@
 """
 
 from contact import ContactSystem
-from typing import Optional
+from commands import CommandExecutor, FORMATTERS, parse_list_args
+from typing import Optional, Dict, TextIO
+import argparse
+import gc
 import sys
+import time
 
 
 class ContactCommandInterface:
     """命令行交互界面"""
+    BATCH_FLUSH = 4096  # 批处理模式下每积累多少条结果写出一次
     
-    def __init__(self, use_index: bool = True, use_phone_index: bool = True):
-        self.system = ContactSystem(use_index=use_index, use_phone_index=use_phone_index)
+    def __init__(self, use_index: bool = True, use_phone_index: bool = True,
+                 data_file: str = "contacts.json", durable: bool = False, fsync_every: int = 1,
+                 index_mode: str = "eager", index_type: str = "trie", phone_ngram: bool = False,
+                 remark_index: bool = False, cache_entries: int = 256,
+                 cache_bytes: Optional[int] = 32 * 1024 * 1024, compact: bool = False,
+                 quiet: bool = False):
+        self.system = ContactSystem(use_index=use_index, use_phone_index=use_phone_index,
+                                    name_index_type=index_type, phone_index_type=index_type,
+                                    data_file=data_file, durable=durable, fsync_every=fsync_every,
+                                    index_mode=index_mode, use_phone_ngram_index=phone_ngram,
+                                    use_remark_index=remark_index, cache_entries=cache_entries,
+                                    cache_bytes=cache_bytes, compact=compact)
+        # 交互界面是本地使用，SAVE 可以写到指定文件
+        self.executor = CommandExecutor(self.system, allow_paths=True)
         self.running = True
         
         # 首次启动时尝试加载已有数据
         count, msg = self.system.load_from_file()
         if count > 0:
-            print(f"[启动] {msg}")
+            print(f"[启动] {msg}", file=sys.stderr if quiet else sys.stdout)
     
     def print_help(self):
         """打印帮助信息"""
@@ -29,99 +46,99 @@ class ContactCommandInterface:
 命令格式：
   ADD <姓名> <电话> [备注]         - 添加联系人
   DEL <姓名或电话>                 - 删除联系人
-  FIND_NAME <名字前缀>             - 按名字前缀查询
-  FIND_PHONE <电话前缀>            - 按电话前缀查询
-  LIST                              - 列出所有联系人
+  DEL_PREFIX_NAME <名字前缀>       - 删除名字以该前缀开头的全部联系人
+  DEL_PREFIX_PHONE <电话前缀>      - 删除电话以该前缀开头的全部联系人（如停用号段）
+  FIND_NAME <名字前缀> [条数]      - 按名字前缀查询（可限制条数）
+  FIND_PHONE <电话前缀> [条数]     - 按电话前缀查询（可限制条数）
+  FIND_PHONE_ANY <数字> [条数]     - 查询号码中任意位置包含这些数字的联系人（如尾号）
+  FIND_FUZZY <姓名> [编辑距离]     - 容错查询姓名（默认容许 1 处错字）
+  FIND_REMARK <词> [词 ...]        - 按备注检索，多个词须同时出现
+  FIND_PINYIN <拼音前缀> [条数]    - 按姓名全拼或首字母前缀查询（如 zhangs、zs）；
+                                    多音字只按常用读音索引（姓氏按姓氏读音），如 重 只认 zhong
+  COUNT_NAME <名字前缀>            - 统计名字前缀匹配数
+  COUNT_PHONE <电话前缀>           - 统计电话前缀匹配数
+  LIST [by name|phone] [条数] [after <游标>]
+                                    - 列出联系人（可按姓名或电话排序并分页）
   STAT                              - 显示系统统计信息
-  SAVE                              - 保存数据到文件
+  SAVE [文件名]                     - 保存数据（.jsonl 为JSON Lines，.snap 为二进制快照）
+  COMPACT                           - 持久模式下把日志合并进快照
   HELP                              - 显示此帮助信息
   EXIT                              - 退出系统
 
 示例：
   ADD 张三 13800000001 工作电话
   DEL 13800000001
+  DEL_PREFIX_PHONE 1350012
   FIND_NAME 张
+  FIND_NAME 张 10
   FIND_PHONE 138
+  FIND_PHONE_ANY 8888
+  FIND_FUZZY 张山
+  FIND_PINYIN zs
+  FIND_REMARK 研发 北京
   LIST
+  LIST by name 50
 """
         print(help_text)
     
-    def handle_add(self, parts: list):
-        """处理ADD命令"""
-        if len(parts) < 3:
-            print("✗ 错误：格式不正确。用法：ADD <姓名> <电话> [备注]")
+    def handle(self, line: str):
+        """执行一条命令（语法与批处理、网络服务相同，由CommandExecutor解析执行），并渲染结果"""
+        result = self.executor.execute(line)
+        if not result["ok"]:
+            hint = "。输入 HELP 查看帮助" if result.get("command") not in self.executor.handlers else ""
+            print(f"✗ {result['error']}{hint}")
             return
         
-        name = parts[1]
-        phone = parts[2]
-        remark = " ".join(parts[3:]) if len(parts) > 3 else ""
-        
-        success, msg = self.system.add_contact(name, phone, remark)
-        if success:
-            print(f"✓ {msg}")
+        command = result["command"]
+        if "stats" in result:
+            self._print_stats(result["stats"])
+        elif "contacts" in result:
+            self._print_result(command, line.split(), result)
+        elif "message" in result:
+            print(f"✓ {result['message']}")
         else:
-            print(f"✗ {msg}")
-    
-    def handle_del(self, parts: list):
-        """处理DEL命令"""
-        if len(parts) != 2:
-            print("✗ 错误：格式不正确。用法：DEL <姓名或电话>")
-            return
-        
-        key = parts[1]
-        count, msg = self.system.del_contact(key)
-        
-        if count > 0:
-            print(f"✓ {msg}")
-        else:
-            print(f"✗ {msg}")
-    
-    def handle_find_name(self, parts: list):
-        """处理FIND_NAME命令"""
-        if len(parts) != 2:
-            print("✗ 错误：格式不正确。用法：FIND_NAME <名字前缀>")
-            return
-        
-        prefix = parts[1]
-        results = self.system.find_by_name(prefix)
-        
-        if not results:
-            print(f"✗ 未找到名字前缀为 '{prefix}' 的联系人")
-            return
-        
-        print(f"\n找到 {len(results)} 个联系人：")
-        self._print_contacts(results)
+            field = "名字" if command == "COUNT_NAME" else "电话"
+            print(f"✓ {field}前缀为 '{line.split()[1]}' 的联系人共 {result['count']} 个")
     
-    def handle_find_phone(self, parts: list):
-        """处理FIND_PHONE命令"""
-        if len(parts) != 2:
-            print("✗ 错误：格式不正确。用法：FIND_PHONE <电话前缀>")
+    def _print_result(self, command: str, parts: list, result: Dict):
+        """打印查询或列出的结果；LIST 还有下一页时给出继续的命令"""
+        contacts = result["contacts"]
+        if command == "LIST":
+            order, limit, cursor = parse_list_args(parts)
+            if not contacts:
+                print("✗ 通讯录为空" if cursor is None else "✗ 没有更多联系人")
+                return
+            if limit is None and cursor is None:
+                print(f"\n共 {len(contacts)} 个联系人：")
+            else:
+                print(f"\n本页 {len(contacts)} 个联系人：")
+            self._print_contacts(contacts)
+            if "cursor" in result:
+                by = "" if order == "insert" else f" by {order}"
+                print(f"下一页：LIST{by} {limit} after {result['cursor']}")
             return
         
-        prefix = parts[1]
-        results = self.system.find_by_phone(prefix)
-        
-        if not results:
-            print(f"✗ 未找到电话前缀为 '{prefix}' 的联系人")
-            return
-        
-        print(f"\n找到 {len(results)} 个联系人：")
-        self._print_contacts(results)
-    
-    def handle_list(self, parts: list):
-        """处理LIST命令"""
-        results = self.system.list_all()
-        
-        if not results:
-            print("✗ 通讯录为空")
+        if not contacts:
+            print("✗ 未找到符合条件的联系人")
             return
-        
-        print(f"\n共 {len(results)} 个联系人：")
-        self._print_contacts(results)
+        if result["more"]:
+            print(f"\n显示前 {len(contacts)} 个联系人（还有更多结果）：")
+        else:
+            print(f"\n找到 {len(contacts)} 个联系人：")
+        self._print_contacts(contacts)
     
-    def handle_stat(self, parts: list):
-        """处理STAT命令"""
-        stats = self.system.get_stats()
+    def _print_stats(self, stats: Dict):
+        """打印统计信息"""
+        state = {"ready": "已就绪", "building": "后台构建中（查询暂用扫描）",
+                 "pending": "未构建（首次前缀查询时构建）"}[stats['index_state']]
+        if stats['index_build_seconds'] is not None:
+            state += f"，耗时 {stats['index_build_seconds'] * 1000:.1f} ms"
+        if stats['cache_enabled']:
+            cache = (f"{stats['cache_entries']} 条 / {stats['cache_bytes']} 字节，"
+                     f"命中 {stats['cache_hits']}，未命中 {stats['cache_misses']}，"
+                     f"容量淘汰 {stats['cache_evictions']}，变更失效 {stats['cache_invalidations']}")
+        else:
+            cache = "未启用"
         
         stat_text = f"""
 ╔════════════════════════════════════════╗
@@ -129,28 +146,29 @@ class ContactCommandInterface:
 ╚════════════════════════════════════════╝
 总联系人数：       {stats['total_contacts']}
 唯一姓名数：       {stats['unique_names']}
-姓名索引启用：     {'是 (Trie树)' if stats['use_name_index'] else '否'}
-电话索引启用：     {'是 (Trie树)' if stats['use_phone_index'] else '否'}
+姓名索引启用：     {f"是 ({stats['name_index_backend']})" if stats['use_name_index'] else '否'}
+电话索引启用：     {f"是 ({stats['phone_index_backend']})" if stats['use_phone_index'] else '否'}
+拼音索引启用：     {'是 (全拼 + 首字母)' if stats['use_pinyin_index'] else '否'}
+号码子串索引：     {'是 (n元组倒排表)' if stats['use_phone_ngram_index'] else '否（逐条扫描）'}
+备注全文索引：     {'是 (字符二元组倒排表)' if stats['use_remark_index'] else '否（逐条扫描）'}
+索引构建：         {stats['index_mode']}，{state}
+紧凑存储：         {'是' if stats['compact'] else '否'}
+持久模式：         {'是 (预写日志)' if stats['durable'] else '否'}
+存储方式：         {'内存映射快照（首次写入时导入内存）' if stats['storage'] == 'mmap' else '内存'}
+每条记录占用：     {stats['bytes_per_contact']} 字节（不含索引）
+查询缓存：         {cache}
 """
         print(stat_text)
     
-    def handle_save(self, parts: list):
-        """处理SAVE命令"""
-        success, msg = self.system.save_to_file()
-        if success:
-            print(f"✓ {msg}")
-        else:
-            print(f"✗ {msg}")
-    
     def _print_contacts(self, contacts: list):
         """格式化打印联系人列表"""
         print("\n┌─────────────────────────────────────────────────────┐")
         print("│ 序号 │     姓名     │      电话      │      备注      │")
         print("├─────────────────────────────────────────────────────┤")
         for idx, contact in enumerate(contacts, 1):
-            name = contact.name[:8]
-            phone = contact.phone
-            remark = (contact.remark[:8] + "...") if len(contact.remark) > 8 else contact.remark
+            name = contact["name"][:8]
+            phone = contact["phone"]
+            remark = (contact["remark"][:8] + "...") if len(contact["remark"]) > 8 else contact["remark"]
             print(f"│ {idx:2d}  │ {name:^10s} │ {phone:^14s} │ {remark:^14s} │")
         print("└─────────────────────────────────────────────────────┘\n")
     
@@ -168,37 +186,15 @@ class ContactCommandInterface:
                 if not user_input:
                     continue
                 
-                parts = user_input.split(maxsplit=1)
-                if len(parts) == 1:
-                    parts = [user_input, ""]
-                else:
-                    # 进一步分割参数
-                    parts = user_input.split()
-                
-                command = parts[0].upper()
-                
+                command = user_input.split()[0].upper()
                 if command == "EXIT":
                     print("\n正在退出系统...")
                     self.running = False
                     break
                 elif command == "HELP":
                     self.print_help()
-                elif command == "ADD":
-                    self.handle_add(parts)
-                elif command == "DEL":
-                    self.handle_del(parts)
-                elif command == "FIND_NAME":
-                    self.handle_find_name(parts)
-                elif command == "FIND_PHONE":
-                    self.handle_find_phone(parts)
-                elif command == "LIST":
-                    self.handle_list(parts)
-                elif command == "STAT":
-                    self.handle_stat(parts)
-                elif command == "SAVE":
-                    self.handle_save(parts)
                 else:
-                    print(f"✗ 未知命令：'{command}'。输入 HELP 查看帮助")
+                    self.handle(user_input)
             
             except KeyboardInterrupt:
                 print("\n\n[系统] 已中断")
@@ -206,13 +202,112 @@ class ContactCommandInterface:
                 break
             except Exception as e:
                 print(f"✗ 错误：{str(e)}")
+        
+        self.system.close()
+    
+    def run_batch(self, source: TextIO, output: str = "json", out: TextIO = sys.stdout,
+                  err: TextIO = sys.stderr) -> Dict:
+        """批处理模式：逐行执行source中的命令，不打印横幅与表格
+        
+        每条命令的结果按output格式（json 或 tsv）写入out，攒够一批再写出；
+        空行与 # 开头的注释行跳过，遇到 EXIT 停止。结束时向err输出汇总并返回汇总信息。
+        """
+        executor = self.executor
+        format_result = FORMATTERS[output]
+        buffer = []
+        total = failed = 0
+        start_time = time.perf_counter()
+        # 与bulk_load相同，批量新增期间暂停循环垃圾回收，避免反复遍历全部联系人与索引节点
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for line in source:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.upper() == "EXIT":
+                    break
+                try:
+                    result = executor.execute(line)
+                except Exception as e:
+                    result = {"command": line.split()[0].upper(), "ok": False, "error": f"错误：{e}"}
+                total += 1
+                if not result["ok"]:
+                    failed += 1
+                buffer.append(format_result(result))
+                if len(buffer) >= self.BATCH_FLUSH:
+                    out.write("\n".join(buffer) + "\n")
+                    buffer.clear()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+            if buffer:
+                out.write("\n".join(buffer) + "\n")
+            out.flush()
+            self.system.close()
+        
+        elapsed = time.perf_counter() - start_time
+        rate = f"，{total / elapsed:,.0f} 条/秒" if elapsed > 0 else ""
+        print(f"[批处理] 共 {total} 条命令，成功 {total - failed}，失败 {failed}，"
+              f"耗时 {elapsed:.3f} 秒{rate}", file=err)
+        return {"total": total, "succeeded": total - failed, "failed": failed, "seconds": elapsed}
+
+
+def add_system_arguments(parser: argparse.ArgumentParser):
+    """添加交互界面与网络服务共用的系统参数"""
+    parser.add_argument("--data-file", default="contacts.json",
+                        help="数据文件路径，.jsonl 为JSON Lines，.snap 为可映射的二进制快照（默认 contacts.json）")
+    parser.add_argument("--durable", action="store_true",
+                        help="持久模式：增删写入预写日志，启动时加载快照并重放日志")
+    parser.add_argument("--fsync-every", type=int, default=1,
+                        help="持久模式下每写入多少条日志执行一次fsync（默认 1）")
+    parser.add_argument("--index-mode", choices=ContactSystem.INDEX_MODES, default="background",
+                        help="索引构建时机：eager 加载时构建，lazy 首次前缀查询时构建，"
+                             "background 启动后由后台线程构建（默认 background）")
+    parser.add_argument("--phone-ngram", action="store_true",
+                        help="维护电话号码的n元组倒排索引，加速 FIND_PHONE_ANY（额外占用内存）")
+    parser.add_argument("--remark-index", action="store_true",
+                        help="维护备注的字符二元组倒排索引，加速 FIND_REMARK（额外占用内存）")
+    parser.add_argument("--index-type", choices=sorted(ContactSystem.INDEX_TYPES), default="auto",
+                        help="前缀索引后端：trie/radix 适合频繁增删，sorted 适合读多写少，"
+                             "scan 不建索引，auto 按数据量与读写比例自动切换（默认 auto）")
+    parser.add_argument("--cache-entries", type=int, default=256,
+                        help="前缀查询结果缓存的最大条目数，0 表示关闭缓存（默认 256）")
+    parser.add_argument("--cache-bytes", type=int, default=32 * 1024 * 1024,
+                        help="前缀查询结果缓存的最大字节数（默认 32MB）")
+    parser.add_argument("--compact", action="store_true",
+                        help="紧凑存储：驻留姓名，重名联系人共用一份字符串（实测约省 3%% 内存）")
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="通讯录管理系统")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="批处理模式：从文件（- 为标准输入）逐行读取命令执行，不进入交互界面")
+    parser.add_argument("--output", choices=sorted(FORMATTERS), default="json",
+                        help="批处理模式的结果格式：json 每条命令一行JSON，tsv 制表符分隔（默认 json）")
+    add_system_arguments(parser)
+    return parser.parse_args(argv)
 
 
 def main():
     """主函数"""
+    args = parse_args()
     # 启用索引以提升性能
-    interface = ContactCommandInterface(use_index=True, use_phone_index=True)
-    interface.run()
+    interface = ContactCommandInterface(use_index=True, use_phone_index=True,
+                                        data_file=args.data_file, durable=args.durable,
+                                        fsync_every=args.fsync_every, index_mode=args.index_mode,
+                                        index_type=args.index_type, phone_ngram=args.phone_ngram,
+                                        remark_index=args.remark_index,
+                                        cache_entries=args.cache_entries, cache_bytes=args.cache_bytes,
+                                        compact=args.compact, quiet=args.batch is not None)
+    if args.batch is None:
+        interface.run()
+    elif args.batch == "-":
+        interface.run_batch(sys.stdin, args.output)
+    else:
+        with open(args.batch, encoding="utf-8") as source:
+            interface.run_batch(source, args.output)
 
 
 if __name__ == "__main__":
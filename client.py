@@ -0,0 +1,88 @@
+"""
+通讯录服务客户端
+连接 server.py 启动的服务，发送命令并解析JSON回复；直接运行时逐行读取标准输入作为命令
+"""
+
+from typing import List, Dict, Iterable
+import argparse
+import asyncio
+import json
+import sys
+
+
+class ContactClient:
+    """通讯录服务的asyncio客户端"""
+    
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+    
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = 7070) -> "ContactClient":
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+    
+    async def request(self, command: str) -> Dict:
+        """发送一条命令并等待回复"""
+        return (await self.pipeline([command]))[0]
+    
+    async def pipeline(self, commands: Iterable[str]) -> List[Dict]:
+        """连续发送多条命令，再按顺序收取全部回复
+        
+        发送与接收同时进行，命令很多时不会因双方缓冲区写满而互相等待。
+        """
+        commands = [command.strip() for command in commands]
+        for command in commands:
+            if not command or "\n" in command:
+                raise ValueError(f"无效的命令：{command!r}")
+        
+        async def send():
+            for command in commands:
+                self.writer.write((command + "\n").encode("utf-8"))
+                await self.writer.drain()
+        
+        async def receive():
+            responses = []
+            for _ in commands:
+                line = await self.reader.readline()
+                if not line:
+                    raise ConnectionError("服务端已关闭连接")
+                responses.append(json.loads(line))
+            return responses
+        
+        return (await asyncio.gather(send(), receive()))[1]
+    
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def run(host: str, port: int):
+    """逐行读取标准输入作为命令，打印服务端回复"""
+    client = await ContactClient.connect(host, port)
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                break
+            if not line.strip():
+                continue
+            if line.strip().upper() in ("EXIT", "QUIT"):
+                break
+            print(json.dumps(await client.request(line), ensure_ascii=False))
+    finally:
+        await client.close()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="通讯录服务客户端")
+    parser.add_argument("--host", default="127.0.0.1", help="服务地址（默认 127.0.0.1）")
+    parser.add_argument("--port", type=int, default=7070, help="服务端口（默认 7070）")
+    args = parser.parse_args()
+    asyncio.run(run(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
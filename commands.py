@@ -0,0 +1,296 @@
+"""
+命令执行模块
+按交互界面的命令语法执行一行命令，返回可序列化为JSON的结果，
+供网络服务与批处理等非交互场景使用
+"""
+
+from contact import ContactSystem, Contact, Cursor
+from typing import List, Dict, Callable, Optional, Tuple
+import json
+
+
+class CommandError(Exception):
+    """命令格式或参数错误"""
+
+
+def contact_record(contact: Contact) -> Dict[str, str]:
+    """联系人转为可序列化的记录"""
+    return {"name": contact.name, "phone": contact.phone, "remark": contact.remark}
+
+
+def format_json(result: Dict) -> str:
+    """结果格式化为一行JSON"""
+    return json.dumps(result, ensure_ascii=False)
+
+
+def format_tsv(result: Dict) -> str:
+    """结果格式化为制表符分隔的若干行
+    
+    首行为 状态、命令、说明（消息、错误原因或结果条数，还有更多结果时另加一列 more，
+    分页列出时再加一列下一页游标）；
+    联系人、统计项与命令列表各占一行，以制表符开头以便与首行区分。
+    """
+    if not result["ok"]:
+        head = ["error", result.get("command", ""), result["error"]]
+    elif "message" in result:
+        head = ["ok", result["command"], result["message"]]
+    elif "count" in result:
+        head = ["ok", result["command"], str(result["count"])] + (["more"] if result.get("more") else [])
+        if result.get("cursor"):
+            head.append(result["cursor"])
+    else:
+        head = ["ok", result["command"]]
+    lines = ["\t".join(head)]
+    for contact in result.get("contacts", ()):
+        lines.append(f"\t{contact['name']}\t{contact['phone']}\t{contact['remark']}")
+    for key, value in result.get("stats", {}).items():
+        lines.append(f"\t{key}\t{value}")
+    for command in result.get("commands", ()):
+        lines.append(f"\t{command}")
+    return "\n".join(lines)
+
+
+FORMATTERS: Dict[str, Callable[[Dict], str]] = {"json": format_json, "tsv": format_tsv}
+
+LIST_USAGE = "LIST [by name|phone] [条数] [after <游标>]"
+
+
+def parse_list_args(parts: List[str]) -> Tuple[str, Optional[int], Optional[str]]:
+    """解析 LIST 的参数，返回 (排序方式, 条数, 游标)；未指定排序时按插入顺序"""
+    args = parts[1:]
+    order = "insert"
+    if args and args[0].lower() == "by":
+        if len(args) < 2 or args[1].lower() not in ("name", "phone"):
+            raise CommandError(f"格式不正确。用法：{LIST_USAGE}")
+        order = args[1].lower()
+        args = args[2:]
+    limit = None
+    if args and args[0].lower() != "after":
+        if not args[0].isdigit() or int(args[0]) == 0:
+            raise CommandError(f"条数必须为正整数，收到 '{args[0]}'")
+        limit = int(args[0])
+        args = args[1:]
+    cursor = None
+    if args:
+        if len(args) != 2 or args[0].lower() != "after":
+            raise CommandError(f"格式不正确。用法：{LIST_USAGE}")
+        cursor = args[1]
+    return order, limit, cursor
+
+
+def find_pinyin_page(system: ContactSystem, prefix: str,
+                     limit: Optional[int]) -> Tuple[List[Contact], Optional[Cursor]]:
+    """FIND_PINYIN 的查询：先按全拼匹配，条数未满时逐页补充首字母匹配，返回 (结果, 下一页游标)
+    
+    两种匹配可能命中同一联系人，按电话号码去重（映射快照每次读取都构造新的
+    联系人对象）；去重会让一页首字母结果不足所需条数，因此继续取下一页直到取满。
+    """
+    results, cursor = system.find_by_pinyin_page(prefix, limit)
+    if cursor is not None or (limit is not None and len(results) >= limit):
+        return results, cursor
+    seen = {contact.phone for contact in results}
+    while True:
+        remaining = None if limit is None else limit - len(results)
+        extra, cursor = system.find_by_initials_page(prefix, remaining, cursor=cursor)
+        for contact in extra:
+            if contact.phone not in seen:
+                seen.add(contact.phone)
+                results.append(contact)
+        if cursor is None or (limit is not None and len(results) >= limit):
+            return results, cursor
+
+
+class CommandExecutor:
+    """命令执行器
+    
+    execute 接收一行命令文本，返回字典：成功时 ok 为 True，并按命令附带
+    message/contacts/count/more/stats 等字段；失败时 ok 为 False，error 为原因。
+    命令语法与交互界面相同，命令名不区分大小写。
+    allow_paths 为False时 SAVE 不接受文件名，只能写默认数据文件，
+    网络服务据此避免远程客户端写任意路径；本地的交互界面与批处理才开启。
+    """
+    
+    def __init__(self, system: ContactSystem, allow_paths: bool = False):
+        self.system = system
+        self.allow_paths = allow_paths
+        self.handlers: Dict[str, Callable[[List[str]], Dict]] = {
+            "ADD": self.add,
+            "DEL": self.delete,
+            "DEL_PREFIX_NAME": self.delete_name_prefix,
+            "DEL_PREFIX_PHONE": self.delete_phone_prefix,
+            "FIND_NAME": self.find_name,
+            "FIND_PHONE": self.find_phone,
+            "FIND_PHONE_ANY": self.find_phone_any,
+            "FIND_PINYIN": self.find_pinyin,
+            "FIND_REMARK": self.find_remark,
+            "FIND_FUZZY": self.find_fuzzy,
+            "COUNT_NAME": self.count_name,
+            "COUNT_PHONE": self.count_phone,
+            "LIST": self.list_all,
+            "STAT": self.stat,
+            "SAVE": self.save,
+            "COMPACT": self.compact,
+            "HELP": self.help,
+        }
+    
+    def execute(self, line: str) -> Dict:
+        """执行一行命令并返回结果"""
+        parts = line.split()
+        if not parts:
+            return {"ok": False, "error": "空命令"}
+        command = parts[0].upper()
+        handler = self.handlers.get(command)
+        if handler is None:
+            return {"command": command, "ok": False, "error": f"未知命令：'{parts[0]}'"}
+        try:
+            return {"command": command, **handler(parts)}
+        except (CommandError, ValueError) as e:
+            return {"command": command, "ok": False, "error": str(e)}
+    
+    def execute_json(self, line: str) -> str:
+        """执行一行命令，返回单行JSON文本（不含换行符）"""
+        return format_json(self.execute(line))
+    
+    # ---- 各命令 ----
+    
+    def add(self, parts: List[str]) -> Dict:
+        """ADD <姓名> <电话> [备注]"""
+        if len(parts) < 3:
+            raise CommandError("格式不正确。用法：ADD <姓名> <电话> [备注]")
+        success, msg = self.system.add_contact(parts[1], parts[2], " ".join(parts[3:]))
+        return {"ok": success, "message": msg} if success else {"ok": False, "error": msg}
+    
+    def delete(self, parts: List[str]) -> Dict:
+        """DEL <姓名或电话>"""
+        if len(parts) != 2:
+            raise CommandError("格式不正确。用法：DEL <姓名或电话>")
+        return self._deleted(*self.system.del_contact(parts[1]))
+    
+    def delete_name_prefix(self, parts: List[str]) -> Dict:
+        """DEL_PREFIX_NAME <名字前缀>"""
+        if len(parts) != 2:
+            raise CommandError("格式不正确。用法：DEL_PREFIX_NAME <名字前缀>")
+        return self._deleted(*self.system.del_by_name_prefix(parts[1]))
+    
+    def delete_phone_prefix(self, parts: List[str]) -> Dict:
+        """DEL_PREFIX_PHONE <电话前缀>"""
+        if len(parts) != 2:
+            raise CommandError("格式不正确。用法：DEL_PREFIX_PHONE <电话前缀>")
+        return self._deleted(*self.system.del_by_phone_prefix(parts[1]))
+    
+    def find_name(self, parts: List[str]) -> Dict:
+        """FIND_NAME <名字前缀> [条数]"""
+        prefix, limit = self._prefix_args(parts, "FIND_NAME <名字前缀> [条数]")
+        return self._page(*self.system.find_by_name_page(prefix, limit))
+    
+    def find_phone(self, parts: List[str]) -> Dict:
+        """FIND_PHONE <电话前缀> [条数]"""
+        prefix, limit = self._prefix_args(parts, "FIND_PHONE <电话前缀> [条数]")
+        return self._page(*self.system.find_by_phone_page(prefix, limit))
+    
+    def find_phone_any(self, parts: List[str]) -> Dict:
+        """FIND_PHONE_ANY <数字> [条数]"""
+        digits, limit = self._prefix_args(parts, "FIND_PHONE_ANY <数字> [条数]")
+        # 多取一条用于判断是否还有更多结果
+        results = self.system.find_by_phone_substring(digits, None if limit is None else limit + 1)
+        more = limit is not None and len(results) > limit
+        return self._page(results[:limit], more or None)
+    
+    def find_pinyin(self, parts: List[str]) -> Dict:
+        """FIND_PINYIN <拼音前缀> [条数]：先按全拼匹配，条数未满时再补充首字母匹配
+        
+        每个字只有一个读音（见 pinyin.py），多音字的其他读音查不到。
+        """
+        prefix, limit = self._prefix_args(parts, "FIND_PINYIN <拼音前缀> [条数]")
+        return self._page(*find_pinyin_page(self.system, prefix, limit))
+    
+    def find_remark(self, parts: List[str]) -> Dict:
+        """FIND_REMARK <词> [词 ...]"""
+        if len(parts) < 2:
+            raise CommandError("格式不正确。用法：FIND_REMARK <词> [词 ...]")
+        return self._page(self.system.find_by_remark(" ".join(parts[1:])), None)
+    
+    def find_fuzzy(self, parts: List[str]) -> Dict:
+        """FIND_FUZZY <姓名> [编辑距离]"""
+        if len(parts) not in (2, 3):
+            raise CommandError("格式不正确。用法：FIND_FUZZY <姓名> [编辑距离]")
+        if len(parts) == 3 and not parts[2].isdigit():
+            raise CommandError(f"编辑距离必须为非负整数，收到 '{parts[2]}'")
+        max_edits = int(parts[2]) if len(parts) == 3 else 1
+        return self._page(self.system.find_by_name_fuzzy(parts[1], max_edits), None)
+    
+    def count_name(self, parts: List[str]) -> Dict:
+        """COUNT_NAME <名字前缀>"""
+        if len(parts) != 2:
+            raise CommandError("格式不正确。用法：COUNT_NAME <名字前缀>")
+        return {"ok": True, "count": self.system.count_by_name(parts[1])}
+    
+    def count_phone(self, parts: List[str]) -> Dict:
+        """COUNT_PHONE <电话前缀>"""
+        if len(parts) != 2:
+            raise CommandError("格式不正确。用法：COUNT_PHONE <电话前缀>")
+        return {"ok": True, "count": self.system.count_by_phone(parts[1])}
+    
+    def list_all(self, parts: List[str]) -> Dict:
+        """LIST [by name|phone] [条数] [after <游标>]：还有更多结果时附带下一页的 cursor"""
+        order, limit, cursor = parse_list_args(parts)
+        if order == "insert" and limit is None and cursor is None:
+            return self._page(self.system.list_all(), None)
+        results, next_cursor = self.system.list_page(order, limit, cursor)
+        page = self._page(results, next_cursor)
+        if next_cursor is not None:
+            page["cursor"] = next_cursor
+        return page
+    
+    def stat(self, parts: List[str]) -> Dict:
+        """STAT"""
+        return {"ok": True, "stats": self.system.get_stats()}
+    
+    def save(self, parts: List[str]) -> Dict:
+        """SAVE [文件名]"""
+        if len(parts) > 2:
+            raise CommandError("格式不正确。用法：SAVE [文件名]")
+        path = parts[1] if len(parts) == 2 else None
+        if path is not None and not self.allow_paths:
+            raise CommandError("不允许指定文件名，只能保存到默认数据文件。用法：SAVE")
+        if path is None and self.system.durable:
+            # 持久模式下保存默认快照即压缩日志，避免日志无限增长
+            success, msg = self.system.compact_wal()
+        else:
+            success, msg = self.system.save_to_file(path)
+        return {"ok": success, "message": msg} if success else {"ok": False, "error": msg}
+    
+    def compact(self, parts: List[str]) -> Dict:
+        """COMPACT"""
+        if not self.system.durable:
+            raise CommandError("未启用持久模式，无日志可压缩")
+        success, msg = self.system.compact_wal()
+        return {"ok": success, "message": msg} if success else {"ok": False, "error": msg}
+    
+    def help(self, parts: List[str]) -> Dict:
+        """HELP：列出支持的命令"""
+        return {"ok": True, "commands": sorted(self.handlers)}
+    
+    # ---- 辅助 ----
+    
+    def _prefix_args(self, parts: List[str], usage: str):
+        """解析 <参数> [条数] 形式的参数"""
+        if len(parts) not in (2, 3):
+            raise CommandError(f"格式不正确。用法：{usage}")
+        limit = None
+        if len(parts) == 3:
+            if not parts[2].isdigit() or int(parts[2]) == 0:
+                raise CommandError(f"条数必须为正整数，收到 '{parts[2]}'")
+            limit = int(parts[2])
+        return parts[1], limit
+    
+    def _deleted(self, count: int, msg: str) -> Dict:
+        """删除类命令的结果"""
+        if not count:
+            return {"ok": False, "error": msg}
+        return {"ok": True, "count": count, "message": msg}
+    
+    def _page(self, contacts: List[Contact], cursor) -> Dict:
+        """一页查询结果；more 表示还有更多结果"""
+        return {"ok": True, "count": len(contacts), "more": cursor is not None,
+                "contacts": [contact_record(contact) for contact in contacts]}
@@ -3,112 +3,1843 @@
 支持双向链表 + 散列表 + Trie树索引的高效检索
 """
 
-from typing import Optional, List, Dict, Tuple
-from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Tuple, Iterable, Iterator, Mapping, Callable
+from collections import OrderedDict, deque
+from types import MappingProxyType
 from datetime import datetime
+from itertools import islice, count, groupby
+from operator import itemgetter
+from functools import wraps
+from bisect import bisect_left, bisect_right
+import base64
+import gc
+import heapq
 import json
+import mmap
 import os
+import struct
+import sys
+import threading
+import time
+import weakref
+from array import array
+
+from pinyin import to_pinyin, to_initials, normalize_query
+
+
+# 分页游标：(上一条结果的键, 上一条结果的联系人编号)；同键内按编号递增排列，
+# 从编号大于游标的第一条继续，之前返回过的联系人被删除也不会漏掉后面的结果
+Cursor = Tuple[str, int]
+
+# 联系人编号生成器，进程内单调递增
+_contact_ids = count(1)
+
+
+def _reserve_ids(n: int) -> int:
+    """预留连续n个联系人编号，返回第一个（映射快照按行号换算稳定编号）
+    
+    推进同一个生成器而不是换成新的，Contact() 不加锁取号也不会拿到预留的编号；
+    整段在一次C层调用中取完，其间不释放GIL，预留的编号连续。
+    """
+    if n <= 0:
+        return next(_contact_ids)
+    return deque(islice(_contact_ids, n), maxlen=1)[0] - n + 1
+
+
+def _first_after(contacts: List["Contact"], last_id: int, lo: int = 0, hi: Optional[int] = None) -> int:
+    """在按编号递增的 contacts[lo:hi] 中二分查找第一个编号大于last_id的位置"""
+    if hi is None:
+        hi = len(contacts)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if contacts[mid].id <= last_id:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
 
 
-@dataclass
 class Contact:
-    """联系人数据结构"""
-    name: str
-    phone: str
-    remark: str = ""
+    """联系人数据结构
+    
+    id为创建时分配的稳定整数编号，不参与相等比较，
+    用于在索引中区分字段相同的不同联系人。
+    """
+    __slots__ = ("name", "phone", "remark", "id")
+    __hash__ = None  # 可变且按字段比较，与相等语义一致地不可散列
+    
+    def __init__(self, name: str, phone: str, remark: str = "", id: Optional[int] = None):
+        self.name = name
+        self.phone = phone
+        self.remark = remark
+        self.id = next(_contact_ids) if id is None else id
+    
+    def __eq__(self, other):
+        if other.__class__ is not Contact:
+            return NotImplemented
+        return (self.name, self.phone, self.remark) == (other.name, other.phone, other.remark)
     
     def __repr__(self):
         return f"Contact(name='{self.name}', phone='{self.phone}', remark='{self.remark}')"
+    
+    def __reduce__(self):
+        # 按构造参数序列化，比逐个槽位的默认状态更快更小（分片进程间大量传输联系人）
+        return Contact, (self.name, self.phone, self.remark, self.id)
 
 
 class Node:
     """双向链表节点"""
+    __slots__ = ("contact", "prev", "next")
+    
     def __init__(self, contact: Contact):
         self.contact = contact
         self.prev: Optional['Node'] = None
         self.next: Optional['Node'] = None
 
 
+# 共享的只读空映射：Trie节点的children/contacts在首次写入前指向它，
+# 省去大量叶子节点和中间节点上的空字典
+_EMPTY: Mapping = MappingProxyType({})
+
+
 class TrieNode:
     """Trie树节点"""
+    __slots__ = ("children", "contacts", "count", "seek")
+    
     def __init__(self):
-        self.children: Dict[str, 'TrieNode'] = {}
-        self.contacts: List[Contact] = []  # 该节点对应的联系人列表
+        self.children: Dict[str, 'TrieNode'] = _EMPTY
+        self.contacts: Dict[int, Contact] = _EMPTY  # 该节点对应的联系人，按编号索引并保持插入顺序
+        self.count = 0  # 以该节点为根的子树中联系人总数
+        self.seek: Optional[_IdSeek] = None  # 联系人较多的节点上按需建立，供游标二分定位
+
+
+class _IdSeek:
+    """同一个键下按编号递增排列的编号数组，游标在其上二分定位，O(log k)
+    
+    删除时只计数不移除（惰性删除），遍历时跳过已不在节点上的编号；
+    失效的编号超过一半时丢弃，下次定位时按节点重建，重建的代价由之前的删除均摊。
+    """
+    __slots__ = ("ids", "dead")
+    
+    def __init__(self, contacts: Dict[int, Contact]):
+        self.ids = array('q', sorted(contacts))
+        self.dead = 0
+    
+    def after(self, contacts: Dict[int, Contact], last_id: int) -> Iterator[Contact]:
+        """按编号递增产出编号大于last_id、仍在节点上的联系人"""
+        ids = self.ids
+        get = contacts.get
+        for i in range(bisect_right(ids, last_id), len(ids)):
+            contact = get(ids[i])
+            if contact is not None:
+                yield contact
+
+
+# 节点上的联系人不超过该数时，游标定位直接逐个比较编号，不建编号数组
+_SEEK_MIN = 64
+
+
+def _contacts_after(node: TrieNode, last_id: int) -> Iterable[Contact]:
+    """节点上编号大于last_id的联系人，按编号递增；last_id为0时即全部联系人"""
+    contacts = node.contacts
+    if not last_id:
+        return contacts.values()
+    if len(contacts) <= _SEEK_MIN:
+        return [contact for contact in contacts.values() if contact.id > last_id]
+    seek = node.seek
+    if seek is None:
+        seek = node.seek = _IdSeek(contacts)
+    return seek.after(contacts, last_id)
+
+
+def _add_to_node(node: TrieNode, path: List[TrieNode], contact: Contact):
+    """把联系人挂到键节点上，并累加路径上的子树计数"""
+    if contact.id in node.contacts:
+        return
+    if node.contacts is _EMPTY:
+        node.contacts = {}
+    node.contacts[contact.id] = contact
+    seek = node.seek
+    if seek is not None:
+        if contact.id > seek.ids[-1]:
+            seek.ids.append(contact.id)
+        else:  # 更新后重新挂回的旧编号，数组不再有序，下次定位时重建
+            node.seek = None
+    for n in path:
+        n.count += 1
+
 
+def _remove_from_node(node: TrieNode, path: List[TrieNode], contact: Contact) -> bool:
+    """从键节点上摘下联系人并递减路径计数，返回是否确有删除"""
+    contacts = node.contacts
+    if contact.id not in contacts:
+        return False
+    del contacts[contact.id]
+    seek = node.seek
+    if not contacts:
+        node.contacts = _EMPTY
+        node.seek = None
+    elif seek is not None:
+        seek.dead += 1
+        if seek.dead * 2 > len(seek.ids):
+            node.seek = None
+    for n in path:
+        n.count -= 1
+    return True
 
-class Trie:
+
+def _drop_child(node: TrieNode, char: str):
+    """删除子节点，子节点清空后恢复共享空映射"""
+    del node.children[char]
+    if not node.children:
+        node.children = _EMPTY
+
+
+def _edit_row(row: List[int], query: str, char: str) -> List[int]:
+    """编辑距离矩阵的下一行：row为某键前缀对query各前缀的距离，追加字符char"""
+    new = [row[0] + 1]
+    for i, q in enumerate(query, 1):
+        new.append(min(new[i - 1] + 1, row[i] + 1, row[i - 1] + (q != char)))
+    return new
+
+
+def _fuzzy_scan(groups: Iterable[Tuple[str, Iterable[Contact]]], query: str,
+                max_edits: int) -> Iterator[Tuple[int, str, Contact]]:
+    """逐键计算与query的编辑距离，产出距离不超过max_edits的 (距离, 键, 联系人)
+    
+    某一行的最小值超过上限后，后续字符只会让距离更大，提前放弃该键。
+    """
+    first = list(range(len(query) + 1))
+    for key, contacts in groups:
+        if abs(len(key) - len(query)) > max_edits:
+            continue
+        row = first
+        for char in key:
+            row = _edit_row(row, query, char)
+            if min(row) > max_edits:
+                break
+        else:
+            if row[-1] <= max_edits:
+                for contact in contacts:
+                    yield row[-1], key, contact
+
+
+class IndexBackend:
+    """前缀索引后端接口
+    
+    索引登记 (键, 联系人) 对，同一键下可有多个联系人（按联系人编号区分）。
+    iter_prefix 按键的字典序产出 (键, 联系人编号, 联系人)，同键内按编号递增
+    （联系人按创建顺序登记），分页游标与 _take_page 的约定一致。
+    """
+    backend = ""  # 后端名称，用于统计展示
+    
+    def insert(self, key: str, contact: Contact):
+        """登记键值；同一联系人重复登记时忽略"""
+        raise NotImplementedError
+    
+    def remove(self, key: str, contact: Contact):
+        """移除键值；不存在时忽略"""
+        raise NotImplementedError
+    
+    def count_prefix(self, prefix: str) -> int:
+        """统计前缀下的联系人数"""
+        raise NotImplementedError
+    
+    def remove_many(self, entries: List[Tuple[str, Contact]]):
+        """批量移除 (键, 联系人)；默认逐条删除"""
+        for key, contact in entries:
+            self.remove(key, contact)
+    
+    def detach_prefix(self, prefix: str) -> List[Contact]:
+        """移除前缀下的全部条目，返回被移除的联系人；默认逐条删除"""
+        entries = [(key, contact) for key, _, contact in self.iter_prefix(prefix)]
+        for key, contact in entries:
+            self.remove(key, contact)
+        return [contact for _, contact in entries]
+    
+    def iter_prefix(self, prefix: str, cursor: Optional[Cursor] = None,
+                    skip: int = 0) -> Iterator[Tuple[str, int, Contact]]:
+        """按前缀惰性遍历，传入cursor时从该位置之后继续，并跳过skip条"""
+        raise NotImplementedError
+    
+    def bulk_insert(self, groups: Iterable[Tuple[str, Iterable[Contact]]]):
+        """按键有序的 (键, 联系人序列) 批量插入"""
+        for key, contacts in groups:
+            for contact in contacts:
+                self.insert(key, contact)
+    
+    def iter_fuzzy(self, query: str, max_edits: int) -> Iterator[Tuple[int, str, Contact]]:
+        """产出与query编辑距离不超过max_edits的 (距离, 键, 联系人)；默认逐键计算"""
+        entries = self.iter_prefix("")
+        return _fuzzy_scan(((key, [contact for _, _, contact in group])
+                            for key, group in groupby(entries, key=itemgetter(0))), query, max_edits)
+    
+    def __len__(self) -> int:
+        return self.count_prefix("")
+    
+    def search_prefix(self, prefix: str, limit: Optional[int] = None, offset: int = 0,
+                      cursor: Optional[Cursor] = None) -> List[Contact]:
+        """按前缀查询，支持 limit/offset/cursor 分页"""
+        return self.search_page(prefix, limit, offset, cursor)[0]
+    
+    def search_page(self, prefix: str, limit: int, offset: int = 0,
+                    cursor: Optional[Cursor] = None) -> Tuple[List[Contact], Optional[Cursor]]:
+        """按前缀分页查询，返回 (本页结果, 下一页游标)；没有更多结果时游标为None"""
+        if offset < 0:
+            raise ValueError("offset 不能为负数")
+        return _take_page(self.iter_prefix(prefix, cursor, offset), limit)
+
+
+def _check_cursor(prefix: str, cursor: Optional[Cursor]):
+    """游标必须落在前缀范围内"""
+    if cursor is not None and not cursor[0].startswith(prefix):
+        raise ValueError(f"游标 {cursor!r} 与前缀 '{prefix}' 不匹配")
+
+
+class Trie(IndexBackend):
     """Trie树实现，用于前缀检索"""
+    backend = "trie"
+    
     def __init__(self):
         self.root = TrieNode()
     
     def insert(self, key: str, contact: Contact):
-        """向Trie树中插入键值"""
+        """向Trie树中插入键值，并更新路径上的子树计数"""
         node = self.root
+        path = [node]
         for char in key:
-            if char not in node.children:
-                node.children[char] = TrieNode()
-            node = node.children[char]
-        if contact not in node.contacts:
-            node.contacts.append(contact)
+            child = node.children.get(char)
+            if child is None:
+                if node.children is _EMPTY:
+                    node.children = {}
+                child = node.children[char] = TrieNode()
+            node = child
+            path.append(node)
+        _add_to_node(node, path, contact)
     
     def remove(self, key: str, contact: Contact):
-        """从Trie树中移除键值"""
-        def _remove(node: TrieNode, key: str, idx: int) -> bool:
-            if idx == len(key):
-                if contact in node.contacts:
-                    node.contacts.remove(contact)
-                return len(node.contacts) == 0 and len(node.children) == 0
+        """从Trie树中移除键值，更新子树计数并剪除空分支"""
+        node = self.root
+        path = [node]
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return
+            path.append(node)
+        if not _remove_from_node(node, path, contact):
+            return
+        
+        # 自底向上剪除不再包含联系人的节点
+        for depth in range(len(key), 0, -1):
+            if path[depth].count:
+                break
+            _drop_child(path[depth - 1], key[depth - 1])
+    
+    def detach_prefix(self, prefix: str) -> List[Contact]:
+        """把前缀对应的子树整棵摘下，返回其中的联系人
+        
+        只在摘下处断开一条边并修正路径上的计数，代价与前缀长度和被摘下的联系人数成正比。
+        """
+        node = self.root
+        path = [node]
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+            path.append(node)
+        removed = self._collect(node)
+        if node is self.root:
+            self.root = TrieNode()
+            return removed
+        for n in path[:-1]:
+            n.count -= len(removed)
+        
+        # 断开子树，并自底向上剪除不再包含联系人的祖先
+        for depth in range(len(prefix), 0, -1):
+            if depth < len(prefix) and path[depth].count:
+                break
+            _drop_child(path[depth - 1], prefix[depth - 1])
+        return removed
+    
+    @staticmethod
+    def _collect(node: TrieNode) -> List[Contact]:
+        """子树中的全部联系人，不要求顺序，省去子节点排序"""
+        contacts = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.contacts:
+                contacts.extend(node.contacts.values())
+            if node.children:
+                stack.extend(node.children.values())
+        return contacts
+    
+    def count_prefix(self, prefix: str) -> int:
+        """统计前缀下的联系人数，O(m)"""
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return 0
+        return node.count
+    
+    def iter_fuzzy(self, query: str, max_edits: int) -> Iterator[Tuple[int, str, Contact]]:
+        """沿树深度优先遍历，为每个节点维护一行编辑距离
+        
+        子节点的行由父节点的行逐字符推出；一行的最小值超过上限时
+        整棵子树都不可能匹配，直接剪枝，代价只与实际探索到的节点数相关。
+        """
+        stack = [("", self.root, list(range(len(query) + 1)))]
+        while stack:
+            key, node, row = stack.pop()
+            if row[-1] <= max_edits:
+                for contact in node.contacts.values():
+                    yield row[-1], key, contact
+            for char, child in node.children.items():
+                edge = self._child_key("", char, child)
+                child_row = row
+                for c in edge:
+                    child_row = _edit_row(child_row, query, c)
+                    if min(child_row) > max_edits:
+                        break
+                else:
+                    stack.append((key + edge, child, child_row))
+    
+    def bulk_insert(self, groups: Iterable[Tuple[str, Iterable[Contact]]]):
+        """按键有序的 (键, 联系人序列) 批量插入
+        
+        相邻键共享的前缀路径直接复用，不再从根重走；同键联系人一次挂入。
+        子树计数先记在路径各层的待累加量上，路径回退时自底向上一次性合并。
+        """
+        path = [self.root]
+        pending = [0]
+        prev_key = ""
+        for key, contacts in groups:
+            # 与上一个键的公共前缀长度
+            common = 0
+            limit = min(len(key), len(prev_key))
+            while common < limit and key[common] == prev_key[common]:
+                common += 1
+            self._flush_path(path, pending, common)
             
-            char = key[idx]
-            if char not in node.children:
-                return False
+            node = path[-1]
+            for char in key[common:]:
+                child = node.children.get(char)
+                if child is None:
+                    if node.children is _EMPTY:
+                        node.children = {}
+                    child = node.children[char] = TrieNode()
+                node = child
+                path.append(node)
+                pending.append(0)
             
-            should_delete = _remove(node.children[char], key, idx + 1)
-            if should_delete:
-                del node.children[char]
-                return len(node.contacts) == 0 and len(node.children) == 0
-            return False
+            if node.contacts is _EMPTY:
+                node.contacts = {}
+            before = len(node.contacts)
+            node.contacts.update((contact.id, contact) for contact in contacts)
+            node.seek = None
+            pending[-1] += len(node.contacts) - before
+            if not node.contacts:
+                node.contacts = _EMPTY
+            prev_key = key
+        self._flush_path(path, pending, 0)
+        self.root.count += pending[0]
+    
+    @staticmethod
+    def _flush_path(path: List[TrieNode], pending: List[int], depth: int):
+        """把深于depth的路径节点的待累加计数合并进节点并上推给父节点"""
+        while len(path) > depth + 1:
+            node = path.pop()
+            added = pending.pop()
+            node.count += added
+            pending[-1] += added
+    
+    def iter_prefix(self, prefix: str, cursor: Optional[Cursor] = None,
+                    skip: int = 0) -> Iterator[Tuple[str, int, Contact]]:
+        """按前缀惰性遍历，产出 (键, 联系人编号, 联系人)
         
-        _remove(self.root, key, 0)
+        子节点按字符排序后以显式栈深度优先遍历，不使用递归；
+        结果按键的字典序排列，传入cursor时从该位置之后继续。
+        skip条结果借助子树计数整棵跳过，无需逐条遍历。
+        """
+        _check_cursor(prefix, cursor)
+        return self._drain(self._seek(prefix, cursor), skip)
     
-    def search_prefix(self, prefix: str) -> List[Contact]:
-        """按前缀查询"""
+    def _seek(self, prefix: str, cursor: Optional[Cursor]) -> List[Tuple[str, TrieNode, int]]:
+        """定位遍历起点，返回初始栈，栈元素为 (键, 节点, 该键上已返回的最后编号，0表示从头)"""
         node = self.root
         for char in prefix:
-            if char not in node.children:
+            node = node.children.get(char)
+            if node is None:
                 return []
-            node = node.children[char]
         
-        # 收集该前缀下所有联系人
-        contacts = []
-        def dfs(n: TrieNode):
-            contacts.extend(n.contacts)
-            for child in n.children.values():
-                dfs(child)
+        if cursor is None:
+            return [(prefix, node, 0)]
         
-        dfs(node)
-        return contacts
+        # 沿游标键下行，把每层中排在路径之后的兄弟子树压栈
+        stack = []
+        cursor_key, cursor_id = cursor
+        key = prefix
+        for char in cursor_key[len(prefix):]:
+            for c in sorted(node.children, reverse=True):
+                if c <= char:
+                    break
+                stack.append((key + c, node.children[c], 0))
+            node = node.children.get(char)
+            if node is None:
+                return stack
+            key += char
+        stack.append((key, node, cursor_id))
+        return stack
+    
+    @staticmethod
+    def _child_key(key: str, char: str, child: TrieNode) -> str:
+        """子节点对应的完整键"""
+        return key + char
+    
+    def _drain(self, stack: List[Tuple[str, TrieNode, int]], skip: int) -> Iterator[Tuple[str, int, Contact]]:
+        """按栈做非递归深度优先遍历，子节点按字符排序"""
+        child_key = self._child_key
+        while stack:
+            key, node, last_id = stack.pop()
+            values = _contacts_after(node, last_id) if node.contacts else ()
+            if skip:
+                if not last_id and node.count <= skip:
+                    skip -= node.count
+                    continue
+                if not last_id and len(node.contacts) <= skip:
+                    skip -= len(node.contacts)
+                    values = ()
+                elif values:
+                    values = iter(values)
+                    skip -= sum(1 for _ in islice(values, skip))
+            for contact in values:
+                yield key, contact.id, contact
+            children = node.children
+            if children:
+                for c in sorted(children, reverse=True):
+                    child = children[c]
+                    stack.append((child_key(key, c, child), child, 0))
+
+
+class RadixNode(TrieNode):
+    """压缩Trie树节点，label为从父节点到本节点的整段边标签"""
+    __slots__ = ("label",)
+    
+    def __init__(self, label: str = ""):
+        super().__init__()
+        self.label = label
+
+
+class RadixTrie(Trie):
+    """路径压缩（Patricia/Radix）Trie树
+    
+    单分支链合并为一条带字符串标签的边，children仍以边的首字符为键。
+    插入、删除、前缀查询、计数与分页的语义与Trie完全一致。
+    """
+    backend = "radix"
+    
+    def __init__(self):
+        self.root = RadixNode()
+    
+    def insert(self, key: str, contact: Contact):
+        """插入键值，必要时拆分边"""
+        node = self.root
+        path = [node]
+        i = 0
+        while i < len(key):
+            child = node.children.get(key[i])
+            if child is None:
+                if node.children is _EMPTY:
+                    node.children = {}
+                child = node.children[key[i]] = RadixNode(key[i:])
+                node = child
+                path.append(node)
+                break
+            
+            label = child.label
+            common = 0
+            limit = min(len(label), len(key) - i)
+            while common < limit and label[common] == key[i + common]:
+                common += 1
+            
+            if common < len(label):
+                # 在公共前缀处拆分边
+                mid = RadixNode(label[:common])
+                child.label = label[common:]
+                mid.children = {child.label[0]: child}
+                mid.count = child.count
+                node.children[key[i]] = mid
+                child = mid
+            node = child
+            path.append(node)
+            i += common
+        _add_to_node(node, path, contact)
+    
+    def remove(self, key: str, contact: Contact):
+        """删除键值，剪除空节点并合并单分支节点"""
+        node = self.root
+        path = [node]
+        i = 0
+        while i < len(key):
+            node = node.children.get(key[i])
+            if node is None or not key.startswith(node.label, i):
+                return
+            path.append(node)
+            i += len(node.label)
+        if not _remove_from_node(node, path, contact):
+            return
+        
+        if node.count == 0 and node is not self.root:
+            _drop_child(path[-2], node.label[0])
+            node = path[-2]
+        self._merge_single_child(node)
+    
+    def detach_prefix(self, prefix: str) -> List[Contact]:
+        """把覆盖前缀的子树整棵摘下，返回其中的联系人；前缀止于边的中间时摘下该边的子节点"""
+        node = self.root
+        path = [node]
+        key = ""
+        while len(key) < len(prefix):
+            child = node.children.get(prefix[len(key)])
+            if child is None:
+                return []
+            rest = prefix[len(key):]
+            if not rest.startswith(child.label) and not child.label.startswith(rest):
+                return []
+            node = child
+            path.append(node)
+            key += child.label
+        removed = self._collect(node)
+        if node is self.root:
+            self.root = RadixNode()
+            return removed
+        for n in path[:-1]:
+            n.count -= len(removed)
+        _drop_child(path[-2], node.label[0])
+        self._merge_single_child(path[-2])
+        return removed
+    
+    def _merge_single_child(self, node: RadixNode):
+        """非根节点没有联系人且只剩一个子节点时，与子节点合并为一条边"""
+        if node is not self.root and not node.contacts and len(node.children) == 1:
+            (child,) = node.children.values()
+            node.label += child.label
+            node.children = child.children
+            node.contacts = child.contacts
+            node.seek = child.seek
+    
+    def bulk_insert(self, groups: Iterable[Tuple[str, Iterable[Contact]]]):
+        """按键有序批量插入；边的拆分依赖完整路径，逐条插入即可"""
+        for key, contacts in groups:
+            for contact in contacts:
+                self.insert(key, contact)
+    
+    def _locate(self, prefix: str) -> Tuple[Optional[RadixNode], str]:
+        """找到覆盖前缀的节点，返回 (节点, 节点完整键)；前缀可能止于边的中间"""
+        node = self.root
+        key = ""
+        while len(key) < len(prefix):
+            child = node.children.get(prefix[len(key)])
+            if child is None:
+                return None, ""
+            rest = prefix[len(key):]
+            if not rest.startswith(child.label) and not child.label.startswith(rest):
+                return None, ""
+            node = child
+            key += child.label
+        return node, key
+    
+    def count_prefix(self, prefix: str) -> int:
+        """统计前缀下的联系人数"""
+        node, _ = self._locate(prefix)
+        return node.count if node is not None else 0
+    
+    def _seek(self, prefix: str, cursor: Optional[Cursor]) -> List[Tuple[str, TrieNode, int]]:
+        """定位遍历起点，返回初始栈"""
+        node, key = self._locate(prefix)
+        if node is None:
+            return []
+        if cursor is None:
+            return [(key, node, 0)]
+        
+        stack = []
+        cursor_key, cursor_id = cursor
+        if not cursor_key.startswith(key):
+            # 前缀止于边的中间，游标位于整棵子树之前或之后
+            if key > cursor_key:
+                stack.append((key, node, 0))
+            return stack
+        
+        while len(key) < len(cursor_key):
+            rest = cursor_key[len(key):]
+            char = rest[0]
+            for c in sorted(node.children, reverse=True):
+                if c <= char:
+                    break
+                child = node.children[c]
+                stack.append((key + child.label, child, 0))
+            child = node.children.get(char)
+            if child is None:
+                return stack
+            if not rest.startswith(child.label):
+                # 游标键落在边的中间或与边分叉
+                if child.label > rest:
+                    stack.append((key + child.label, child, 0))
+                return stack
+            node = child
+            key += child.label
+        stack.append((key, node, cursor_id))
+        return stack
+    
+    @staticmethod
+    def _child_key(key: str, char: str, child: TrieNode) -> str:
+        """子节点对应的完整键"""
+        return key + child.label
+
+
+class SortedArrayIndex(IndexBackend):
+    """有序数组索引：键与联系人存于两个按键排序的平行列表
+    
+    前缀范围由两次二分确定，遍历是连续的下标区间，计数O(log n)；
+    插入与删除需移动数组元素，为O(n)。适合读多写少的大数据量场景。
+    """
+    backend = "sorted"
+    REMOVE_MANY_MIN = 16  # 批量移除不超过该条数时逐条删除
+    
+    def __init__(self):
+        self.keys: List[str] = []
+        self.contacts: List[Contact] = []
+    
+    def _group(self, key: str) -> Tuple[int, int]:
+        """键在数组中的下标区间 [lo, hi)"""
+        lo = bisect_left(self.keys, key)
+        return lo, bisect_right(self.keys, key, lo)
+    
+    def _prefix_range(self, prefix: str) -> Tuple[int, int]:
+        """前缀匹配的下标区间 [start, end)
+        
+        以前缀末字符加一得到的串为上界：以prefix开头的键都小于它，其余不小于它的键都不匹配。
+        """
+        keys = self.keys
+        if not prefix:
+            return 0, len(keys)
+        start = bisect_left(keys, prefix)
+        last = ord(prefix[-1])
+        if last < sys.maxunicode:
+            return start, bisect_left(keys, prefix[:-1] + chr(last + 1), start)
+        n = len(prefix)
+        return start, bisect_right(keys, prefix, start, key=lambda k: k[:n])
+    
+    def insert(self, key: str, contact: Contact):
+        """插入到同键区间末尾，保持同键内的插入顺序"""
+        lo, hi = self._group(key)
+        contacts = self.contacts
+        if any(contacts[i].id == contact.id for i in range(lo, hi)):
+            return
+        self.keys.insert(hi, key)
+        self.contacts.insert(hi, contact)
+    
+    def remove(self, key: str, contact: Contact):
+        """在同键区间内定位并删除"""
+        lo, hi = self._group(key)
+        for i in range(lo, hi):
+            if self.contacts[i].id == contact.id:
+                del self.keys[i]
+                del self.contacts[i]
+                return
+    
+    def count_prefix(self, prefix: str) -> int:
+        """前缀匹配数，O(m log n)"""
+        start, end = self._prefix_range(prefix)
+        return end - start
+    
+    def remove_many(self, entries: List[Tuple[str, Contact]]):
+        """条目较多时按编号一趟过滤重建数组，O(n)，而不是每条都移动一次数组"""
+        if len(entries) <= self.REMOVE_MANY_MIN:
+            super().remove_many(entries)
+            return
+        ids = {contact.id for _, contact in entries}
+        kept = [i for i, contact in enumerate(self.contacts) if contact.id not in ids]
+        self.keys = [self.keys[i] for i in kept]
+        self.contacts = [self.contacts[i] for i in kept]
+    
+    def detach_prefix(self, prefix: str) -> List[Contact]:
+        """前缀匹配的是一段连续下标，整段切除，数组元素只移动一次"""
+        start, end = self._prefix_range(prefix)
+        removed = self.contacts[start:end]
+        del self.keys[start:end]
+        del self.contacts[start:end]
+        return removed
+    
+    def bulk_insert(self, groups: Iterable[Tuple[str, Iterable[Contact]]]):
+        """空索引直接顺序追加；已有数据时合并后做一次稳定排序，已有联系人排在同键新联系人之前"""
+        seen = {contact.id for contact in self.contacts}
+        keys: List[str] = []
+        contacts: List[Contact] = []
+        for key, group in groups:
+            for contact in group:
+                if contact.id not in seen:
+                    seen.add(contact.id)
+                    keys.append(key)
+                    contacts.append(contact)
+        if not self.keys:
+            self.keys, self.contacts = keys, contacts
+            return
+        merged = sorted(zip(self.keys + keys, self.contacts + contacts), key=itemgetter(0))
+        self.keys = [key for key, _ in merged]
+        self.contacts = [contact for _, contact in merged]
+    
+    def iter_fuzzy(self, query: str, max_edits: int) -> Iterator[Tuple[int, str, Contact]]:
+        """在数组上模拟Trie树的深度优先遍历，剪枝方式与Trie.iter_fuzzy相同
+        
+        共享某个前缀的键占据一段连续下标，恰好等于该前缀的排在最前，
+        按下一个字符二分即可切出各子区间；代价与探索到的前缀数成正比（各乘log n），
+        而不是逐键计算距离。
+        """
+        keys, contacts = self.keys, self.contacts
+        if not keys:
+            return
+        stack = [(0, len(keys), 0, list(range(len(query) + 1)))]
+        while stack:
+            lo, hi, depth, row = stack.pop()
+            prefix = keys[lo][:depth]
+            start = bisect_right(keys, prefix, lo, hi)
+            if row[-1] <= max_edits:
+                for i in range(lo, start):
+                    yield row[-1], keys[i], contacts[i]
+            while start < hi:
+                char = keys[start][depth]
+                code = ord(char)
+                end = hi if code == sys.maxunicode else bisect_left(keys, prefix + chr(code + 1), start, hi)
+                child_row = _edit_row(row, query, char)
+                if min(child_row) <= max_edits:
+                    stack.append((start, end, depth + 1, child_row))
+                start = end
+    
+    def iter_prefix(self, prefix: str, cursor: Optional[Cursor] = None,
+                    skip: int = 0) -> Iterator[Tuple[str, int, Contact]]:
+        """按前缀遍历下标区间；游标与skip都只是移动区间起点"""
+        _check_cursor(prefix, cursor)
+        start, end = self._prefix_range(prefix)
+        if cursor is not None:
+            lo = bisect_left(self.keys, cursor[0], start, end)
+            hi = bisect_right(self.keys, cursor[0], lo, end)
+            start = _first_after(self.contacts, cursor[1], lo, hi)
+        return self._iter_range(start + skip, end)
+    
+    def _iter_range(self, start: int, end: int) -> Iterator[Tuple[str, int, Contact]]:
+        """产出下标区间内的条目"""
+        keys, contacts = self.keys, self.contacts
+        for i in range(start, end):
+            contact = contacts[i]
+            yield keys[i], contact.id, contact
+
+
+class ScanIndex(IndexBackend):
+    """扫描索引：只登记 (键, 联系人)，查询时逐条过滤再排序
+    
+    写入O(1)、几乎不占额外内存，查询O(n log n)。适合数据量很小的场景。
+    """
+    backend = "scan"
+    
+    def __init__(self):
+        self.entries: Dict[int, Tuple[str, Contact]] = {}  # 联系人编号 -> (键, 联系人)
+    
+    def insert(self, key: str, contact: Contact):
+        self.entries.setdefault(contact.id, (key, contact))
+    
+    def remove(self, key: str, contact: Contact):
+        entry = self.entries.get(contact.id)
+        if entry is not None and entry[0] == key:
+            del self.entries[contact.id]
+    
+    def count_prefix(self, prefix: str) -> int:
+        return sum(1 for key, _ in self.entries.values() if key.startswith(prefix))
+    
+    def detach_prefix(self, prefix: str) -> List[Contact]:
+        removed = [contact for key, contact in self.entries.values() if key.startswith(prefix)]
+        for contact in removed:
+            del self.entries[contact.id]
+        return removed
+    
+    def iter_prefix(self, prefix: str, cursor: Optional[Cursor] = None,
+                    skip: int = 0) -> Iterator[Tuple[str, int, Contact]]:
+        """过滤出匹配项并按键稳定排序，同键内保持插入顺序"""
+        _check_cursor(prefix, cursor)
+        matches = sorted((entry for entry in self.entries.values() if entry[0].startswith(prefix)),
+                         key=itemgetter(0))
+        groups = [(key, [contact for _, contact in group])
+                  for key, group in groupby(matches, key=itemgetter(0))]
+        return islice(_iter_groups(groups, cursor), skip, None)
+
+
+class AdaptiveIndex(IndexBackend):
+    """按数据量与读写比例自动选择后端的索引
+    
+    统计最近一个窗口内的读（查询、计数）与写（插入、删除）次数，
+    窗口结束时重新评估：数据很少时用扫描，读多写少时用有序数组，
+    写入频繁时用Trie树。切换时把全部条目按序批量导入新后端。
+    """
+    SCAN_LIMIT = 64  # 不超过该条数时使用扫描后端
+    WINDOW = 1024  # 每隔多少次读写重新评估一次
+    # 有序数组每次写入平均移动约 size/2 个元素，而每次读比Trie省下的时间
+    # 约相当于移动这么多个元素；读省下的总量超过写多付出的总量时选有序数组
+    SORTED_BUDGET = 25000
+    
+    def __init__(self):
+        self.current: IndexBackend = ScanIndex()
+        self.reads = 0
+        self.writes = 0
+        self.switches = 0  # 已切换后端的次数
+        # 查询在通讯录的共享读锁下并发执行，计数与切换后端由这把互斥锁保护
+        self._lock = threading.Lock()
+        self._migrating = False
+    
+    @property
+    def backend(self) -> str:
+        return f"auto:{self.current.backend}"
+    
+    @classmethod
+    def choose(cls, size: int, reads: int, writes: int, current: str = "") -> str:
+        """根据数据量和读写次数给出合适的后端名称
+        
+        切换到有序数组的门槛是留在有序数组的一半，避免在临界负载下来回切换。
+        """
+        if size <= cls.SCAN_LIMIT:
+            return "scan"
+        moved = writes * size  # 有序数组写入需移动的元素总量（量级）
+        budget = reads * cls.SORTED_BUDGET
+        if current == "sorted":
+            return "sorted" if moved <= budget else "trie"
+        return "sorted" if moved * 2 <= budget else "trie"
+    
+    def _tick(self, reads: int = 0, writes: int = 0):
+        """累计操作数，窗口结束或扫描后端超出容量时重新评估"""
+        with self._lock:
+            self.reads += reads
+            self.writes += writes
+            if not (self.reads + self.writes >= self.WINDOW
+                    or (self.current.backend == "scan" and self.writes
+                        and len(self.current) > self.SCAN_LIMIT)):
+                return
+        self.rebalance()
+    
+    def rebalance(self):
+        """按当前窗口的统计重新选择后端，并开始新的窗口
+        
+        同一时刻只有一个线程迁移，其余线程照常使用旧后端而不等待；
+        迁移只读旧后端，建好后整体替换引用，进行中的遍历不受影响。
+        调用方持有通讯录的读锁或写锁，迁移期间旧后端不会被修改。
+        """
+        with self._lock:
+            if self._migrating:
+                return
+            source = self.current
+            choice = self.choose(len(source), self.reads, self.writes, source.backend)
+            self.reads = self.writes = 0
+            if choice == source.backend:
+                return
+            self._migrating = True
+        try:
+            # 迁移会新建大量存活对象，与bulk_load一样暂停循环垃圾回收
+            target = _BACKENDS[choice]()
+            entries = source.iter_prefix("")
+            gc_was_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                target.bulk_insert((key, [contact for _, _, contact in group])
+                                   for key, group in groupby(entries, key=itemgetter(0)))
+            finally:
+                if gc_was_enabled:
+                    gc.enable()
+            with self._lock:
+                self.current = target
+                self.switches += 1
+        finally:
+            with self._lock:
+                self._migrating = False
+    
+    def insert(self, key: str, contact: Contact):
+        self.current.insert(key, contact)
+        self._tick(writes=1)
+    
+    def remove(self, key: str, contact: Contact):
+        self.current.remove(key, contact)
+        self._tick(writes=1)
+    
+    def count_prefix(self, prefix: str) -> int:
+        result = self.current.count_prefix(prefix)
+        self._tick(reads=1)
+        return result
+    
+    def remove_many(self, entries: List[Tuple[str, Contact]]):
+        self.current.remove_many(entries)
+        self._tick(writes=1)
+    
+    def detach_prefix(self, prefix: str) -> List[Contact]:
+        removed = self.current.detach_prefix(prefix)
+        self._tick(writes=1)
+        return removed
+    
+    def iter_prefix(self, prefix: str, cursor: Optional[Cursor] = None,
+                    skip: int = 0) -> Iterator[Tuple[str, int, Contact]]:
+        # 先取得当前后端的遍历器再评估，切换后端不影响进行中的遍历
+        entries = self.current.iter_prefix(prefix, cursor, skip)
+        self._tick(reads=1)
+        return entries
+    
+    def iter_fuzzy(self, query: str, max_edits: int) -> Iterator[Tuple[int, str, Contact]]:
+        entries = self.current.iter_fuzzy(query, max_edits)
+        self._tick(reads=1)
+        return entries
+    
+    def bulk_insert(self, groups: Iterable[Tuple[str, Iterable[Contact]]]):
+        """批量导入后立即按新的数据量评估；索引为空时先按导入量选好后端，省去一次迁移"""
+        if not len(self.current):
+            groups = [(key, list(contacts)) for key, contacts in groups]
+            size = sum(len(contacts) for _, contacts in groups)
+            choice = self.choose(size, self.reads, self.writes, self.current.backend)
+            if choice != self.current.backend:
+                self.current = _BACKENDS[choice]()
+        self.current.bulk_insert(groups)
+        self.rebalance()
+    
+    def __len__(self) -> int:
+        return len(self.current)
+
+
+_BACKENDS = {"trie": Trie, "sorted": SortedArrayIndex, "scan": ScanIndex}
+
+
+class NGramIndex:
+    """n元组倒排索引，用于子串查询
+    
+    文本按空白切分为词，词的每个长度为n的连续片段（n元组）对应一个倒排表，
+    记录包含该片段的联系人；短于n的词整体作为一个片段登记。查询词不含空白，
+    因此只会落在某一个词内部。查询时取各查询词的n元组倒排表，
+    从最短的开始求交，候选结果再用原文核对，排除片段不相邻造成的误报。
+    """
+    
+    def __init__(self, n: int):
+        if n < 1:
+            raise ValueError("n 必须为正整数")
+        self.n = n
+        self.postings: Dict[str, Dict[int, Contact]] = {}  # 片段 -> {联系人编号: 联系人}
+    
+    def grams(self, text: str) -> set:
+        """文本的全部n元组（去重）；先按空白切分为词，n元组不跨词"""
+        n = self.n
+        grams = set()
+        for token in text.split():
+            if len(token) <= n:
+                grams.add(token)
+            else:
+                grams.update(token[i:i + n] for i in range(len(token) - n + 1))
+        return grams
+    
+    def insert(self, text: str, contact: Contact):
+        postings = self.postings
+        for gram in self.grams(text):
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = {}
+            posting[contact.id] = contact
+    
+    def remove(self, text: str, contact: Contact):
+        postings = self.postings
+        for gram in self.grams(text):
+            posting = postings.get(gram)
+            if posting is not None and posting.pop(contact.id, None) is not None and not posting:
+                del postings[gram]
+    
+    def remove_many(self, entries: List[Tuple[str, Contact]]):
+        for text, contact in entries:
+            self.remove(text, contact)
+    
+    def bulk_insert(self, groups: Iterable[Tuple[str, Iterable[Contact]]]):
+        for text, contacts in groups:
+            for contact in contacts:
+                self.insert(text, contact)
+    
+    def __len__(self) -> int:
+        return len(self.postings)
+    
+    def search(self, terms: Iterable[str], text_of: Callable[[Contact], str],
+               limit: Optional[int] = None) -> List[Contact]:
+        """返回文本同时包含全部查询词的联系人（AND），按联系人编号即添加顺序排列
+        
+        不短于n的词贡献其各n元组的倒排表；短于n的词把包含它的所有片段的倒排表合并成一张。
+        所有倒排表按长度从小到大求交。只有长于n的词可能因片段不相邻而误报，
+        对这些词用text_of给出的原文核对。
+        """
+        terms = [term for term in terms if term]
+        if not terms or limit == 0:
+            return []
+        lists: Dict[int, Mapping[int, Contact]] = {}
+        merged_lists = set()  # 合并出的倒排表不再按编号有序
+        for term in terms:
+            if len(term) >= self.n:
+                for gram in self.grams(term):
+                    posting = self.postings.get(gram)
+                    if posting is None:
+                        return []
+                    lists[id(posting)] = posting
+            else:
+                merged: Dict[int, Contact] = {}
+                for gram, posting in self.postings.items():
+                    if term in gram:
+                        merged.update(posting)
+                if not merged:
+                    return []
+                lists[id(merged)] = merged
+                merged_lists.add(id(merged))
+        
+        first, *rest = sorted(lists.values(), key=len)
+        unverified = [term for term in terms if len(term) > self.n]
+        if limit is not None:
+            # 倒排表按插入顺序保存，而联系人编号单调递增，故最短表本身已按编号有序：
+            # 顺序逐个检查，凑够limit条即停止，不必求出完整交集
+            results = []
+            entries = sorted(first.items()) if id(first) in merged_lists else first.items()
+            for contact_id, contact in entries:
+                if (all(contact_id in posting for posting in rest)
+                        and all(term in text_of(contact) for term in unverified)):
+                    results.append(contact)
+                    if len(results) == limit:
+                        break
+            return results
+        
+        candidates = first.keys()
+        for posting in rest:
+            # 键视图求交在C层完成，且总是以当前较小的集合为外层
+            candidates = candidates & posting.keys()
+            if not candidates:
+                return []
+        return [first[contact_id] for contact_id in sorted(candidates)
+                if all(term in text_of(first[contact_id]) for term in unverified)]
+
+
+class RWLock:
+    """读写锁：多个读者可同时持有，写者独占
+    
+    有写者等待时新来的读者让行，避免写者饥饿。同一线程可重入：
+    持有写锁时可再取读锁或写锁，持有读锁时可再取读锁；持读锁时取写锁（升级）会死锁，直接报错。
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0  # 持有读锁的线程数
+        self._waiting_writers = 0
+        self._writer: Optional[int] = None  # 持有写锁的线程标识
+        self._write_depth = 0
+        self._local = threading.local()  # 本线程的读锁重入深度
+    
+    def acquire_read(self):
+        if self._writer == threading.get_ident():
+            return
+        local = self._local
+        depth = getattr(local, "depth", 0)
+        if not depth:
+            with self._cond:
+                while self._writer is not None or self._waiting_writers:
+                    self._cond.wait()
+                self._readers += 1
+        local.depth = depth + 1
+    
+    def release_read(self):
+        if self._writer == threading.get_ident():
+            return
+        local = self._local
+        local.depth -= 1
+        if not local.depth:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+    
+    def acquire_write(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            self._write_depth += 1
+            return
+        if getattr(self._local, "depth", 0):
+            raise RuntimeError("持有读锁时不能获取写锁")
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+    
+    def release_write(self):
+        self._write_depth -= 1
+        if not self._write_depth:
+            with self._cond:
+                self._writer = None
+                self._cond.notify_all()
+
+
+def _guarded(method: Callable, acquire: Callable, release: Callable) -> Callable:
+    """把方法包装为在持有锁期间执行"""
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        acquire()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            release()
+    return wrapper
+
+
+class PrefixCache:
+    """前缀查询结果的LRU缓存
+    
+    缓存键为 (字段, 前缀, limit, offset, cursor)，值为本页结果与下一页游标。
+    另按 (字段, 前缀) 登记缓存键，键K增删时只需逐一取K的各个前缀，
+    精确淘汰可能受影响的条目，其余缓存保持有效。
+    容量可按条目数和/或字节数（结果列表本身的大小，联系人对象共享不计）限制。
+    命中也会调整LRU顺序，因此各操作在内部互斥锁下进行，可供并发查询共用。
+    """
+    
+    def __init__(self, max_entries: int, max_bytes: Optional[int] = None):
+        if max_entries < 1:
+            raise ValueError("max_entries 必须为正整数")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[tuple, Tuple[Tuple[Contact, ...], Optional[Cursor], int]]" = OrderedDict()
+        self.by_prefix: Dict[Tuple[str, str], set] = {}  # (字段, 前缀) -> 缓存键集合
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # 因容量不足淘汰的条目数
+        self.invalidations = 0  # 因数据变更淘汰的条目数
+        self._lock = threading.Lock()
+    
+    def get(self, key: tuple) -> Optional[Tuple[List[Contact], Optional[Cursor]]]:
+        """命中时返回 (结果副本, 下一页游标) 并标记为最近使用"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return list(entry[0]), entry[1]
+    
+    def put(self, key: tuple, results: List[Contact], cursor: Optional[Cursor]):
+        """存入一页结果；单条超过字节上限时不缓存"""
+        stored = tuple(results)
+        size = sys.getsizeof(stored)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (stored, cursor, size)
+            self.bytes += size
+            self.by_prefix.setdefault(key[:2], set()).add(key)
+            while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+    
+    def invalidate(self, field: str, key: str):
+        """键key增删后，淘汰该字段上所有以key的前缀为查询前缀的条目"""
+        if not self.entries:
+            return
+        with self._lock:
+            for i in range(1, len(key) + 1):
+                keys = self.by_prefix.get((field, key[:i]))
+                if keys:
+                    for cache_key in list(keys):
+                        self._drop(cache_key)
+                        self.invalidations += 1
+    
+    def clear(self):
+        """清空缓存，保留计数"""
+        with self._lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.by_prefix.clear()
+            self.bytes = 0
+    
+    def _drop(self, key: tuple):
+        """移除一个条目并同步前缀登记"""
+        _, _, size = self.entries.pop(key)
+        self.bytes -= size
+        keys = self.by_prefix[key[:2]]
+        keys.discard(key)
+        if not keys:
+            del self.by_prefix[key[:2]]
+
+
+def _take_page(entries: Iterable[Tuple[str, int, Contact]], limit: Optional[int],
+               offset: int = 0) -> Tuple[List[Contact], Optional[Cursor]]:
+    """从 (键, 联系人编号, 联系人) 流中截取一页，并给出下一页游标"""
+    if limit is not None and limit < 0:
+        raise ValueError("limit 不能为负数")
+    if offset < 0:
+        raise ValueError("offset 不能为负数")
+    
+    if limit == 0:
+        return [], None
+    
+    entries = iter(entries)
+    if offset:
+        next(islice(entries, offset - 1, offset), None)
+    
+    results = []
+    last = None
+    for key, contact_id, contact in entries:
+        if limit is not None and len(results) == limit:
+            # 还有下一条，说明存在下一页
+            return results, last
+        results.append(contact)
+        last = (key, contact_id)
+    return results, None
+
+
+def _encode_cursor(order: str, cursor: Cursor) -> str:
+    """把排序方式与内部游标编码为不透明的URL安全字符串"""
+    raw = json.dumps([order, cursor[0], cursor[1]], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip("=")
+
+
+def _decode_cursor(order: str, token: str) -> Cursor:
+    """解码 _encode_cursor 生成的游标，并校验其排序方式"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        cursor_order, key, contact_id = json.loads(raw)
+        if not isinstance(key, str) or not isinstance(contact_id, int):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise ValueError(f"无效的游标：'{token}'") from None
+    if cursor_order != order:
+        raise ValueError(f"游标属于按 {cursor_order} 排序的列表，不能用于按 {order} 排序")
+    return key, contact_id
+
+
+def _iter_groups(groups: Iterable[Tuple[str, List[Contact]]],
+                 cursor: Optional[Cursor] = None) -> Iterator[Tuple[str, int, Contact]]:
+    """把按键排序的 (键, 按编号递增的联系人列表) 序列展开为分页流，供无索引的回退路径使用"""
+    for key, contacts in groups:
+        start = 0
+        if cursor is not None:
+            if key < cursor[0]:
+                continue
+            if key == cursor[0]:
+                start = _first_after(contacts, cursor[1])
+        for i in range(start, len(contacts)):
+            contact = contacts[i]
+            yield key, contact.id, contact
+
+
+class MappedSnapshot:
+    """内存映射的只读二进制快照
+    
+    文件布局（小端）：
+        头部    magic、版本、记录数、唯一姓名数，以及各段的起始偏移
+        字符串段 每条记录依次存放 姓名/电话/备注，各为 u32长度 + UTF-8字节
+        行偏移表 每条记录在字符串段中的起始偏移（u64），按插入顺序
+        电话序表 按电话排序的行号（u32）
+        姓名序表 按 (姓名, 行号) 排序的行号（u32）
+    前缀查询在排序表上二分查找，只为结果中的行解码字符串、创建Contact对象。
+    UTF-8字节序与字符串的码点序一致，结果顺序与Trie树相同。
+    打开时预留与行数相同的一段联系人编号，第row行的编号固定为 first_id + row，
+    同一条记录多次解码得到的Contact编号相同，导入内存（_materialize）后也不变。
+    """
+    MAGIC = b"CTSNAP01"
+    VERSION = 1
+    HEADER = struct.Struct("<8sIIIIQQQQ")
+    OFFSET = struct.Struct("<Q")
+    ROW = struct.Struct("<I")
+    LENGTH = struct.Struct("<I")
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        (magic, version, self.count, self.unique_names, _,
+         self._rows_at, self._phone_at, self._name_at, self._strings_at) = self.HEADER.unpack_from(self._buf, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            self.close()
+            raise ValueError(f"{path} 不是受支持的二进制快照")
+        self.nbytes = len(self._buf)
+        self.first_id = _reserve_ids(self.count)
+    
+    @classmethod
+    def is_snapshot(cls, path: str) -> bool:
+        """按文件头判断是否为二进制快照"""
+        with open(path, 'rb') as f:
+            return f.read(len(cls.MAGIC)) == cls.MAGIC
+    
+    @classmethod
+    def write(cls, path: str, contacts: List[Contact]):
+        """把联系人按插入顺序写成二进制快照"""
+        encoded = [(c.name.encode('utf-8'), c.phone.encode('utf-8'), c.remark.encode('utf-8'))
+                   for c in contacts]
+        count = len(encoded)
+        pack_len = cls.LENGTH.pack
+        
+        with open(path, 'wb') as f:
+            f.write(b"\0" * cls.HEADER.size)
+            strings_at = f.tell()
+            offsets = array('Q')
+            position = 0
+            for fields in encoded:
+                offsets.append(position)
+                for value in fields:
+                    f.write(pack_len(len(value)))
+                    f.write(value)
+                    position += 4 + len(value)
+            
+            phone_order = array('I', sorted(range(count), key=lambda i: encoded[i][1]))
+            name_order = array('I', sorted(range(count), key=lambda i: encoded[i][0]))
+            if sys.byteorder != 'little':
+                for table in (offsets, phone_order, name_order):
+                    table.byteswap()
+            
+            rows_at = f.tell()
+            f.write(offsets.tobytes())
+            phone_at = f.tell()
+            f.write(phone_order.tobytes())
+            name_at = f.tell()
+            f.write(name_order.tobytes())
+            
+            unique_names = len({fields[0] for fields in encoded})
+            f.seek(0)
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, count, unique_names, 0,
+                                    rows_at, phone_at, name_at, strings_at))
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def close(self):
+        """解除映射并关闭文件"""
+        if self._buf is not None:
+            self._buf.close()
+            self._buf = None
+        self._file.close()
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def _field(self, row: int, index: int) -> bytes:
+        """读取第row行的第index个字段（0姓名 1电话 2备注）的原始字节"""
+        buf = self._buf
+        at = self._strings_at + self.OFFSET.unpack_from(buf, self._rows_at + row * 8)[0]
+        for _ in range(index):
+            at += 4 + self.LENGTH.unpack_from(buf, at)[0]
+        length = self.LENGTH.unpack_from(buf, at)[0]
+        return buf[at + 4:at + 4 + length]
+    
+    def row(self, row: int) -> Contact:
+        """解码第row行为Contact"""
+        name, phone, remark = (self._field(row, i).decode('utf-8') for i in range(3))
+        return Contact(name, phone, remark, self.first_id + row)
+    
+    def iter_rows(self) -> Iterator[Contact]:
+        """按插入顺序遍历全部记录"""
+        for row in range(self.count):
+            yield self.row(row)
+    
+    def iter_records(self) -> Iterator[Dict[str, str]]:
+        """按插入顺序产出记录字典，供bulk_load导入"""
+        for row in range(self.count):
+            name, phone, remark = (self._field(row, i).decode('utf-8') for i in range(3))
+            yield {"name": name, "phone": phone, "remark": remark}
+    
+    def _sorted_row(self, field: int, rank: int) -> int:
+        """排序表中第rank位的行号；field为0时用姓名序表，为1时用电话序表"""
+        table_at = self._name_at if field == 0 else self._phone_at
+        return self.ROW.unpack_from(self._buf, table_at + rank * 4)[0]
+    
+    def _bound(self, field: int, key: bytes, prefix: bool, upper: bool) -> int:
+        """在排序表上二分：upper为False时找首个 >= key 的位置，
+        为True时找首个 > key 的位置；prefix为True时只比较前len(key)个字节"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self._field(self._sorted_row(field, mid), field)
+            if prefix:
+                value = value[:len(key)]
+            if value < key or (upper and value == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+    
+    def count_prefix(self, field: int, prefix: str) -> int:
+        """前缀匹配数，O(m log n)"""
+        key = prefix.encode('utf-8')
+        return self._bound(field, key, True, True) - self._bound(field, key, True, False)
+    
+    def iter_prefix(self, field: int, prefix: str, cursor: Optional[Cursor] = None,
+                    skip: int = 0) -> Iterator[Tuple[str, int, Contact]]:
+        """按前缀遍历，产出 (键, 联系人编号, 联系人)，与Trie.iter_prefix语义一致"""
+        key = prefix.encode('utf-8')
+        start = self._bound(field, key, True, False)
+        end = self._bound(field, key, True, True)
+        if cursor is not None:
+            if not cursor[0].startswith(prefix):
+                raise ValueError(f"游标 {cursor!r} 与前缀 '{prefix}' 不匹配")
+            cursor_key = cursor[0].encode('utf-8')
+            lo = self._bound(field, cursor_key, False, False)
+            hi = self._bound(field, cursor_key, False, True)
+            # 同键的行号递增，二分找第一个编号大于游标的行
+            last_row = cursor[1] - self.first_id
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._sorted_row(field, mid) <= last_row:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            start = max(start, lo)
+        return self._iter_ranks(field, start + skip, end)
+    
+    def _iter_ranks(self, field: int, start: int, end: int) -> Iterator[Tuple[str, int, Contact]]:
+        """遍历排序表的 [start, end) 段"""
+        for rank in range(start, end):
+            contact = self.row(self._sorted_row(field, rank))
+            yield contact.name if field == 0 else contact.phone, contact.id, contact
+    
+    def find_row(self, phone: str) -> Optional[int]:
+        """电话所在的行号，在电话序表上二分查找"""
+        key = phone.encode('utf-8')
+        rank = self._bound(1, key, False, False)
+        if rank < self.count:
+            row = self._sorted_row(1, rank)
+            if self._field(row, 1) == key:
+                return row
+        return None
+    
+    def get_by_phone(self, phone: str) -> Optional[Contact]:
+        """按电话精确查找"""
+        row = self.find_row(phone)
+        return self.row(row) if row is not None else None
+
+
+def _is_jsonl(path: str) -> bool:
+    """是否按JSON Lines格式读写"""
+    return path.lower().endswith(".jsonl")
+
+
+def _is_binary(path: str) -> bool:
+    """是否写成二进制快照"""
+    return path.lower().endswith(".snap")
+
+
+def _peek_char(f) -> str:
+    """返回文件中第一个非空白字符，并把读取位置复位到文件开头"""
+    while True:
+        chunk = f.read(64)
+        if not chunk:
+            f.seek(0)
+            return ""
+        stripped = chunk.lstrip("\ufeff \t\r\n")
+        if stripped:
+            f.seek(0)
+            return stripped[0]
+
+
+def _iter_jsonl(f) -> Iterator[Dict]:
+    """逐行解析JSON Lines，跳过空行"""
+    for line_no, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第 {line_no} 行不是合法的JSON：{e}") from e
+
+
+def _write_data_file(path: str, contacts: Callable[[], List[Contact]],
+                     records: Callable[[], Iterable[Dict[str, str]]]) -> Tuple[bool, str]:
+    """按扩展名把数据写入文件：二进制快照需要完整的联系人列表，文本格式逐条写出记录"""
+    tmp_path = path + ".tmp"
+    try:
+        if _is_binary(path):
+            MappedSnapshot.write(tmp_path, contacts())
+            os.replace(tmp_path, path)
+            return True, f"成功：数据已保存到 {path}"
+        
+        # 先写临时文件并落盘，再原子替换，崩溃时不会留下半个快照
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if _is_jsonl(path):
+                for record in records():
+                    f.write(json.dumps(record, ensure_ascii=False))
+                    f.write("\n")
+            else:
+                f.write("[")
+                separator = "\n  "
+                for record in records():
+                    f.write(separator)
+                    f.write(json.dumps(record, ensure_ascii=False))
+                    separator = ",\n  "
+                f.write("\n]\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        
+        return True, f"成功：数据已保存到 {path}"
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False, f"错误：保存失败 - {str(e)}"
+
+
+class Snapshot:
+    """通讯录的时间点只读视图（见 ContactSystem.snapshot）
+    
+    不复制数据，与活动的链表和索引共享联系人对象：创建时取一个联系人编号水位，
+    编号低于水位的联系人才属于快照（编号单调递增，之后添加的都在水位之上）；
+    快照存在期间被删除的联系人先记入系统的墓地再摘链，遍历与查询时按编号补回。
+    因此读快照期间增删可以照常进行，读到的始终是创建时刻的状态。
+    用完应调用 close()（或用 with 语句）释放，墓地中不再被任何快照需要的联系人随即回收。
+    """
+    
+    def __init__(self, system: "ContactSystem", watermark: int, start: int, size: int):
+        self.system = system
+        self.watermark = watermark  # 编号低于此值的联系人属于快照
+        self.start = start  # 快照创建时墓地的绝对位置，此后删除的联系人从这里开始记录
+        self.size = size
+        self.closed = False
+        self._finalizer = weakref.finalize(self, system._release_snapshot, watermark)
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    def __enter__(self) -> "Snapshot":
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def close(self):
+        """释放快照"""
+        self.closed = True
+        self._finalizer()
+    
+    def _check_open(self):
+        if self.closed:
+            raise ValueError("快照已释放")
+    
+    def _buried(self, position: int) -> Tuple[int, List[Contact]]:
+        """墓地中从绝对位置position起新增的、属于快照的联系人，以及新的位置"""
+        base, dead = self.system._graveyard
+        if position < base:
+            raise ValueError("快照已释放")
+        watermark = self.watermark
+        return base + len(dead), [contact for contact in dead[position - base:] if contact.id < watermark]
+    
+    def __iter__(self) -> Iterator[Contact]:
+        """按插入顺序遍历快照中的联系人，可与增删同时进行
+        
+        链表按编号有序。每一步先取下一个节点再查看墓地：删除时先入墓地再摘链，
+        被跳过的节点必然已在墓地中，按编号插回输出序列；已输出过的编号不再重复。
+        """
+        self._check_open()
+        system = self.system
+        watermark = self.watermark
+        pending: List[Tuple[int, Contact]] = []  # 待补回的已删除联系人（按编号的小顶堆）
+        position = self.start
+        last = 0  # 已输出的最大编号
+        node = system.head
+        while node is not None:
+            contact = node.contact
+            base, dead = system._graveyard
+            if base + len(dead) != position:
+                position, buried = self._buried(position)
+                for dead in buried:
+                    if dead.id > last:
+                        heapq.heappush(pending, (dead.id, dead))
+            if contact.id >= watermark:
+                break
+            while pending and pending[0][0] < contact.id:
+                dead_id, dead = heapq.heappop(pending)
+                if dead_id > last:
+                    last = dead_id
+                    yield dead
+            if contact.id > last:
+                last = contact.id
+                yield contact
+            node = node.next
+        
+        position, buried = self._buried(position)
+        for dead in buried:
+            if dead.id > last:
+                heapq.heappush(pending, (dead.id, dead))
+        while pending:
+            dead_id, dead = heapq.heappop(pending)
+            if dead_id > last:
+                last = dead_id
+                yield dead
+    
+    def list_all(self) -> List[Contact]:
+        """列出快照中的所有联系人"""
+        return list(self)
+    
+    def iter_records(self) -> Iterator[Dict[str, str]]:
+        """逐条产出快照中可序列化的联系人记录"""
+        for contact in self:
+            yield {"name": contact.name, "phone": contact.phone, "remark": contact.remark}
+    
+    def save_to_file(self, path: str) -> Tuple[bool, str]:
+        """把快照写入文件，格式规则同 ContactSystem.save_to_file"""
+        self._check_open()
+        return _write_data_file(path, self.list_all, self.iter_records)
+    
+    def find_by_name(self, name_prefix: str, limit: Optional[int] = None) -> List[Contact]:
+        """在快照中按名字前缀查询，结果按名字排序"""
+        return self._find("name_trie", name_prefix, limit)
+    
+    def find_by_phone(self, phone_prefix: str, limit: Optional[int] = None) -> List[Contact]:
+        """在快照中按电话号码前缀查询，结果按号码排序"""
+        return self._find("phone_trie", phone_prefix, limit)
+    
+    def _find(self, attr: str, prefix: str, limit: Optional[int]) -> List[Contact]:
+        self._check_open()
+        if limit is not None and limit < 0:
+            raise ValueError("limit 不能为负数")
+        if not prefix:
+            return []
+        return self.system._snapshot_prefix(self, attr, prefix, limit)
 
 
 class ContactSystem:
     """通讯录系统核心类"""
     
-    def __init__(self, use_index: bool = True, use_phone_index: bool = True):
+    # 可选的前缀索引后端；auto 按数据量与读写比例自动切换
+    INDEX_TYPES = {"trie": Trie, "radix": RadixTrie, "sorted": SortedArrayIndex,
+                   "scan": ScanIndex, "auto": AdaptiveIndex}
+    # 索引构建时机：eager 随增删即时维护；lazy 首次前缀查询时构建；
+    # background 加载数据后由后台线程构建，构建完成前查询回退到扫描
+    INDEX_MODES = ("eager", "lazy", "background")
+    LIST_ORDERS = ("insert", "name", "phone")  # list_page 支持的排序方式
+    # 各前缀索引的属性名与取键函数；拼音全拼与首字母索引使用姓名索引的后端类型
+    INDEX_KEYS: Dict[str, Callable[[Contact], str]] = {
+        "name_trie": lambda contact: contact.name,
+        "phone_trie": lambda contact: contact.phone,
+        "pinyin_trie": lambda contact: to_pinyin(contact.name),
+        "initials_trie": lambda contact: to_initials(contact.name),
+        "phone_grams": lambda contact: contact.phone,
+        "remark_grams": lambda contact: contact.remark.lower(),
+    }
+    # 线程安全模式下取共享读锁与独占写锁的方法；iter_records 返回生成器，不在其列，
+    # 需要边遍历边允许写入时使用 snapshot()
+    READ_METHODS = ("find_by_name", "find_by_name_page", "find_by_phone", "find_by_phone_page",
+                    "count_by_name", "count_by_phone", "find_by_name_fuzzy", "find_by_phone_substring",
+                    "find_by_remark", "find_by_pinyin", "find_by_pinyin_page", "find_by_initials",
+                    "find_by_initials_page", "list_all", "list_page", "build_indexes", "get_stats", "_snapshot_prefix")
+    WRITE_METHODS = ("add_contact", "del_contact", "del_by_name_prefix", "del_by_phone_prefix", "bulk_load", "save_to_file", "load_from_file",
+                     "open_mapped", "sync", "close", "replay_wal", "compact_wal", "snapshot")
+    PHONE_GRAM = 3  # 电话子串索引的n元组长度
+    REMARK_GRAM = 2  # 备注全文索引按字符二元组切分，中文无需分词
+    
+    def __init__(self, use_index: bool = True, use_phone_index: bool = True,
+                 name_index_type: str = "trie", phone_index_type: str = "trie",
+                 compact: bool = False, data_file: str = "contacts.json",
+                 durable: bool = False, fsync_every: int = 1, index_mode: str = "eager",
+                 use_pinyin_index: bool = True, use_phone_ngram_index: bool = False,
+                 use_remark_index: bool = False, cache_entries: int = 256,
+                 cache_bytes: Optional[int] = 32 * 1024 * 1024, thread_safe: bool = False):
         self.head: Optional[Node] = None  # 双向链表头
         self.tail: Optional[Node] = None  # 双向链表尾
         self.size = 0
         
         # 散列表索引
-        self.name_hash: Dict[str, List[Contact]] = {}  # 支持重名
+        self.name_hash: Dict[str, Dict[str, Contact]] = {}  # 支持重名，按电话区分，O(1)删除
         self.phone_hash: Dict[str, Contact] = {}  # 电话号码唯一
+        self.node_map: Dict[str, Node] = {}  # 电话号码 -> 链表节点，O(1)定位
+        # 按插入顺序（即编号递增）排列的节点，供分页游标二分定位；删除时不立即移除，
+        # 已删除的节点超过一半时按链表重建
+        self._order: List[Node] = []
+        self._order_dead = 0
         
-        # Trie树索引（可选）
+        # 前缀索引（可选，后端见 INDEX_TYPES；属性名沿用 name_trie/phone_trie）
+        for index_type in (name_index_type, phone_index_type):
+            if index_type not in self.INDEX_TYPES:
+                raise ValueError(f"未知的索引类型：'{index_type}'，可选 {sorted(self.INDEX_TYPES)}")
         self.use_name_trie = use_index
         self.use_phone_trie = use_phone_index
-        self.name_trie = Trie() if use_index else None
-        self.phone_trie = Trie() if use_phone_index else None
+        self.name_index_type = name_index_type
+        self.phone_index_type = phone_index_type
+        self.use_pinyin_trie = use_pinyin_index
+        self.use_phone_grams = use_phone_ngram_index
+        self.use_remark_grams = use_remark_index
+        self._index_factories: Dict[str, Callable] = {}  # 启用的索引：属性名 -> 创建空索引的函数
+        if use_index:
+            self._index_factories["name_trie"] = self.INDEX_TYPES[name_index_type]
+        if use_phone_index:
+            self._index_factories["phone_trie"] = self.INDEX_TYPES[phone_index_type]
+        if use_pinyin_index:
+            self._index_factories["pinyin_trie"] = self.INDEX_TYPES[name_index_type]
+            self._index_factories["initials_trie"] = self.INDEX_TYPES[name_index_type]
+        if use_phone_ngram_index:
+            self._index_factories["phone_grams"] = lambda: NGramIndex(self.PHONE_GRAM)
+        if use_remark_index:
+            self._index_factories["remark_grams"] = lambda: NGramIndex(self.REMARK_GRAM)
+        self.name_trie: Optional[IndexBackend] = None
+        self.phone_trie: Optional[IndexBackend] = None
+        self.pinyin_trie: Optional[IndexBackend] = None  # 姓名全拼，如 zhangsan
+        self.initials_trie: Optional[IndexBackend] = None  # 姓名拼音首字母，如 zs
+        self.phone_grams: Optional[NGramIndex] = None  # 电话号码的n元组，用于子串查询
+        self.remark_grams: Optional[NGramIndex] = None  # 备注（转小写）的字符二元组，用于全文检索
+        for attr, index in self._new_indexes().items():
+            setattr(self, attr, index)
+        
+        # 索引构建状态：pending 尚未构建，building 构建中，ready 可用
+        if index_mode not in self.INDEX_MODES:
+            raise ValueError(f"未知的索引构建模式：'{index_mode}'，可选 {list(self.INDEX_MODES)}")
+        self.index_mode = index_mode
+        self.index_state = "ready" if index_mode == "eager" else "pending"
+        self.index_build_seconds: Optional[float] = None
+        self._index_lock = threading.Lock()
+        self._index_backlog: List[Tuple[bool, Contact]] = []  # 构建期间的增删：(是否为添加, 联系人)
+        
+        # 姓名/电话前缀查询结果的LRU缓存，cache_entries为0时关闭
+        self.cache: Optional[PrefixCache] = PrefixCache(cache_entries, cache_bytes) if cache_entries else None
+        
+        # 紧凑模式：姓名驻留（sys.intern），重名的联系人共用一份字符串；
+        # 备注大多各不相同，驻留只会多占驻留表，故不处理
+        self.compact = compact
+        
+        self.data_file = data_file  # 扩展名为 .jsonl 时使用JSON Lines格式
+        
+        # 持久模式：增删先追加到预写日志，启动时加载快照后重放日志
+        if fsync_every < 1:
+            raise ValueError("fsync_every 必须为正整数")
+        self.durable = durable
+        self.wal_file = os.path.splitext(data_file)[0] + ".wal"
+        self.fsync_every = fsync_every  # 每写入多少条日志执行一次fsync
+        self._wal = None
+        self._wal_unsynced = 0
+        self._replaying = False
+        
+        # 映射的二进制快照：只读查询直接在映射缓冲区上进行，首次写入时才整体导入内存
+        self.mapped: Optional[MappedSnapshot] = None
         
-        self.data_file = "contacts.json"
+        # 多版本读视图（见 snapshot）：有未释放的快照时，删除的联系人先记入墓地再摘链
+        self._snapshots: Dict[int, int] = {}  # 快照水位 -> 创建时的墓地位置
+        self._graveyard: Tuple[int, List[Contact]] = (0, [])  # (首条的绝对位置, 已删除的联系人)
+        self._snapshot_lock = threading.RLock()  # 保护快照登记与墓地的替换
+        
+        # 线程安全模式：查询可并发执行，增删、加载与保存独占；
+        # 在实例上替换为加锁版本，未开启时调用路径不变
+        self.thread_safe = thread_safe
+        if thread_safe:
+            lock = RWLock()
+            for name in self.READ_METHODS:
+                setattr(self, name, _guarded(getattr(self, name), lock.acquire_read, lock.release_read))
+            for name in self.WRITE_METHODS:
+                setattr(self, name, _guarded(getattr(self, name), lock.acquire_write, lock.release_write))
     
     def add_contact(self, name: str, phone: str, remark: str = "") -> Tuple[bool, str]:
         """添加联系人
@@ -116,11 +1847,16 @@ class ContactSystem:
         """
         if not name or not phone:
             return False, "错误：姓名和电话不能为空"
+        self._materialize()
         
         # 检查电话号码是否已存在（电话号码应该唯一）
         if phone in self.phone_hash:
             return False, f"错误：电话号码 {phone} 已存在"
         
+        self._log(["A", name, phone, remark])
+        
+        if self.compact:
+            name = sys.intern(name)
         contact = Contact(name, phone, remark)
         
         # 添加到双向链表
@@ -135,15 +1871,15 @@ class ContactSystem:
         
         # 更新散列表
         if name not in self.name_hash:
-            self.name_hash[name] = []
-        self.name_hash[name].append(contact)
+            self.name_hash[name] = {}
+        self.name_hash[name][phone] = contact
         self.phone_hash[phone] = contact
+        self.node_map[phone] = node
+        self._order.append(node)
         
         # 更新Trie树
-        if self.use_name_trie:
-            self.name_trie.insert(name, contact)
-        if self.use_phone_trie:
-            self.phone_trie.insert(phone, contact)
+        self._index_update(True, contact)
+        self._invalidate_cache(contact)
         
         return True, f"成功：已添加联系人 {name} ({phone})"
     
@@ -153,7 +1889,7 @@ class ContactSystem:
         Returns:
             (删除数量, 提示信息)
         """
-        deleted_count = 0
+        self._materialize()
         deleted_contacts = []
         
         # 先查找要删除的联系人
@@ -164,15 +1900,64 @@ class ContactSystem:
         else:
             # 按名字删除（可能删除多个重名联系人）
             if key in self.name_hash:
-                deleted_contacts = self.name_hash[key][:]
+                deleted_contacts = list(self.name_hash[key].values())
         
         if not deleted_contacts:
             return 0, f"错误：未找到联系人 '{key}'"
         
-        # 执行删除
-        for contact in deleted_contacts:
-            # 从双向链表中删除
-            node = self._find_node(contact)
+        deleted_count = self._remove_contacts(deleted_contacts)
+        return deleted_count, f"成功：已删除 {deleted_count} 个联系人"
+    
+    def del_by_name_prefix(self, name_prefix: str) -> Tuple[int, str]:
+        """删除名字以给定前缀开头的全部联系人"""
+        return self._del_prefix("name", name_prefix)
+    
+    def del_by_phone_prefix(self, phone_prefix: str) -> Tuple[int, str]:
+        """删除电话号码以给定前缀开头的全部联系人（如停用整个号段）"""
+        return self._del_prefix("phone", phone_prefix)
+    
+    def _del_prefix(self, field: str, prefix: str) -> Tuple[int, str]:
+        """按前缀批量删除
+        
+        前缀索引可用时把前缀对应的子树整体摘下得到待删联系人，再一趟从链表、
+        散列表和其余索引中移除，代价与删除数成正比，不随通讯录规模增长；
+        索引未建好时扫描散列表。日志只记一条前缀删除记录。
+        """
+        if not prefix:
+            return 0, "错误：前缀不能为空"
+        self._materialize()
+        attr = f"{field}_trie"
+        if attr in self._index_factories and self.index_state == "ready":
+            contacts = getattr(self, attr).detach_prefix(prefix)
+            detached = attr
+        else:
+            key_of = self.INDEX_KEYS[attr]
+            contacts = [contact for contact in self.phone_hash.values() if key_of(contact).startswith(prefix)]
+            detached = None
+        if not contacts:
+            return 0, f"错误：未找到前缀为 '{prefix}' 的联系人"
+        
+        self._log(["P", field, prefix])
+        deleted_count = self._remove_contacts(contacts, detached, log=False)
+        return deleted_count, f"成功：已删除 {deleted_count} 个联系人"
+    
+    def _remove_contacts(self, contacts: Iterable[Contact], detached: Optional[str] = None,
+                         log: bool = True) -> int:
+        """从链表、散列表和Trie树中移除给定联系人，返回实际删除数
+        
+        日志按电话逐条记录，重放时幂等；log为False时由调用方记录。
+        detached为已整体摘除这些联系人的索引属性名，跳过该索引。
+        """
+        deleted_count = 0
+        contacts = list(contacts)
+        for contact in contacts:
+            if log:
+                self._log(["D", contact.phone])
+            if self._snapshots:
+                self._bury(contact)
+            
+            # 从双向链表中删除（通过节点映射O(1)定位）
+            node = self.node_map.pop(contact.phone, None)
             if node:
                 if node.prev:
                     node.prev.next = node.next
@@ -186,61 +1971,514 @@ class ContactSystem:
                 
                 self.size -= 1
                 deleted_count += 1
+                self._order_dead += 1
             
             # 更新散列表
-            if contact.name in self.name_hash:
-                if contact in self.name_hash[contact.name]:
-                    self.name_hash[contact.name].remove(contact)
-                if not self.name_hash[contact.name]:
+            bucket = self.name_hash.get(contact.name)
+            if bucket is not None:
+                bucket.pop(contact.phone, None)
+                if not bucket:
                     del self.name_hash[contact.name]
             
             if contact.phone in self.phone_hash:
                 del self.phone_hash[contact.phone]
             
-            # 更新Trie树
-            if self.use_name_trie:
-                self.name_trie.remove(contact.name, contact)
-            if self.use_phone_trie:
-                self.phone_trie.remove(contact.phone, contact)
+            self._invalidate_cache(contact)
         
-        return deleted_count, f"成功：已删除 {deleted_count} 个联系人"
+        if self._order_dead > len(self._order) // 2:
+            self._compact_order()
+        
+        # 更新前缀索引
+        self._index_remove(contacts, detached)
+        return deleted_count
+    
+    def _compact_order(self):
+        """按链表重建插入顺序数组，丢弃已删除的节点"""
+        order = []
+        node = self.head
+        while node:
+            order.append(node)
+            node = node.next
+        self._order = order
+        self._order_dead = 0
+    
+    def bulk_load(self, records: Iterable[Dict]) -> Tuple[int, str]:
+        """批量导入联系人记录（含 name/phone/remark 的字典）
+        
+        一趟完成校验与去重，直接追加链表并更新散列表；
+        两棵Trie树在最后按排序后的键批量构建，而非逐条插入。
+        与add_contact一致：姓名或电话为空的记录被跳过，重复电话保留先出现的一条。
+        导入期间暂停循环垃圾回收：大量新建对象会反复触发全代扫描，而这些对象都存活。
+        持久模式下导入的联系人整批写入预写日志。
+        """
+        return self._import(records, log=True)
+    
+    def _import(self, records: Iterable[Dict], log: bool) -> Tuple[int, str]:
+        """bulk_load的实现；加载持久模式的默认快照时log为False，其内容无需再记日志"""
+        self._materialize()
+        if self.cache is not None:
+            # 批量导入影响面大，直接清空缓存
+            self.cache.clear()
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._bulk_load(records, log=log)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
     
-    def find_by_name(self, name_prefix: str) -> List[Contact]:
-        """按名字前缀查询"""
+    def _bulk_load(self, records: Iterable[Dict], ids: Optional[Iterator[int]] = None,
+                   log: bool = False) -> Tuple[int, str]:
+        """逐条导入记录；ids 给出时按顺序为每条记录指定联系人编号，log 为True时把导入的联系人写入日志"""
+        name_hash = self.name_hash
+        phone_hash = self.phone_hash
+        node_map = self.node_map
+        order_append = self._order.append
+        compact = self.compact
+        added: List[Contact] = []
+        skipped = 0
+        
+        tail = self.tail
+        try:
+            for item in records:
+                contact_id = next(ids) if ids is not None else None
+                if not isinstance(item, dict):
+                    skipped += 1
+                    continue
+                name = item.get('name', '')
+                phone = item.get('phone', '')
+                remark = item.get('remark', '') or ""
+                if (not name or not phone or not isinstance(name, str) or not isinstance(phone, str)
+                        or not isinstance(remark, str) or phone in phone_hash):
+                    skipped += 1
+                    continue
+                if compact:
+                    name = sys.intern(name)
+                
+                if contact_id is None:
+                    contact = Contact(name, phone, remark)
+                else:
+                    contact = Contact(name, phone, remark, contact_id)
+                node = Node(contact)
+                if tail is None:
+                    self.head = node
+                else:
+                    tail.next = node
+                    node.prev = tail
+                tail = node
+                
+                bucket = name_hash.get(name)
+                if bucket is None:
+                    bucket = name_hash[name] = {}
+                bucket[phone] = contact
+                phone_hash[phone] = contact
+                node_map[phone] = node
+                order_append(node)
+                added.append(contact)
+        finally:
+            # 读取中途出错时也为已导入的记录建好索引，保持各结构一致
+            self.tail = tail
+            self.size += len(added)
+            if log and added:
+                self._log_many(["A", contact.name, contact.phone, contact.remark] for contact in added)
+            
+            # 按排序后的键批量构建Trie树；索引尚未构建时留待首次查询或后台线程
+            if self.index_state == "ready":
+                self._fill_tries(self._active_indexes(), added)
+            elif self.index_state == "building":
+                with self._index_lock:
+                    if self.index_state == "ready":
+                        self._fill_tries(self._active_indexes(), added)
+                    else:
+                        self._index_backlog.extend((True, contact) for contact in added)
+        
+        count = len(added)
+        
+        msg = f"成功：已加载 {count} 个联系人到通讯录"
+        if skipped:
+            msg += f"，跳过 {skipped} 条无效或重复记录"
+        return count, msg
+    
+    def _new_indexes(self) -> Dict[str, IndexBackend]:
+        """为每个启用的前缀索引新建一个空的后端对象"""
+        return {attr: factory() for attr, factory in self._index_factories.items()}
+    
+    def _fill_tries(self, indexes: Dict[str, IndexBackend], contacts: List[Contact]):
+        """按排序后的键把联系人批量插入各索引；同键联系人按插入顺序成组挂入"""
+        for attr, index in indexes.items():
+            key_of = self.INDEX_KEYS[attr]
+            if attr == "phone_trie":
+                # 电话唯一，直接排序即可，省去分组字典
+                by_phone = sorted(contacts, key=key_of)
+                index.bulk_insert((contact.phone, (contact,)) for contact in by_phone)
+                continue
+            if isinstance(index, NGramIndex):
+                # 倒排索引与键的顺序无关，无需分组排序
+                index.bulk_insert((key_of(contact), (contact,)) for contact in contacts)
+                continue
+            groups: Dict[str, List[Contact]] = {}
+            for contact in contacts:
+                key = key_of(contact)
+                group = groups.get(key)
+                if group is None:
+                    groups[key] = [contact]
+                else:
+                    group.append(contact)
+            index.bulk_insert(sorted(groups.items(), key=lambda group: group[0]))
+    
+    def _active_indexes(self) -> Dict[str, IndexBackend]:
+        """当前已建的前缀索引：属性名 -> 后端对象"""
+        return {attr: getattr(self, attr) for attr in self._index_factories}
+    
+    def _index_update(self, add: bool, contact: Contact):
+        """把一次增删同步到Trie树；构建期间先记入积压，构建完成时补做"""
+        state = self.index_state
+        if state == "pending":
+            return
+        if state == "building":
+            with self._index_lock:
+                if self.index_state != "ready":
+                    self._index_backlog.append((add, contact))
+                    return
+        self._apply_to_tries(add, contact)
+    
+    def _index_remove(self, contacts: List[Contact], skip: Optional[str] = None):
+        """把一批删除同步到各前缀索引，每个索引一次批量移除；skip为已整体摘除的索引"""
+        state = self.index_state
+        if state == "pending":
+            return
+        if state == "building":
+            with self._index_lock:
+                if self.index_state != "ready":
+                    self._index_backlog.extend((False, contact) for contact in contacts)
+                    return
+        for attr in self._index_factories:
+            if attr != skip:
+                key_of = self.INDEX_KEYS[attr]
+                getattr(self, attr).remove_many([(key_of(contact), contact) for contact in contacts])
+    
+    def _apply_to_tries(self, add: bool, contact: Contact):
+        """对各前缀索引执行插入或删除"""
+        for attr in self._index_factories:
+            key = self.INDEX_KEYS[attr](contact)
+            if add:
+                getattr(self, attr).insert(key, contact)
+            else:
+                getattr(self, attr).remove(key, contact)
+    
+    def build_indexes(self, background: bool = False) -> bool:
+        """构建尚未构建的Trie索引，返回是否发起了构建
+        
+        先在锁内取得联系人快照，再在锁外建新树；期间的增删记入积压，
+        建好后在锁内补做积压并整体替换，查询不会看到建了一半的树。
+        background为True时在守护线程中构建。
+        """
+        with self._index_lock:
+            if self.index_state != "pending" or self.mapped is not None:
+                return False
+            self.index_state = "building"
+            contacts = self.list_all()
+        
+        if background:
+            threading.Thread(target=self._build_indexes, args=(contacts,),
+                             name="contact-index-builder", daemon=True).start()
+        else:
+            self._build_indexes(contacts)
+        return True
+    
+    def _build_indexes(self, contacts: List[Contact]):
+        """build_indexes的构建过程"""
+        start_time = time.perf_counter()
+        try:
+            indexes = self._new_indexes()
+            self._fill_tries(indexes, contacts)
+        except BaseException:
+            with self._index_lock:
+                self.index_state = "pending"
+                self._index_backlog = []
+            raise
+        
+        with self._index_lock:
+            for attr, index in indexes.items():
+                setattr(self, attr, index)
+            for add, contact in self._index_backlog:
+                self._apply_to_tries(add, contact)
+            self._index_backlog = []
+            self.index_state = "ready"
+            self.index_build_seconds = time.perf_counter() - start_time
+    
+    def _tries_ready(self) -> bool:
+        """Trie索引是否可用于查询；lazy模式下首次查询时同步构建"""
+        if self.index_state == "pending":
+            self.build_indexes()
+        return self.index_state == "ready"
+    
+    def find_by_name(self, name_prefix: str, limit: Optional[int] = None, offset: int = 0,
+                     cursor: Optional[Cursor] = None) -> List[Contact]:
+        """按名字前缀查询，结果按名字排序，支持 limit/offset/cursor 分页"""
+        return self.find_by_name_page(name_prefix, limit, offset, cursor)[0]
+    
+    def find_by_name_page(self, name_prefix: str, limit: Optional[int], offset: int = 0,
+                          cursor: Optional[Cursor] = None) -> Tuple[List[Contact], Optional[Cursor]]:
+        """按名字前缀分页查询，返回 (本页结果, 下一页游标)"""
         if not name_prefix:
+            return [], None
+        return self._cached_page("name", name_prefix, limit, offset, cursor, self._iter_name_prefix)
+    
+    def find_by_phone(self, phone_prefix: str, limit: Optional[int] = None, offset: int = 0,
+                      cursor: Optional[Cursor] = None) -> List[Contact]:
+        """按电话号码前缀查询，结果按号码排序，支持 limit/offset/cursor 分页"""
+        return self.find_by_phone_page(phone_prefix, limit, offset, cursor)[0]
+    
+    def find_by_phone_page(self, phone_prefix: str, limit: Optional[int], offset: int = 0,
+                           cursor: Optional[Cursor] = None) -> Tuple[List[Contact], Optional[Cursor]]:
+        """按电话号码前缀分页查询，返回 (本页结果, 下一页游标)"""
+        if not phone_prefix:
+            return [], None
+        return self._cached_page("phone", phone_prefix, limit, offset, cursor, self._iter_phone_prefix)
+    
+    def _cached_page(self, field: str, prefix: str, limit: Optional[int], offset: int,
+                     cursor: Optional[Cursor], iter_prefix: Callable) -> Tuple[List[Contact], Optional[Cursor]]:
+        """经由结果缓存取一页前缀查询结果"""
+        if offset < 0:
+            raise ValueError("offset 不能为负数")
+        if self.cache is None:
+            return _take_page(iter_prefix(prefix, cursor, offset), limit)
+        
+        key = (field, prefix, limit, offset, tuple(cursor) if cursor is not None else None)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        results, next_cursor = _take_page(iter_prefix(prefix, cursor, offset), limit)
+        self.cache.put(key, results, next_cursor)
+        return results, next_cursor
+    
+    def _invalidate_cache(self, contact: Contact):
+        """联系人增删后精确淘汰受影响的缓存条目"""
+        if self.cache is not None:
+            self.cache.invalidate("name", contact.name)
+            self.cache.invalidate("phone", contact.phone)
+    
+    def count_by_name(self, name_prefix: str) -> int:
+        """统计名字前缀匹配的联系人数，使用Trie树时为O(m)"""
+        if not name_prefix:
+            return 0
+        if self.mapped is not None:
+            return self.mapped.count_prefix(0, name_prefix)
+        if self.use_name_trie and self._tries_ready():
+            return self.name_trie.count_prefix(name_prefix)
+        return sum(len(bucket) for name, bucket in self.name_hash.items()
+                   if name.startswith(name_prefix))
+    
+    def count_by_phone(self, phone_prefix: str) -> int:
+        """统计电话前缀匹配的联系人数，使用Trie树时为O(m)"""
+        if not phone_prefix:
+            return 0
+        if self.mapped is not None:
+            return self.mapped.count_prefix(1, phone_prefix)
+        if self.use_phone_trie and self._tries_ready():
+            return self.phone_trie.count_prefix(phone_prefix)
+        return sum(1 for phone in self.phone_hash if phone.startswith(phone_prefix))
+    
+    def find_by_name_fuzzy(self, query: str, max_edits: int = 1,
+                           limit: Optional[int] = None) -> List[Contact]:
+        """容错的姓名查询：返回与query编辑距离不超过max_edits的联系人
+        
+        结果按编辑距离、姓名排序，同名联系人保持插入顺序。
+        使用前缀索引时沿树（有序数组上模拟的树）剪枝遍历，否则逐个姓名计算距离。
+        """
+        if max_edits < 0:
+            raise ValueError("max_edits 不能为负数")
+        if limit is not None and limit < 0:
+            raise ValueError("limit 不能为负数")
+        if not query:
             return []
         
-        # 优先使用Trie树
-        if self.use_name_trie and self.name_trie:
-            return self.name_trie.search_prefix(name_prefix)
+        if self.mapped is not None:
+            entries = self.mapped.iter_prefix(0, "")
+            matches = _fuzzy_scan(((name, [contact for _, _, contact in group])
+                                   for name, group in groupby(entries, key=itemgetter(0))),
+                                  query, max_edits)
+        elif self.use_name_trie and self._tries_ready():
+            matches = self.name_trie.iter_fuzzy(query, max_edits)
+        else:
+            matches = _fuzzy_scan(((name, bucket.values()) for name, bucket in self.name_hash.items()),
+                                  query, max_edits)
         
-        # 回退到散列表（精确匹配）
-        results = []
-        for name, contacts in self.name_hash.items():
-            if name.startswith(name_prefix):
-                results.extend(contacts)
+        ranked = sorted(matches, key=lambda match: (match[0], match[1]))
+        return [contact for _, _, contact in ranked[:limit]]
+    
+    def find_by_phone_substring(self, digits: str, limit: Optional[int] = None) -> List[Contact]:
+        """查询号码中任意位置包含digits的联系人（如尾号、连号），结果按号码排序
+        
+        启用电话n元组索引时对倒排表求交，否则逐条扫描。
+        """
+        if limit is not None and limit < 0:
+            raise ValueError("limit 不能为负数")
+        if not digits:
+            return []
+        if self.mapped is None and "phone_grams" in self._index_factories and self._tries_ready():
+            results = self.phone_grams.search([digits], self.INDEX_KEYS["phone_grams"])
+        else:
+            results = [contact for contact in self.list_all() if digits in contact.phone]
+        if limit is not None:
+            return heapq.nsmallest(limit, results, key=lambda contact: contact.phone)
+        results.sort(key=lambda contact: contact.phone)
         return results
     
-    def find_by_phone(self, phone_prefix: str) -> List[Contact]:
-        """按电话号码前缀查询"""
-        if not phone_prefix:
+    def find_by_remark(self, query: str, limit: Optional[int] = None) -> List[Contact]:
+        """按备注全文检索：query按空白切分为多个词，返回备注同时包含全部词的联系人
+        
+        不区分大小写，结果按添加顺序排列。启用备注索引时对倒排表求交，否则逐条扫描。
+        """
+        if limit is not None and limit < 0:
+            raise ValueError("limit 不能为负数")
+        terms = query.lower().split()
+        if not terms:
             return []
+        key_of = self.INDEX_KEYS["remark_grams"]
+        if self.mapped is None and "remark_grams" in self._index_factories and self._tries_ready():
+            return self.remark_grams.search(terms, key_of, limit)
+        
+        # 链表顺序即添加顺序
+        matches = (contact for contact in self.list_all() if all(term in key_of(contact) for term in terms))
+        return list(islice(matches, limit))
+    
+    def find_by_pinyin(self, prefix: str, limit: Optional[int] = None, offset: int = 0,
+                       cursor: Optional[Cursor] = None) -> List[Contact]:
+        """按姓名全拼前缀查询（如 zhangs），结果按全拼排序，分页语义同find_by_name"""
+        return self.find_by_pinyin_page(prefix, limit, offset, cursor)[0]
+    
+    def find_by_pinyin_page(self, prefix: str, limit: Optional[int], offset: int = 0,
+                            cursor: Optional[Cursor] = None) -> Tuple[List[Contact], Optional[Cursor]]:
+        """按姓名全拼前缀分页查询，返回 (本页结果, 下一页游标)"""
+        return self._pinyin_page("pinyin_trie", prefix, limit, offset, cursor)
+    
+    def find_by_initials(self, prefix: str, limit: Optional[int] = None, offset: int = 0,
+                         cursor: Optional[Cursor] = None) -> List[Contact]:
+        """按姓名拼音首字母前缀查询（如 zs），结果按首字母排序，分页语义同find_by_name"""
+        return self.find_by_initials_page(prefix, limit, offset, cursor)[0]
+    
+    def find_by_initials_page(self, prefix: str, limit: Optional[int], offset: int = 0,
+                              cursor: Optional[Cursor] = None) -> Tuple[List[Contact], Optional[Cursor]]:
+        """按姓名拼音首字母前缀分页查询，返回 (本页结果, 下一页游标)"""
+        return self._pinyin_page("initials_trie", prefix, limit, offset, cursor)
+    
+    def _pinyin_page(self, attr: str, prefix: str, limit: Optional[int], offset: int,
+                     cursor: Optional[Cursor]) -> Tuple[List[Contact], Optional[Cursor]]:
+        """拼音类查询的公共部分：规范化查询串后在对应索引上分页"""
+        prefix = normalize_query(prefix)
+        if not prefix:
+            return [], None
+        if offset < 0:
+            raise ValueError("offset 不能为负数")
+        return _take_page(self._iter_pinyin_prefix(attr, prefix, cursor, offset), limit)
+    
+    def _iter_pinyin_prefix(self, attr: str, prefix: str, cursor: Optional[Cursor],
+                            skip: int = 0) -> Iterator[Tuple[str, int, Contact]]:
+        """拼音前缀结果流；索引不可用时逐个联系人即时转换"""
+        if self.mapped is None and attr in self._index_factories and self._tries_ready():
+            return getattr(self, attr).iter_prefix(prefix, cursor, skip)
+        
+        # 回退到线性扫描，按插入顺序分组以保持同键内的顺序
+        key_of = self.INDEX_KEYS[attr]
+        groups: Dict[str, List[Contact]] = {}
+        for contact in self.list_all():
+            key = key_of(contact)
+            if key.startswith(prefix):
+                groups.setdefault(key, []).append(contact)
+        return islice(_iter_groups(sorted(groups.items()), cursor), skip, None)
+    
+    def _iter_name_prefix(self, name_prefix: str, cursor: Optional[Cursor],
+                          skip: int = 0) -> Iterator[Tuple[str, int, Contact]]:
+        """名字前缀结果流"""
+        if self.mapped is not None:
+            return self.mapped.iter_prefix(0, name_prefix, cursor, skip)
         
         # 优先使用Trie树
-        if self.use_phone_trie and self.phone_trie:
-            return self.phone_trie.search_prefix(phone_prefix)
+        if self.use_name_trie and self._tries_ready():
+            return self.name_trie.iter_prefix(name_prefix, cursor, skip)
+        
+        # 回退到散列表扫描
+        groups = sorted((name, list(bucket.values())) for name, bucket in self.name_hash.items()
+                        if name.startswith(name_prefix))
+        return islice(_iter_groups(groups, cursor), skip, None)
+    
+    def _iter_phone_prefix(self, phone_prefix: str, cursor: Optional[Cursor],
+                           skip: int = 0) -> Iterator[Tuple[str, int, Contact]]:
+        """电话前缀结果流"""
+        if self.mapped is not None:
+            return self.mapped.iter_prefix(1, phone_prefix, cursor, skip)
+        
+        # 优先使用Trie树
+        if self.use_phone_trie and self._tries_ready():
+            return self.phone_trie.iter_prefix(phone_prefix, cursor, skip)
         
         # 回退到线性扫描
-        results = []
+        groups = []
         node = self.head
         while node:
             if node.contact.phone.startswith(phone_prefix):
-                results.append(node.contact)
+                groups.append((node.contact.phone, [node.contact]))
             node = node.next
-        return results
+        groups.sort(key=lambda g: g[0])
+        return islice(_iter_groups(groups, cursor), skip, None)
+    
+    def snapshot(self) -> Snapshot:
+        """创建当前时刻的只读视图，之后的增删不影响它（见 Snapshot）
+        
+        映射快照会先导入内存，创建本身为O(1)，不复制联系人。
+        """
+        self._materialize()
+        with self._snapshot_lock:
+            base, dead = self._graveyard
+            if not self._snapshots and dead:
+                self._graveyard = (base + len(dead), [])
+            base, dead = self._graveyard
+            watermark = next(_contact_ids)
+            self._snapshots[watermark] = base + len(dead)
+        return Snapshot(self, watermark, base + len(dead), self.size)
+    
+    def _release_snapshot(self, watermark: int):
+        """释放快照，回收不再被任何快照需要的已删除联系人
+        
+        也会在快照被垃圾回收时调用，因此不取读写锁。
+        """
+        with self._snapshot_lock:
+            self._snapshots.pop(watermark, None)
+            self._trim_graveyard()
+    
+    def _trim_graveyard(self):
+        """丢弃墓地中早于最老快照的部分"""
+        base, dead = self._graveyard
+        oldest = min(self._snapshots.values(), default=base + len(dead))
+        if oldest > base:
+            self._graveyard = (oldest, dead[oldest - base:])
+    
+    def _bury(self, contact: Contact):
+        """有快照时，在摘除联系人之前先把它记入墓地"""
+        with self._snapshot_lock:
+            if self._snapshots:
+                self._graveyard[1].append(contact)
+    
+    def _snapshot_prefix(self, snapshot: Snapshot, attr: str, prefix: str,
+                         limit: Optional[int]) -> List[Contact]:
+        """在快照中做前缀查询：当前索引中属于快照的结果，与墓地中匹配的结果按 (键, 编号) 归并"""
+        watermark = snapshot.watermark
+        key_of = self.INDEX_KEYS[attr]
+        iter_prefix = self._iter_name_prefix if attr == "name_trie" else self._iter_phone_prefix
+        live = ((key, contact.id, contact) for key, _, contact in iter_prefix(prefix, None, 0)
+                if contact.id < watermark)
+        _, buried = snapshot._buried(snapshot.start)
+        dead = sorted((key_of(contact), contact.id, contact) for contact in buried
+                      if key_of(contact).startswith(prefix))
+        merged = heapq.merge(live, dead, key=itemgetter(0, 1))
+        return [contact for _, _, contact in islice(merged, limit)]
     
     def list_all(self) -> List[Contact]:
         """列出所有联系人"""
+        if self.mapped is not None:
+            return list(self.mapped.iter_rows())
         results = []
         node = self.head
         while node:
@@ -248,63 +2486,370 @@ class ContactSystem:
             node = node.next
         return results
     
+    def list_page(self, order: str = "insert", limit: Optional[int] = None,
+                  cursor: Optional[str] = None) -> Tuple[List[Contact], Optional[str]]:
+        """按插入顺序、姓名或电话分页列出联系人，返回 (本页结果, 下一页的不透明游标)
+        
+        姓名与电话顺序直接按序遍历前缀索引，游标定位下一页只需沿游标键下行，
+        一页的代价与页大小和键长成正比，无需复制或排序全部联系人；
+        插入顺序从游标所指联系人的链表节点继续，该联系人已被删除时在插入顺序数组上
+        按编号二分定位。没有更多结果时游标为None。
+        """
+        if order not in self.LIST_ORDERS:
+            raise ValueError(f"未知的排序方式：'{order}'，可选 {list(self.LIST_ORDERS)}")
+        position = _decode_cursor(order, cursor) if cursor is not None else None
+        if order == "name":
+            entries = self._iter_name_prefix("", position)
+        elif order == "phone":
+            entries = self._iter_phone_prefix("", position)
+        else:
+            entries = self._iter_insertion(position)
+        results, next_position = _take_page(entries, limit)
+        return results, _encode_cursor(order, next_position) if next_position is not None else None
+    
+    def _iter_insertion(self, cursor: Optional[Cursor]) -> Iterator[Tuple[str, int, Contact]]:
+        """按插入顺序产出 (电话, 编号, 联系人)，链表按编号递增，从编号大于游标的第一个联系人继续"""
+        if self.mapped is not None:
+            start = 0 if cursor is None else max(0, cursor[1] - self.mapped.first_id + 1)
+            for row in range(start, len(self.mapped)):
+                contact = self.mapped.row(row)
+                yield contact.phone, contact.id, contact
+            return
+        
+        node = self.head
+        if cursor is not None:
+            phone, last_id = cursor
+            found = self.node_map.get(phone)
+            if found is not None and found.contact.id == last_id:
+                node = found.next
+            else:
+                node = self._seek_order(last_id)
+        while node is not None:
+            contact = node.contact
+            yield contact.phone, contact.id, contact
+            node = node.next
+    
+    def _seek_order(self, last_id: int) -> Optional[Node]:
+        """编号大于last_id的第一个未删除节点：在插入顺序数组上二分，再跳过已删除的节点"""
+        order = self._order
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if order[mid].contact.id <= last_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        node_map = self.node_map
+        for i in range(lo, len(order)):
+            node = order[i]
+            if node_map.get(node.contact.phone) is node:
+                return node
+        return None
+    
     def _find_node(self, contact: Contact) -> Optional[Node]:
-        """在双向链表中查找联系人对应的节点"""
+        """查找联系人对应的链表节点（O(1)）"""
+        node = self.node_map.get(contact.phone)
+        if node is not None and node.contact is contact:
+            return node
+        return None
+    
+    def iter_records(self) -> Iterator[Dict[str, str]]:
+        """沿链表逐条产出可序列化的联系人记录"""
+        if self.mapped is not None:
+            yield from self.mapped.iter_records()
+            return
         node = self.head
         while node:
-            if node.contact is contact:
-                return node
+            contact = node.contact
+            yield {"name": contact.name, "phone": contact.phone, "remark": contact.remark}
             node = node.next
-        return None
     
-    def save_to_file(self) -> Tuple[bool, str]:
-        """保存数据到JSON文件"""
+    def save_to_file(self, path: Optional[str] = None) -> Tuple[bool, str]:
+        """保存数据到文件
+        
+        扩展名为 .jsonl 时写JSON Lines（每行一条记录），为 .snap 时写二进制快照，
+        否则写JSON数组；文本格式边遍历链表边写出，不在内存中构造完整列表。
+        """
+        return _write_data_file(path or self.data_file, self.list_all, self.iter_records)
+    
+    def load_from_file(self, path: Optional[str] = None) -> Tuple[int, str]:
+        """从文件加载数据
+        
+        按内容识别格式：以 '[' 开头的是旧版JSON数组，整体解析；
+        否则按JSON Lines逐行读取，边读边导入。
+        持久模式下加载默认快照后还会重放预写日志。
+        background模式下无论文件是否存在、以何种格式加载，结束后都启动后台索引构建；
+        映射的快照由映射本身提供查询，构建推迟到导入内存时（见_materialize）。
+        """
+        count, msg = self._load_from_file(path or self.data_file)
+        if self.index_mode == "background":
+            self.build_indexes(background=True)
+        return count, msg
+    
+    def _load_from_file(self, path: str) -> Tuple[int, str]:
+        """load_from_file的实现"""
+        replay = self.durable and path == self.data_file
+        if not os.path.exists(path):
+            if replay and os.path.exists(self.wal_file):
+                return self._load_wal(0, f"信息：快照 {path} 不存在")
+            return 0, f"信息：文件 {path} 不存在"
+        
+        if MappedSnapshot.is_snapshot(path):
+            count, msg = self.open_mapped(path)
+            if replay:
+                return self._load_wal(count, msg)
+            return count, msg
+        
+        size_before = self.size
         try:
-            contacts_data = []
-            node = self.head
-            while node:
-                contacts_data.append({
-                    "name": node.contact.name,
-                    "phone": node.contact.phone,
-                    "remark": node.contact.remark
-                })
-                node = node.next
-            
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(contacts_data, f, ensure_ascii=False, indent=2)
-            
-            return True, f"成功：数据已保存到 {self.data_file}"
+            with open(path, 'r', encoding='utf-8') as f:
+                # 加载其他文件等同批量导入，持久模式下写入日志；默认快照本身无需再记
+                if _peek_char(f) == "[":
+                    count, msg = self._import(json.load(f), log=not replay)
+                else:
+                    count, msg = self._import(_iter_jsonl(f), log=not replay)
         except Exception as e:
-            return False, f"错误：保存失败 - {str(e)}"
+            loaded = self.size - size_before
+            if loaded:
+                return loaded, f"错误：加载中断，已导入 {loaded} 个联系人 - {str(e)}"
+            return 0, f"错误：加载失败 - {str(e)}"
+        
+        if replay:
+            count, msg = self._load_wal(count, msg)
+        return count, msg
     
-    def load_from_file(self) -> Tuple[int, str]:
-        """从JSON文件加载数据"""
-        if not os.path.exists(self.data_file):
-            return 0, f"信息：文件 {self.data_file} 不存在"
+    def open_mapped(self, path: str) -> Tuple[int, str]:
+        """映射二进制快照
         
+        系统为空时直接映射文件，前缀查询、计数和遍历都在映射缓冲区上完成，
+        启动几乎不随数据量增长；首次增删时再整体导入内存（见_materialize）。
+        系统已有数据时则把快照记录合并导入；持久模式下映射默认快照以外的文件
+        同样逐条导入，以便写入日志。
+        """
         try:
-            with open(self.data_file, 'r', encoding='utf-8') as f:
-                contacts_data = json.load(f)
-            
-            loaded_count = 0
-            for item in contacts_data:
-                success, _ = self.add_contact(
-                    item.get('name', ''),
-                    item.get('phone', ''),
-                    item.get('remark', '')
-                )
-                if success:
-                    loaded_count += 1
-            
-            return loaded_count, f"成功：已加载 {loaded_count} 个联系人到通讯录"
+            mapped = MappedSnapshot(path)
         except Exception as e:
             return 0, f"错误：加载失败 - {str(e)}"
+        
+        log = path != self.data_file
+        if self.size or self.mapped is not None or (self.durable and log):
+            try:
+                return self._import(mapped.iter_records(), log=log)
+            finally:
+                mapped.close()
+        
+        self.mapped = mapped
+        self.size = len(mapped)
+        if self.cache is not None:
+            self.cache.clear()
+        return self.size, f"成功：已映射二进制快照 {path}，共 {self.size} 个联系人"
+    
+    def _materialize(self):
+        """把映射的快照整体导入内存结构并解除映射，供写操作之前调用"""
+        if self.mapped is None:
+            return
+        mapped, self.mapped = self.mapped, None
+        self.size = 0
+        if self.cache is not None:
+            self.cache.clear()
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            # 沿用映射时的编号，映射期间给出的分页游标导入后仍然有效
+            self._bulk_load(mapped.iter_records(), count(mapped.first_id))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+            mapped.close()
+        if self.index_mode == "background":
+            self.build_indexes(background=True)
+    
+    def _load_wal(self, count: int, msg: str) -> Tuple[int, str]:
+        """在快照之上重放日志，并拼接提示信息"""
+        size_before = self.size
+        try:
+            replayed = self.replay_wal()
+        except Exception as e:
+            return count, f"{msg}；错误：日志重放失败 - {str(e)}"
+        if not replayed:
+            return count, msg
+        return count + self.size - size_before, f"{msg}；已重放日志 {replayed} 条"
+    
+    def _log(self, record: list):
+        """追加一条日志记录（持久模式且不在重放中时）
+        
+        每条记录写入后立即flush到操作系统，进程崩溃不丢数据；
+        每累计fsync_every条执行一次fsync，控制掉电时最多丢失的条数。
+        """
+        if not self.durable or self._replaying:
+            return
+        if self._wal is None:
+            self._wal = open(self.wal_file, 'a', encoding='utf-8')
+        self._wal.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        self._wal.write("\n")
+        self._wal.flush()
+        self._wal_unsynced += 1
+        if self._wal_unsynced >= self.fsync_every:
+            os.fsync(self._wal.fileno())
+            self._wal_unsynced = 0
+    
+    def _log_many(self, records: Iterable[list]):
+        """整批追加日志记录，最后只flush和fsync一次（批量导入用）"""
+        if not self.durable or self._replaying:
+            return
+        if self._wal is None:
+            self._wal = open(self.wal_file, 'a', encoding='utf-8')
+        write = self._wal.write
+        for record in records:
+            write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+            write("\n")
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+        self._wal_unsynced = 0
+    
+    def sync(self):
+        """立即把尚未fsync的日志落盘"""
+        if self._wal is not None and self._wal_unsynced:
+            self._wal.flush()
+            os.fsync(self._wal.fileno())
+            self._wal_unsynced = 0
+    
+    def _close_wal(self):
+        """落盘并关闭日志文件"""
+        if self._wal is not None:
+            self.sync()
+            self._wal.close()
+            self._wal = None
+    
+    def close(self):
+        """落盘并关闭日志文件，解除快照映射"""
+        self._close_wal()
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+            self.size = 0
+    
+    def replay_wal(self) -> int:
+        """重放预写日志，返回应用的记录数
+        
+        添加记录在电话已存在时跳过、删除按电话或前缀进行，因此对已包含部分
+        日志效果的快照重复重放也能得到相同结果。末尾写了一半的记录
+        （崩溃时的残留）会被截掉，其余位置的损坏记录视为错误。
+        """
+        if not os.path.exists(self.wal_file):
+            return 0
+        
+        applied = 0
+        good_size = 0
+        self._replaying = True
+        try:
+            with open(self.wal_file, 'rb') as f:
+                for line_no, raw in enumerate(f, 1):
+                    if not raw.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(raw)
+                        op = record[0]
+                    except (ValueError, IndexError, TypeError) as e:
+                        raise ValueError(f"日志第 {line_no} 行损坏：{e}") from e
+                    if op == "A":
+                        self.add_contact(record[1], record[2], record[3])
+                    elif op == "D":
+                        contact = self.phone_hash.get(record[1])
+                        if contact is not None:
+                            self._remove_contacts([contact])
+                    elif op == "P":
+                        self._del_prefix(record[1], record[2])
+                    else:
+                        raise ValueError(f"日志第 {line_no} 行包含未知操作 '{op}'")
+                    applied += 1
+                    good_size += len(raw)
+        finally:
+            self._replaying = False
+        
+        if good_size < os.path.getsize(self.wal_file):
+            with open(self.wal_file, 'r+b') as f:
+                f.truncate(good_size)
+        return applied
+    
+    def compact_wal(self) -> Tuple[bool, str]:
+        """把日志合并进新快照并清空日志
+        
+        先原子替换快照再截断日志；两步之间崩溃时，下次启动重放的
+        日志记录都是幂等的，结果不变。
+        """
+        success, msg = self.save_to_file()
+        if not success:
+            return False, msg
+        if self.durable:
+            # 只关闭日志；映射的快照仍是当前数据，不能解除
+            self._close_wal()
+            with open(self.wal_file, 'w', encoding='utf-8') as f:
+                f.flush()
+                os.fsync(f.fileno())
+        return True, f"成功：已压缩日志并写入快照 {self.data_file}"
+    
+    def _bytes_per_contact(self, sample_size: int = 1000) -> float:
+        """估算每个联系人的内存占用（字节）
+        
+        抽样链表头部最多sample_size条记录，累计 链表节点 + 联系人 + 字符串
+        （同一字符串对象只计一次）及所在姓名桶的均摊大小，
+        再加上各散列表按条目均摊的开销。不含Trie索引。
+        """
+        if not self.size:
+            return 0.0
+        if self.mapped is not None:
+            return self.mapped.nbytes / self.size
+        
+        seen = set()
+        total = 0
+        sampled = 0
+        node = self.head
+        while node and sampled < sample_size:
+            contact = node.contact
+            total += sys.getsizeof(node) + sys.getsizeof(contact)
+            for value in (contact.name, contact.phone, contact.remark):
+                if id(value) not in seen:
+                    seen.add(id(value))
+                    total += sys.getsizeof(value)
+            bucket = self.name_hash[contact.name]
+            total += sys.getsizeof(bucket) / len(bucket)
+            sampled += 1
+            node = node.next
+        
+        tables = sum(sys.getsizeof(t) for t in (self.name_hash, self.phone_hash, self.node_map))
+        return total / sampled + tables / self.size
     
     def get_stats(self) -> Dict:
         """获取系统统计信息"""
+        cache = self.cache
         return {
             "total_contacts": self.size,
-            "unique_names": len(self.name_hash),
+            "unique_names": self.mapped.unique_names if self.mapped is not None else len(self.name_hash),
             "use_name_index": self.use_name_trie,
-            "use_phone_index": self.use_phone_trie
+            "use_phone_index": self.use_phone_trie,
+            "use_pinyin_index": self.use_pinyin_trie,
+            "use_phone_ngram_index": self.use_phone_grams,
+            "use_remark_index": self.use_remark_grams,
+            "name_index_type": self.name_index_type,
+            "phone_index_type": self.phone_index_type,
+            "name_index_backend": self.name_trie.backend if self.name_trie is not None else None,
+            "phone_index_backend": self.phone_trie.backend if self.phone_trie is not None else None,
+            "compact": self.compact,
+            "durable": self.durable,
+            "storage": "mmap" if self.mapped is not None else "memory",
+            "index_mode": self.index_mode,
+            "index_state": self.index_state,
+            "index_build_seconds": self.index_build_seconds,
+            "bytes_per_contact": round(self._bytes_per_contact(), 1),
+            "thread_safe": self.thread_safe,
+            "snapshots": len(self._snapshots),
+            "snapshot_retained": len(self._graveyard[1]),
+            "cache_enabled": cache is not None,
+            "cache_entries": len(cache.entries) if cache else 0,
+            "cache_bytes": cache.bytes if cache else 0,
+            "cache_hits": cache.hits if cache else 0,
+            "cache_misses": cache.misses if cache else 0,
+            "cache_evictions": cache.evictions if cache else 0,
+            "cache_invalidations": cache.invalidations if cache else 0,
         }
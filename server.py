@@ -0,0 +1,136 @@
+"""
+通讯录网络服务
+基于asyncio的TCP服务，多个客户端共享同一个内存中的通讯录。
+协议为逐行文本：客户端每行发送一条命令（语法同交互界面），服务端对每条命令回复一行JSON
+"""
+
+from contact import ContactSystem
+from commands import CommandExecutor
+from cli import add_system_arguments
+from typing import Optional, Dict
+import argparse
+import asyncio
+import json
+
+
+class ContactServer:
+    """通讯录TCP服务
+    
+    所有连接的命令都在事件循环线程中逐条执行，单条命令天然是原子的，无需加锁。
+    客户端可不等回复连续发送多条命令（流水线），回复按命令顺序返回；
+    空行不回复，EXIT/QUIT 关闭连接。执行时间长的命令（LIST、SAVE）会阻塞其他连接。
+    SAVE 不接受文件名，远程客户端只能保存到启动时指定的数据文件。
+    """
+    MAX_LINE = 64 * 1024  # 单条命令的最大字节数
+    
+    def __init__(self, system: ContactSystem):
+        self.system = system
+        self.executor = CommandExecutor(system, allow_paths=False)
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.commands = 0  # 已执行的命令数
+        self._handlers: Dict[asyncio.Task, asyncio.StreamWriter] = {}  # 各连接的处理任务
+    
+    async def start(self, host: str = "127.0.0.1", port: int = 7070) -> int:
+        """开始监听，返回实际端口（port为0时由系统分配）"""
+        self.server = await asyncio.start_server(self.handle, host, port, limit=self.MAX_LINE)
+        return self.server.sockets[0].getsockname()[1]
+    
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+    
+    @property
+    def connections(self) -> int:
+        """当前连接数"""
+        return len(self._handlers)
+    
+    async def stop(self):
+        """停止监听，关闭现有连接并等待其处理任务结束"""
+        self.server.close()
+        for writer in self._handlers.values():
+            writer.close()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self.server.wait_closed()
+    
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个连接：逐行读取命令，逐行回复"""
+        self._handlers[asyncio.current_task()] = writer
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # 超长的行无法定位下一条命令的起点，回复错误后断开
+                    writer.write(self._encode({"ok": False, "error": f"命令超过 {self.MAX_LINE} 字节"}))
+                    break
+                if not line:
+                    break
+                text = line.decode("utf-8", errors="replace").strip()
+                if not text:
+                    continue
+                if text.upper() in ("EXIT", "QUIT"):
+                    break
+                writer.write(self._encode(self._execute(text)))
+                self.commands += 1
+                # 写缓冲未满时立即返回，流水线中的后续命令无需等待网络
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self._handlers[asyncio.current_task()]
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+    
+    def _execute(self, text: str) -> dict:
+        """执行一条命令；意外异常转为错误回复，不影响连接"""
+        try:
+            return self.executor.execute(text)
+        except Exception as e:
+            return {"ok": False, "error": f"内部错误：{e}"}
+    
+    @staticmethod
+    def _encode(response: dict) -> bytes:
+        return (json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="通讯录网络服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认 127.0.0.1）")
+    parser.add_argument("--port", type=int, default=7070, help="监听端口（默认 7070）")
+    add_system_arguments(parser)
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    """加载数据并运行服务直到被中断"""
+    system = ContactSystem(name_index_type=args.index_type, phone_index_type=args.index_type,
+                           data_file=args.data_file, durable=args.durable, fsync_every=args.fsync_every,
+                           index_mode=args.index_mode, use_phone_ngram_index=args.phone_ngram,
+                           use_remark_index=args.remark_index, cache_entries=args.cache_entries,
+                           cache_bytes=args.cache_bytes, compact=args.compact)
+    count, msg = system.load_from_file()
+    if count > 0:
+        print(f"[启动] {msg}")
+    server = ContactServer(system)
+    port = await server.start(args.host, args.port)
+    print(f"[启动] 正在监听 {args.host}:{port}")
+    try:
+        await server.serve_forever()
+    finally:
+        system.close()
+
+
+def main():
+    """主函数"""
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        print("\n服务已停止")
+
+
+if __name__ == "__main__":
+    main()
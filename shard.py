@@ -0,0 +1,250 @@
+"""
+分片通讯录模块
+把联系人按电话号码的哈希分散到多个工作进程，每个进程持有独立的 ContactSystem，
+突破单进程GIL与单个堆的限制；精确操作路由到单个分片，前缀查询分发到全部分片后归并
+"""
+
+from contact import ContactSystem, Contact
+from typing import Optional, List, Dict, Tuple, Iterable, Any
+from operator import attrgetter
+from itertools import islice
+from zlib import crc32
+import gc
+import heapq
+import multiprocessing
+
+
+def _del_phone(system: ContactSystem, phone: str) -> Tuple[int, str]:
+    """只按电话号码精确删除，号码不存在时不回退为按姓名删除"""
+    if phone not in system.phone_hash:
+        return 0, f"错误：未找到联系人 '{phone}'"
+    return system.del_contact(phone)
+
+
+# 工作进程中除 ContactSystem 方法外可调用的操作
+_WORKER_FUNCTIONS = {"del_phone": _del_phone}
+
+
+def _shard_worker(conn, options: Dict):
+    """工作进程主循环：每次接收一批 (方法名, 参数) 依次执行，回复结果列表
+    
+    某个调用出错时回复 ("error", 异常)，批内其余调用不再执行；收到None时退出。
+    """
+    # fork启动时继承了父进程的全部对象，移出垃圾回收的跟踪范围，避免每次全代回收都遍历一遍
+    gc.freeze()
+    system = ContactSystem(**options)
+    while True:
+        calls = conn.recv()
+        if calls is None:
+            break
+        try:
+            results = []
+            for method, args in calls:
+                function = _WORKER_FUNCTIONS.get(method)
+                if function is not None:
+                    results.append(function(system, *args))
+                else:
+                    results.append(getattr(system, method)(*args))
+            conn.send(("ok", results))
+        except Exception as e:
+            conn.send(("error", e))
+    system.close()
+    conn.close()
+
+
+class ShardedContactSystem:
+    """按电话号码哈希分片的多进程通讯录
+    
+    联系人按 crc32(电话) % 分片数 归属某个工作进程。添加与按电话删除只访问一个分片；
+    按姓名删除、前缀查询与计数同时发给全部分片，各分片并行执行后在本进程归并：
+    前缀查询结果按姓名/电话归并排序，同名联系人之间按分片顺序排列。
+    分片数决定了数据的归属，持久化与恢复须使用相同的分片数，暂不提供。
+    """
+    
+    def __init__(self, shards: int = 4, **options):
+        """options 原样传给各分片的 ContactSystem（索引类型、缓存等）
+        
+        持久化相关的选项（durable、data_file）会让各分片读写同一个快照与日志，不予接受。
+        """
+        if shards < 1:
+            raise ValueError("shards 必须为正整数")
+        unsupported = sorted({"durable", "data_file"} & options.keys())
+        if unsupported:
+            raise ValueError(f"分片通讯录暂不支持持久化选项：{', '.join(unsupported)}")
+        context = multiprocessing.get_context()
+        self.connections = []
+        self.processes = []
+        for i in range(shards):
+            parent, child = context.Pipe()
+            process = context.Process(target=_shard_worker, args=(child, options),
+                                      name=f"contact-shard-{i}", daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+    
+    @property
+    def shards(self) -> int:
+        return len(self.connections)
+    
+    def shard_of(self, phone: str) -> int:
+        """电话号码所属的分片"""
+        return crc32(phone.encode("utf-8")) % len(self.connections)
+    
+    # ---- 与工作进程通信 ----
+    
+    def _scatter(self, calls: Dict[int, List[Tuple[str, tuple]]]) -> Dict[int, List[Any]]:
+        """把各分片的调用批次先全部发出再逐个收取结果，各分片并行执行"""
+        for shard, batch in calls.items():
+            self.connections[shard].send(batch)
+        results = {}
+        error = None
+        for shard in calls:
+            status, value = self.connections[shard].recv()
+            if status == "error":
+                error = error or value
+            else:
+                results[shard] = value
+        if error is not None:
+            raise error
+        return results
+    
+    def _call(self, shard: int, method: str, *args) -> Any:
+        """在单个分片上调用一次"""
+        return self._scatter({shard: [(method, args)]})[shard][0]
+    
+    def _broadcast(self, method: str, *args) -> List[Any]:
+        """在全部分片上调用同一方法，按分片顺序返回结果"""
+        results = self._scatter({shard: [(method, args)] for shard in range(self.shards)})
+        return [results[shard][0] for shard in range(self.shards)]
+    
+    # ---- 增删 ----
+    
+    def add_contact(self, name: str, phone: str, remark: str = "") -> Tuple[bool, str]:
+        """添加联系人；号码唯一性由所属分片保证"""
+        return self._call(self.shard_of(phone), "add_contact", name, phone, remark)
+    
+    def del_contact(self, key: str) -> Tuple[int, str]:
+        """删除联系人（按名字或电话号码）
+        
+        先在key作为电话时所属的分片上精确删除；号码不存在时按姓名在全部分片上删除。
+        """
+        count, msg = self._call(self.shard_of(key), "del_phone", key)
+        if count:
+            return count, msg
+        count = sum(deleted for deleted, _ in self._broadcast("del_contact", key))
+        if not count:
+            return 0, f"错误：未找到联系人 '{key}'"
+        return count, f"成功：已删除 {count} 个联系人"
+    
+    def del_by_name_prefix(self, name_prefix: str) -> Tuple[int, str]:
+        """删除名字以给定前缀开头的全部联系人，各分片并行删除"""
+        return self._del_prefix("del_by_name_prefix", name_prefix)
+    
+    def del_by_phone_prefix(self, phone_prefix: str) -> Tuple[int, str]:
+        """删除电话号码以给定前缀开头的全部联系人；同一号段分散在各分片，同样需要广播"""
+        return self._del_prefix("del_by_phone_prefix", phone_prefix)
+    
+    def _del_prefix(self, method: str, prefix: str) -> Tuple[int, str]:
+        results = self._broadcast(method, prefix)
+        count = sum(deleted for deleted, _ in results)
+        if not count:
+            return 0, results[0][1]
+        return count, f"成功：已删除 {count} 个联系人"
+    
+    def bulk_load(self, records: Iterable[Dict]) -> Tuple[int, str]:
+        """批量导入记录：按电话分组后各分片并行导入"""
+        groups: Dict[int, List[Dict]] = {shard: [] for shard in range(self.shards)}
+        total = 0
+        for record in records:
+            total += 1
+            phone = record.get("phone") if isinstance(record, dict) else None
+            if isinstance(phone, str):
+                groups[self.shard_of(phone)].append(record)
+        results = self._scatter({shard: [("bulk_load", (group,))] for shard, group in groups.items()})
+        count = sum(results[shard][0][0] for shard in groups)
+        msg = f"成功：已加载 {count} 个联系人到通讯录"
+        if total > count:
+            msg += f"，跳过 {total - count} 条无效或重复记录"
+        return count, msg
+    
+    # ---- 查询 ----
+    
+    def find_by_name(self, name_prefix: str, limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """按名字前缀查询，结果按名字排序"""
+        return self.find_by_name_many([name_prefix], limit, offset)[0]
+    
+    def find_by_phone(self, phone_prefix: str, limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """按电话号码前缀查询，结果按号码排序"""
+        return self.find_by_phone_many([phone_prefix], limit, offset)[0]
+    
+    def find_by_name_many(self, prefixes: List[str], limit: Optional[int] = None,
+                          offset: int = 0) -> List[List[Contact]]:
+        """一次分发多个名字前缀查询，每个分片只往返一次"""
+        return self._find_many("find_by_name", "name", prefixes, limit, offset)
+    
+    def find_by_phone_many(self, prefixes: List[str], limit: Optional[int] = None,
+                           offset: int = 0) -> List[List[Contact]]:
+        """一次分发多个电话前缀查询，每个分片只往返一次"""
+        return self._find_many("find_by_phone", "phone", prefixes, limit, offset)
+    
+    def _find_many(self, method: str, field: str, prefixes: List[str], limit: Optional[int],
+                   offset: int) -> List[List[Contact]]:
+        """各分片取前 offset+limit 条，归并后截取所需的一页"""
+        if offset < 0:
+            raise ValueError("offset 不能为负数")
+        if limit is not None and limit < 0:
+            raise ValueError("limit 不能为负数")
+        wanted = None if limit is None else offset + limit
+        batch = [(method, (prefix, wanted)) for prefix in prefixes]
+        results = self._scatter({shard: batch for shard in range(self.shards)})
+        key = attrgetter(field)
+        pages = []
+        for i in range(len(prefixes)):
+            merged = heapq.merge(*(results[shard][i] for shard in range(self.shards)), key=key)
+            pages.append(list(islice(merged, offset, wanted)))
+        return pages
+    
+    def count_by_name(self, name_prefix: str) -> int:
+        return sum(self._broadcast("count_by_name", name_prefix))
+    
+    def count_by_phone(self, phone_prefix: str) -> int:
+        return sum(self._broadcast("count_by_phone", phone_prefix))
+    
+    def list_all(self) -> List[Contact]:
+        """列出所有联系人，按分片顺序拼接"""
+        return [contact for contacts in self._broadcast("list_all") for contact in contacts]
+    
+    def __len__(self) -> int:
+        return sum(stats["total_contacts"] for stats in self._broadcast("get_stats"))
+    
+    def get_stats(self) -> Dict:
+        """汇总统计，shard_sizes 为各分片的联系人数"""
+        stats = self._broadcast("get_stats")
+        return {
+            "shards": self.shards,
+            "total_contacts": sum(s["total_contacts"] for s in stats),
+            "shard_sizes": [s["total_contacts"] for s in stats],
+        }
+    
+    def close(self):
+        """通知工作进程退出并等待结束"""
+        for conn in self.connections:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+        self.processes = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
@@ -1,181 +1,1031 @@
 """
-性能测试模块
-对比线性扫描与索引查询的性能差异
+性能基准测试模块
+可复现、可跨提交对比的基准测试：以固定随机种子生成数据，在各数据规模（默认至百万级）下
+对 ContactSystem 的各项操作、持久化与内存占用多次取样计时，结果写入JSON；
+compare 子命令对比两次结果，标出超过阈值的性能回退。
+
+用法：
+    python test_performance.py run [--scales 1000,10000,100000,1000000] [--repeat 5] [--warmup 1]
+                                   [--filter 'find_*'] [--output bench.json]
+    python test_performance.py compare base.json bench.json [--threshold 0.1]
+    python test_performance.py list
+不带参数时等同于 run。
 """
 
-import time
+import argparse
+import asyncio
+import fnmatch
+import gc
+import json
+import os
+import platform
 import random
-import string
-from contact import ContactSystem
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+from contact import ContactSystem, Contact, Trie, RadixTrie, SortedArrayIndex
+from commands import CommandExecutor
+from pinyin import to_pinyin
 
-def generate_test_data(count: int) -> list:
-    """生成测试数据"""
-    contacts = []
-    
-    # 常见姓氏
-    surnames = ["张", "王", "李", "赵", "刘", "周", "徐", "孙", "马", "何"]
-    first_names = ["三", "四", "五", "六", "七", "八", "九", "十", "明", "强"]
+
+DEFAULT_SCALES = (1000, 10000, 100000, 1000000)
+HEAVY_REPEAT = 3  # 单个样本就要处理全部数据的用例最多取样次数
+RESULT_VERSION = 1  # 结果文件格式版本
+THROUGHPUT = "ops/s"  # 以该单位登记的计时用例记录每秒操作数，数值越大越好
+
+# 数据生成用的字表；电话按与10^9互素的步长排列，互不重复且分布分散
+SURNAMES = "张王李赵刘陈杨黄周吴徐孙马朱胡郭何林罗高"
+GIVEN_NAMES = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂"
+DEPARTMENTS = [f"{prefix}{suffix}" for prefix in ("研发", "市场", "销售", "财务", "法务", "运维", "采购", "客服")
+               for suffix in ("一部", "二部", "三部", "中心", "组", "办公室")]
+CITIES = ["北京", "上海", "广州", "深圳", "杭州", "成都", "武汉", "西安"]
+PHONE_STRIDE = 387420489
+
+
+def generate_records(count: int, seed: int = 0) -> List[Dict[str, str]]:
+    """生成可复现的联系人记录
     
+    姓名为姓氏加一到两个名字用字，电话为互不相同的13开头号码，备注为 部门 城市 编号。
+    """
+    rng = random.Random(seed)
+    records = []
     for i in range(count):
-        name = random.choice(surnames) + random.choice(first_names)
-        # 生成13开头的手机号
-        phone = "13" + "".join([str(random.randint(0, 9)) for _ in range(9)])
-        remark = f"contact_{i}"
-        contacts.append((name, phone, remark))
-    
-    return contacts
-
-
-def performance_test():
-    """执行性能测试"""
-    
-    print("\n" + "="*70)
-    print(" " * 15 + "通讯录管理系统 - 性能测试报告")
-    print("="*70)
-    
-    test_sizes = [1000, 5000, 10000]
-    
-    for size in test_sizes:
-        print(f"\n【测试规模 {size}】")
-        print("-" * 70)
-        
-        # 生成测试数据
-        test_data = generate_test_data(size)
-        
-        # 测试1: 带索引的系统
-        print("\n1. 带索引系统测试 (使用Trie树+散列表)")
-        print("   " + "-" * 65)
-        
-        system_with_index = ContactSystem(use_index=True, use_phone_index=True)
-        
-        # 添加数据
-        start_time = time.time()
-        for name, phone, remark in test_data:
-            system_with_index.add_contact(name, phone, remark)
-        add_time_with_index = time.time() - start_time
-        print(f"   数据导入时间：{add_time_with_index:.4f}秒")
-        
-        # 按名字查询（前缀为单个汉字）
-        search_prefix_name = "张"
-        start_time = time.time()
-        for _ in range(100):
-            results = system_with_index.find_by_name(search_prefix_name)
-        name_search_time_with_index = (time.time() - start_time) / 100
-        count_with_index = len(system_with_index.find_by_name(search_prefix_name))
-        print(f"   按名字前缀查询 '{search_prefix_name}'（100次平均）：{name_search_time_with_index*1000:.4f}ms（找到{count_with_index}条）")
-        
-        # 按电话查询（前缀为"13"）
-        search_prefix_phone = "13"
-        start_time = time.time()
-        for _ in range(100):
-            results = system_with_index.find_by_phone(search_prefix_phone)
-        phone_search_time_with_index = (time.time() - start_time) / 100
-        count_phone = len(system_with_index.find_by_phone(search_prefix_phone))
-        print(f"   按电话前缀查询 '{search_prefix_phone}'（100次平均）：{phone_search_time_with_index*1000:.4f}ms（找到{count_phone}条）")
-        
-
-
-        # 测试2: 无索引的系统（仅链表）
-        print("\n2. 无索引系统测试 (仅双向链表线性扫描)")
-        print("   " + "-" * 65)
-        
-        system_without_index = ContactSystem(use_index=False, use_phone_index=False)
-        
-        # 添加数据
-        start_time = time.time()
-        for name, phone, remark in test_data:
-            system_without_index.add_contact(name, phone, remark)
-        add_time_without_index = time.time() - start_time
-        print(f"   数据导入时间：{add_time_without_index:.4f}秒")
-        
-        # 按名字查询（线性扫描）
-        start_time = time.time()
-        for _ in range(100):
-            results = system_without_index.find_by_name(search_prefix_name)
-        name_search_time_without_index = (time.time() - start_time) / 100
-        print(f"   按名字前缀查询 '{search_prefix_name}'（100次平均）：{name_search_time_without_index*1000:.4f}ms（找到{count_with_index}条）")
-        
-        # 按电话查询（线性扫描）
-        start_time = time.time()
-        for _ in range(100):
-            results = system_without_index.find_by_phone(search_prefix_phone)
-        phone_search_time_without_index = (time.time() - start_time) / 100
-        print(f"   按电话前缀查询 '{search_prefix_phone}'（100次平均）：{phone_search_time_without_index*1000:.4f}ms（找到{count_phone}条）")
-        
-        # 性能对比
-        print("\n3. 性能对比")
-        print("   " + "-" * 65)
-        
-        if name_search_time_without_index > 0:
-            name_speedup = name_search_time_without_index / name_search_time_with_index
-            print(f"   名字查询加速比：{name_speedup:.2f}x")
-        
-        if phone_search_time_without_index > 0:
-            phone_speedup = phone_search_time_without_index / phone_search_time_with_index
-            print(f"   电话查询加速比：{phone_speedup:.2f}x")
-        
-        print(f"\n   总结：在 {size} 条记录规模下")
-        print(f"   - 索引系统查询速度比线性扫描快")
-        print(f"   - 名字查询：{name_search_time_with_index*1000:.4f}ms vs {name_search_time_without_index*1000:.4f}ms")
-        print(f"   - 电话查询：{phone_search_time_with_index*1000:.4f}ms vs {phone_search_time_without_index*1000:.4f}ms")
-    
-    print("\n" + "="*70)
-    print("性能测试完成")
-    print("="*70 + "\n")
-
-
-def benchmark_analysis():
-    """性能分析汇总"""
-    
-    print("\n" + "="*70)
-    print(" " * 15 + "性能分析与理论复杂度")
-    print("="*70)
-    
-    analysis = """
-【复杂度分析】
-
-1. 双向链表操作：
-   - 插入（尾部）：O(1)
-   - 删除：O(n)（需遍历查找）
-   - 遍历：O(n)
-
-2. 散列表操作：
-   - 插入/查询：O(1) 平均
-   - 删除：O(1) 平均
-
-3. Trie树操作（前缀检索）：
-   - 插入：O(m)，m为字符串长度
-   - 删除：O(m)
-   - 前缀查询：O(m + k)，k为结果数量
-   - 内存占用：O(n*m)，n为条目数，m为平均字符串长度
-
-4. 线性扫描：
-   - 前缀查询：O(n)
-
-【系统设计优势】
-
-✓ 双向链表：保持插入顺序，支持快速遍历
-✓ 散列表索引：名字到联系人的快速映射
-✓ Trie树索引：支持高效的前缀查询
-✓ 混合设计：结合多种数据结构的优势
-
-【查询性能优化】
-
-- 精确查询（电话）：O(1) - 直接散列表查找
-- 前缀查询：O(m + k) 使用Trie树，vs O(n) 线性扫描
-- 在 n=10000 时，性能提升明显
-
-【持久化策略】
-
-- JSON格式存储，易于调试和备份
-- 系统启动自动加载历史数据
-- SAVE命令手动保存，支持断点恢复
-"""
-    print(analysis)
-    print("="*70 + "\n")
+        name = rng.choice(SURNAMES) + "".join(rng.choice(GIVEN_NAMES) for _ in range(rng.randint(1, 2)))
+        phone = f"13{(i * PHONE_STRIDE + seed) % 10 ** 9:09d}"
+        remark = f"{rng.choice(DEPARTMENTS)} {rng.choice(CITIES)} {i}"
+        records.append({"name": name, "phone": phone, "remark": remark})
+    return records
+
+
+class Fixture:
+    """某一数据规模下各基准共享的数据、文件与通讯录
+    
+    只读用例共用已导入数据的通讯录，按配置只保留最近一个，切换配置时释放旧的，
+    控制百万级规模下的内存占用。构建好的对象移出垃圾回收的跟踪范围（gc.freeze），
+    样本之间的完整回收不必遍历它们。
+    """
+    
+    def __init__(self, scale: int, seed: int, workdir: str):
+        self.scale = scale
+        self.seed = seed
+        self.workdir = workdir
+        self._records: Optional[List[Dict[str, str]]] = None
+        self._shared: Optional[Tuple[Any, Any, Callable]] = None  # (配置, 对象, 释放函数)
+        self._files: Dict[str, str] = {}
+    
+    @property
+    def records(self) -> List[Dict[str, str]]:
+        if self._records is None:
+            self._records = generate_records(self.scale, self.seed)
+        return self._records
+    
+    def rng(self, name: str) -> random.Random:
+        """每个用例独立的随机数序列，增删用例不影响其他用例的数据"""
+        return random.Random(f"{self.seed}:{self.scale}:{name}")
+    
+    def sample(self, name: str, k: int) -> List[Dict[str, str]]:
+        """可复现地抽取k条记录（可重复抽取）"""
+        rng = self.rng(name)
+        return [rng.choice(self.records) for _ in range(k)]
+    
+    def system(self, **options) -> ContactSystem:
+        """已导入全部记录的通讯录；options 为 ContactSystem 的参数"""
+        def build():
+            system = ContactSystem(**options)
+            system.bulk_load(self.records)
+            return system
+        return self.shared(("system", tuple(sorted(options.items()))), build, ContactSystem.close)
+    
+    def shared(self, key: Any, build: Callable[[], Any], close: Callable[[Any], None]) -> Any:
+        """按key缓存一个共享对象，key变化时先释放旧对象再构建"""
+        if self._shared is not None and self._shared[0] == key:
+            return self._shared[1]
+        self.release()
+        value = build()
+        gc.collect()
+        gc.freeze()
+        self._shared = (key, value, close)
+        return value
+    
+    def release(self):
+        """释放共享对象；解除冻结后才能回收其中的循环引用（链表节点）"""
+        if self._shared is not None:
+            _, value, close = self._shared
+            self._shared = None
+            close(value)
+            del value
+            gc.unfreeze()
+            gc.collect()
+    
+    def data_file(self, suffix: str) -> str:
+        """以给定格式保存的全部记录，首次使用时生成"""
+        path = self._files.get(suffix)
+        if path is None:
+            path = self.path(f"data{suffix}")
+            system = ContactSystem(use_index=False, use_phone_index=False, use_pinyin_index=False)
+            system.bulk_load(self.records)
+            success, msg = system.save_to_file(path)
+            if not success:
+                raise RuntimeError(msg)
+            self._files[suffix] = path
+            del system
+            gc.collect()
+        return path
+    
+    def path(self, name: str) -> str:
+        return os.path.join(self.workdir, name)
+    
+    def close(self):
+        self.release()
+        self._records = None
+
+
+@dataclass
+class Case:
+    """一个计时用例：每个样本先 setup（不计时）得到状态，再对 run(状态) 计时，最后 teardown
+    
+    ops 为 run 中的操作次数，结果按每次操作的耗时记录。
+    heavy 表示单个样本就要处理全部数据，样本数以 HEAVY_REPEAT 为上限且不预热。
+    """
+    run: Callable[[Any], Any]
+    ops: int
+    setup: Callable[[], Any] = lambda: None
+    teardown: Callable[[Any], None] = lambda state: None
+    heavy: bool = False
+
+
+@dataclass
+class Benchmark:
+    """登记的基准：make 按规模构造用例（计时）或直接返回测量值（内存、文件大小）
+    
+    计时用例默认记录每次操作的纳秒数；unit 为 THROUGHPUT 时换算为每秒操作数。
+    """
+    name: str
+    make: Callable[[Fixture], Any]
+    unit: str = "ns/op"
+    scaled: bool = True  # 与数据规模无关的用例只在最小规模下运行一次
+    max_scale: Optional[int] = None
+
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str, unit: str = "ns/op", scaled: bool = True, max_scale: Optional[int] = None):
+    """登记基准的装饰器；运行顺序即登记顺序，共用同一配置的用例应相邻登记"""
+    def register(make: Callable[[Fixture], Any]) -> Callable[[Fixture], Any]:
+        if name in BENCHMARKS:
+            raise ValueError(f"基准 '{name}' 重复登记")
+        BENCHMARKS[name] = Benchmark(name, make, unit, scaled, max_scale)
+        return make
+    return register
+
+
+# ---- 增删 ----
+
+# 用例中新增的联系人使用199号段，与生成数据的13号段不冲突，结束时按前缀一并删除
+EXTRA_PREFIX = "199"
+
+
+def _extra_phone(i: int) -> str:
+    return f"{EXTRA_PREFIX}{i:08d}"
+
+
+@benchmark("add_contact")
+def bench_add_contact(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    names = [record["name"] for record in fx.sample("add_contact", 1000)]
+    
+    def run(_):
+        for i, name in enumerate(names):
+            system.add_contact(name, _extra_phone(i), "新增")
+    return Case(run, len(names), teardown=lambda _: system.del_by_phone_prefix(EXTRA_PREFIX))
+
+
+@benchmark("del_contact")
+def bench_del_contact(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    victims = list({record["phone"]: record for record in fx.sample("del_contact", 1000)}.values())
+    
+    def run(_):
+        for record in victims:
+            system.del_contact(record["phone"])
+    
+    def teardown(_):
+        for record in victims:
+            system.add_contact(record["name"], record["phone"], record["remark"])
+    return Case(run, len(victims), teardown=teardown)
+
+
+@benchmark("del_contact.tenth")
+def bench_del_contact_tenth(fx: Fixture) -> Case:
+    """逐条删除一成联系人（百万规模即十万条），结束后批量导回"""
+    system = fx.system(cache_entries=0)
+    victims = fx.rng("del_contact.tenth").sample(fx.records, fx.scale // 10)
+    
+    def run(_):
+        for record in victims:
+            system.del_contact(record["phone"])
+    return Case(run, len(victims), teardown=lambda _: system.bulk_load(victims), heavy=True)
+
+
+@benchmark("del_by_phone_prefix")
+def bench_del_by_phone_prefix(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    count = 1000
+    
+    def setup():
+        for i in range(count):
+            system.add_contact("号段", _extra_phone(i))
+    return Case(lambda _: system.del_by_phone_prefix(EXTRA_PREFIX), count, setup)
+
+
+@benchmark("del_by_name_prefix")
+def bench_del_by_name_prefix(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    count = 1000
+    
+    def setup():
+        for i in range(count):
+            system.add_contact(f"待删{i}", _extra_phone(i))
+    return Case(lambda _: system.del_by_name_prefix("待删"), count, setup)
+
+
+# ---- 查询（关闭结果缓存，测的是索引本身） ----
+
+def _query_case(fx: Fixture, name: str, count: int, make_arg: Callable[[Dict[str, str]], Any],
+                query: Callable[[Any], Any]) -> Case:
+    """对抽样得到的count个参数依次调用query"""
+    args = [make_arg(record) for record in fx.sample(name, count)]
+    
+    def run(_):
+        for arg in args:
+            query(arg)
+    return Case(run, len(args))
+
+
+@benchmark("find_by_name")
+def bench_find_by_name(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    return _query_case(fx, "find_by_name", 200, lambda r: r["name"], lambda p: system.find_by_name(p, 20))
+
+
+@benchmark("find_by_phone")
+def bench_find_by_phone(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    return _query_case(fx, "find_by_phone", 200, lambda r: r["phone"][:7], lambda p: system.find_by_phone(p, 20))
+
+
+@benchmark("find_by_name.offset")
+def bench_find_by_name_offset(fx: Fixture) -> Case:
+    """单字姓氏前缀，跳过1%的结果后取一页（深分页）"""
+    system = fx.system(cache_entries=0)
+    return _query_case(fx, "find_by_name.offset", 200, lambda r: r["name"][0],
+                       lambda p: system.find_by_name(p, 20, fx.scale // 100))
+
+
+@benchmark("count_by_name")
+def bench_count_by_name(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    return _query_case(fx, "count_by_name", 200, lambda r: r["name"][0], system.count_by_name)
+
+
+@benchmark("count_by_phone")
+def bench_count_by_phone(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    return _query_case(fx, "count_by_phone", 200, lambda r: r["phone"][:5], system.count_by_phone)
+
+
+@benchmark("find_by_pinyin")
+def bench_find_by_pinyin(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    return _query_case(fx, "find_by_pinyin", 200, lambda r: to_pinyin(r["name"]),
+                       lambda p: system.find_by_pinyin(p, 20))
+
+
+@benchmark("find_by_initials")
+def bench_find_by_initials(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    return _query_case(fx, "find_by_initials", 200, lambda r: to_pinyin(r["name"])[0],
+                       lambda p: system.find_by_initials(p, 20))
+
+
+@benchmark("find_by_name_fuzzy")
+def bench_find_by_name_fuzzy(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    return _query_case(fx, "find_by_name_fuzzy", 50, lambda r: r["name"],
+                       lambda q: system.find_by_name_fuzzy(q, 1, 20))
+
+
+def _list_page_case(fx: Fixture, order: str, pages: int = 20, size: int = 50) -> Case:
+    """从头起沿游标连续取pages页，按每页计"""
+    system = fx.system(cache_entries=0)
+    
+    def run(_):
+        cursor = None
+        for _ in range(pages):
+            _, cursor = system.list_page(order, size, cursor)
+    return Case(run, pages)
+
+
+@benchmark("list_page.insert")
+def bench_list_page_insert(fx: Fixture) -> Case:
+    return _list_page_case(fx, "insert")
+
+
+@benchmark("list_page.name")
+def bench_list_page_name(fx: Fixture) -> Case:
+    return _list_page_case(fx, "name")
+
+
+@benchmark("list_page.phone")
+def bench_list_page_phone(fx: Fixture) -> Case:
+    return _list_page_case(fx, "phone")
+
+
+@benchmark("list_page.name.duplicates")
+def bench_list_page_duplicates(fx: Fixture) -> Case:
+    """全部联系人同名时按姓名从中间起连续取页，每页都要在同一个键的全部联系人中定位游标"""
+    def build():
+        system = ContactSystem(use_pinyin_index=False, cache_entries=0)
+        system.bulk_load({"name": "张伟", "phone": record["phone"]} for record in fx.records)
+        return system
+    system = fx.shared(("duplicates",), build, ContactSystem.close)
+    _, start = system.list_page("name", fx.scale // 2)
+    pages, size = 20, 50
+    
+    def run(_):
+        cursor = start
+        for _ in range(pages):
+            _, cursor = system.list_page("name", size, cursor)
+    return Case(run, pages)
+
+
+@benchmark("list_all")
+def bench_list_all(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    return Case(lambda _: system.list_all(), fx.scale, heavy=True)
+
+
+@benchmark("snapshot.list_all")
+def bench_snapshot_list_all(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    return Case(lambda snapshot: snapshot.list_all(), fx.scale,
+                setup=system.snapshot, teardown=lambda snapshot: snapshot.close(), heavy=True)
+
+
+@benchmark("get_stats")
+def bench_get_stats(fx: Fixture) -> Case:
+    system = fx.system(cache_entries=0)
+    
+    def run(_):
+        for _ in range(20):
+            system.get_stats()
+    return Case(run, 20)
+
+
+def _command_lines(fx: Fixture, name: str, count: int) -> List[str]:
+    """九成 FIND_PHONE、一成 ADD 的命令序列"""
+    return [f"ADD {record['name']} {_extra_phone(i)}" if i % 10 == 0 else f"FIND_PHONE {record['phone'][:7]} 10"
+            for i, record in enumerate(fx.sample(name, count))]
+
+
+@benchmark("command.execute")
+def bench_command_execute(fx: Fixture) -> Case:
+    """命令执行器（批处理与网络服务共用），含解析与JSON格式化"""
+    system = fx.system(cache_entries=0)
+    executor = CommandExecutor(system)
+    lines = _command_lines(fx, "command.execute", 2000)
+    
+    def run(_):
+        for line in lines:
+            executor.execute_json(line)
+    return Case(run, len(lines), teardown=lambda _: system.del_by_phone_prefix(EXTRA_PREFIX))
+
+
+@benchmark("server.pipeline")
+def bench_server_pipeline(fx: Fixture) -> Case:
+    """本机回环上单个连接流水线发送命令，含事件循环与客户端开销"""
+    from server import ContactServer
+    from client import ContactClient
+    
+    system = fx.system(cache_entries=0)
+    lines = _command_lines(fx, "server.pipeline", 2000)
+    
+    async def session():
+        server = ContactServer(system)
+        port = await server.start("127.0.0.1", 0)
+        client = await ContactClient.connect("127.0.0.1", port)
+        try:
+            await client.pipeline(lines)
+        finally:
+            await client.close()
+            await server.stop()
+    return Case(lambda _: asyncio.run(session()), len(lines),
+                teardown=lambda _: system.del_by_phone_prefix(EXTRA_PREFIX))
+
+
+def _server_connections_case(fx: Fixture, clients: int) -> Case:
+    """多个连接同时接入同一个服务，各自逐条请求并等待回复，统计全部连接合计的吞吐量"""
+    from server import ContactServer
+    from client import ContactClient
+    
+    system = fx.system(cache_entries=0)
+    lines = _command_lines(fx, "server.connections", 2000)
+    shares = [lines[i::clients] for i in range(clients)]
+    
+    async def converse(client, share):
+        for line in share:
+            await client.request(line)
+    
+    async def session():
+        server = ContactServer(system)
+        port = await server.start("127.0.0.1", 0)
+        connected = await asyncio.gather(*(ContactClient.connect("127.0.0.1", port) for _ in range(clients)))
+        try:
+            await asyncio.gather(*(converse(client, share) for client, share in zip(connected, shares)))
+        finally:
+            await asyncio.gather(*(client.close() for client in connected))
+            await server.stop()
+    return Case(lambda _: asyncio.run(session()), len(lines),
+                teardown=lambda _: system.del_by_phone_prefix(EXTRA_PREFIX))
+
+
+for _clients in (16, 128):
+    benchmark(f"server.connections.{_clients}", unit=THROUGHPUT)(
+        lambda fx, clients=_clients: _server_connections_case(fx, clients))
+
+
+# ---- 保存 ----
+
+def _save_case(fx: Fixture, suffix: str) -> Case:
+    system = fx.system(cache_entries=0)
+    path = fx.path(f"save{suffix}")
+    return Case(lambda _: system.save_to_file(path), fx.scale, teardown=lambda _: os.remove(path), heavy=True)
+
+
+@benchmark("save_to_file.json")
+def bench_save_json(fx: Fixture) -> Case:
+    return _save_case(fx, ".json")
+
+
+@benchmark("save_to_file.jsonl")
+def bench_save_jsonl(fx: Fixture) -> Case:
+    return _save_case(fx, ".jsonl")
+
+
+@benchmark("save_to_file.snap")
+def bench_save_snap(fx: Fixture) -> Case:
+    return _save_case(fx, ".snap")
+
+
+# ---- 结果缓存、倒排索引与无索引扫描（各自需要不同配置的通讯录） ----
+
+@benchmark("find_by_name.cached")
+def bench_find_by_name_cached(fx: Fixture) -> Case:
+    """输入联想场景：少量热点前缀反复查询，多数命中结果缓存"""
+    system = fx.system()
+    hot = [record["name"][:2] for record in fx.sample("find_by_name.cached", 20)]
+    rng = fx.rng("find_by_name.cached.queries")
+    return _query_case(fx, "find_by_name.cached", 200, lambda _: rng.choice(hot),
+                       lambda p: system.find_by_name(p, 20))
+
+
+@benchmark("find_by_phone_substring")
+def bench_find_by_phone_substring(fx: Fixture) -> Case:
+    system = fx.system(use_index=False, use_pinyin_index=False, use_phone_ngram_index=True, cache_entries=0)
+    return _query_case(fx, "find_by_phone_substring", 200, lambda r: r["phone"][-4:],
+                       lambda digits: system.find_by_phone_substring(digits, 20))
+
+
+@benchmark("find_by_remark")
+def bench_find_by_remark(fx: Fixture) -> Case:
+    system = fx.system(use_index=False, use_pinyin_index=False, use_remark_index=True, cache_entries=0)
+    return _query_case(fx, "find_by_remark", 200, lambda r: " ".join(r["remark"].split()[:2]),
+                       lambda query: system.find_by_remark(query, 20))
+
+
+def _scan_count(fx: Fixture) -> int:
+    """扫描查询的次数随规模减少，使每个样本的耗时大致相当"""
+    return max(5, min(200, 200000 // fx.scale))
+
+
+@benchmark("find_by_name.scan")
+def bench_find_by_name_scan(fx: Fixture) -> Case:
+    system = fx.system(use_index=False, use_phone_index=False, use_pinyin_index=False, cache_entries=0)
+    return _query_case(fx, "find_by_name.scan", _scan_count(fx), lambda r: r["name"], lambda p: system.find_by_name(p, 20))
+
+
+@benchmark("find_by_phone.scan")
+def bench_find_by_phone_scan(fx: Fixture) -> Case:
+    system = fx.system(use_index=False, use_phone_index=False, use_pinyin_index=False, cache_entries=0)
+    return _query_case(fx, "find_by_phone.scan", _scan_count(fx), lambda r: r["phone"][:7], lambda p: system.find_by_phone(p, 20))
+
+
+# ---- 多线程混合读写（thread_safe 的读写锁，单线程不加锁为基线） ----
+
+MIXED_READS = 500  # 每个读线程的查询次数
+MIXED_WRITES = 100  # 每个写线程新增的联系人数
+
+
+def _mixed_case(fx: Fixture, system: ContactSystem, readers: int, writers: int, threaded: bool = True) -> Case:
+    """readers个读线程交替按姓名与电话前缀查询，writers个写线程逐条新增，全部结束为一个样本
+    
+    threaded为False时在当前线程中依次执行同样的操作。
+    """
+    queries = [(record["name"], record["phone"][:7]) for record in fx.sample("threads.mixed", MIXED_READS)]
+    names = [record["name"] for record in fx.sample("threads.mixed.add", MIXED_WRITES)]
+    
+    def read():
+        for i, (name, prefix) in enumerate(queries):
+            if i % 2:
+                system.find_by_name(name, 20)
+            else:
+                system.find_by_phone(prefix, 20)
+    
+    def write(writer):
+        for i, name in enumerate(names):
+            system.add_contact(name, _extra_phone(writer * MIXED_WRITES + i))
+    
+    tasks = [read] * readers + [lambda w=w: write(w) for w in range(writers)]
+    
+    def run(_):
+        if not threaded:
+            for task in tasks:
+                task()
+            return
+        threads = [threading.Thread(target=task) for task in tasks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return Case(run, readers * MIXED_READS + writers * MIXED_WRITES,
+                teardown=lambda _: system.del_by_phone_prefix(EXTRA_PREFIX))
+
+
+@benchmark("threads.mixed.baseline", unit=THROUGHPUT)
+def bench_threads_baseline(fx: Fixture) -> Case:
+    """不加锁的通讯录上单线程依次完成4读1写的全部操作"""
+    return _mixed_case(fx, fx.system(cache_entries=0), 4, 1, threaded=False)
+
+
+@benchmark("threads.mixed.4r1w", unit=THROUGHPUT)
+def bench_threads_4r1w(fx: Fixture) -> Case:
+    return _mixed_case(fx, fx.system(cache_entries=0, thread_safe=True), 4, 1)
+
+
+@benchmark("threads.mixed.8r2w", unit=THROUGHPUT)
+def bench_threads_8r2w(fx: Fixture) -> Case:
+    return _mixed_case(fx, fx.system(cache_entries=0, thread_safe=True), 8, 2)
+
+
+def _shard_counts() -> List[int]:
+    """分片数取1、2、4……直到CPU核数（至少到2，与单进程对比跨进程的开销）"""
+    limit = max(2, os.cpu_count() or 1)
+    counts = [1]
+    while counts[-1] * 2 <= limit:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != limit:
+        counts.append(limit)
+    return counts
+
+
+def _shard_case(fx: Fixture, shards: int) -> Case:
+    """批量分发电话前缀查询，每批与每个分片只往返一次"""
+    from shard import ShardedContactSystem
+    
+    def build():
+        sharded = ShardedContactSystem(shards, use_pinyin_index=False, cache_entries=0)
+        sharded.bulk_load(fx.records)
+        return sharded
+    sharded = fx.shared(("shard", shards), build, ShardedContactSystem.close)
+    prefixes = [record["phone"][:7] for record in fx.sample("shard.find_by_phone_many", 1000)]
+    return Case(lambda _: sharded.find_by_phone_many(prefixes, 10), len(prefixes))
+
+
+for _shards in _shard_counts():
+    benchmark(f"shard.find_by_phone_many.{_shards}", unit=THROUGHPUT)(
+        lambda fx, shards=_shards: _shard_case(fx, shards))
+
+
+# ---- 导入、加载与启动（不使用共享通讯录） ----
+
+@benchmark("bulk_load")
+def bench_bulk_load(fx: Fixture) -> Case:
+    fx.release()
+    return Case(lambda system: system.bulk_load(fx.records), fx.scale,
+                setup=ContactSystem, heavy=True)
+
+
+@benchmark("build_indexes")
+def bench_build_indexes(fx: Fixture) -> Case:
+    def setup():
+        system = ContactSystem(index_mode="lazy")
+        system.bulk_load(fx.records)
+        return system
+    return Case(lambda system: system.build_indexes(), fx.scale, setup, heavy=True)
+
+
+def _load_case(fx: Fixture, suffix: str) -> Case:
+    """解析文件并构建全部索引"""
+    path = fx.data_file(suffix)
+    return Case(lambda system: system.load_from_file(path), fx.scale,
+                setup=ContactSystem, teardown=ContactSystem.close, heavy=True)
+
+
+@benchmark("load_from_file.json")
+def bench_load_json(fx: Fixture) -> Case:
+    return _load_case(fx, ".json")
+
+
+@benchmark("load_from_file.jsonl")
+def bench_load_jsonl(fx: Fixture) -> Case:
+    return _load_case(fx, ".jsonl")
+
+
+@benchmark("open_mapped.snap")
+def bench_open_mapped(fx: Fixture) -> Case:
+    """映射二进制快照并完成一次前缀查询（启动到可查询的耗时）"""
+    path = fx.data_file(".snap")
+    prefix = fx.sample("open_mapped.snap", 1)[0]["phone"][:7]
+    
+    def run(system):
+        system.load_from_file(path)
+        system.find_by_phone(prefix, 20)
+    return Case(run, 1, setup=ContactSystem, teardown=ContactSystem.close)
+
+
+@benchmark("add_contact.durable", scaled=False)
+def bench_add_durable(fx: Fixture) -> Case:
+    """持久模式下逐条新增，每条日志fsync一次（受磁盘影响较大）"""
+    data_file = fx.path("durable.json")
+    count = 200
+    
+    def run(system):
+        for i in range(count):
+            system.add_contact("持久", _extra_phone(i))
+    
+    def teardown(system):
+        system.close()
+        os.remove(system.wal_file)
+    return Case(run, count, setup=lambda: ContactSystem(data_file=data_file, durable=True), teardown=teardown)
+
+
+@benchmark("replay_wal", scaled=False)
+def bench_replay_wal(fx: Fixture) -> Case:
+    """启动时重放预写日志：2000条新增，其中每4条删除1条"""
+    data_file = fx.path("replay.json")
+    writer = ContactSystem(data_file=data_file, durable=True, fsync_every=1000)
+    for i in range(2000):
+        writer.add_contact("重放", _extra_phone(i))
+        if i % 4 == 3:
+            writer.del_contact(_extra_phone(i))
+    writer.close()
+    with open(writer.wal_file, encoding="utf-8") as f:
+        records = sum(1 for _ in f)
+    return Case(lambda system: system.replay_wal(), records,
+                setup=lambda: ContactSystem(data_file=data_file, durable=True), teardown=ContactSystem.close)
+
+
+@benchmark("file.json", unit="B/contact")
+def bench_file_json(fx: Fixture) -> float:
+    return os.path.getsize(fx.data_file(".json")) / fx.scale
+
+
+@benchmark("file.jsonl", unit="B/contact")
+def bench_file_jsonl(fx: Fixture) -> float:
+    return os.path.getsize(fx.data_file(".jsonl")) / fx.scale
+
+
+@benchmark("file.snap", unit="B/contact")
+def bench_file_snap(fx: Fixture) -> float:
+    return os.path.getsize(fx.data_file(".snap")) / fx.scale
+
+
+# ---- 内存占用（tracemalloc，每条联系人的字节数） ----
+
+def _traced(build: Callable[[], Any]) -> int:
+    """构建对象期间新分配且仍存活的字节数"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        value = build()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del value
+    gc.collect()
+    return current
+
+
+def _system_memory(fx: Fixture, **options) -> float:
+    """从JSON Lines文件加载全部记录的通讯录
+    
+    在计量范围内解码文件，姓名与备注都是新建的字符串，与实际启动一致；
+    若复用内存中的记录，字符串早已存在，紧凑模式的驻留也就省不下什么。
+    """
+    fx.release()
+    path = fx.data_file(".jsonl")
+    
+    def build():
+        system = ContactSystem(**options)
+        count, msg = system.load_from_file(path)
+        if count != fx.scale:
+            raise RuntimeError(msg)
+        return system
+    return _traced(build) / fx.scale
+
+
+@benchmark("memory.system", unit="B/contact")
+def bench_memory_system(fx: Fixture) -> float:
+    """默认配置：链表、散列表、姓名/电话/拼音索引"""
+    return _system_memory(fx)
+
+
+@benchmark("memory.system.compact", unit="B/contact")
+def bench_memory_compact(fx: Fixture) -> float:
+    return _system_memory(fx, compact=True)
+
+
+@benchmark("memory.system.unindexed", unit="B/contact")
+def bench_memory_unindexed(fx: Fixture) -> float:
+    return _system_memory(fx, use_index=False, use_phone_index=False, use_pinyin_index=False)
+
+
+def _index_memory(fx: Fixture, index_class: type) -> float:
+    """电话索引本身的内存（联系人对象在计量开始前已创建）"""
+    fx.release()
+    contacts = sorted((Contact(r["name"], r["phone"], r["remark"]) for r in fx.records), key=lambda c: c.phone)
+    
+    def build():
+        index = index_class()
+        index.bulk_insert((contact.phone, (contact,)) for contact in contacts)
+        return index
+    return _traced(build) / fx.scale
+
+
+@benchmark("memory.index.trie", unit="B/contact")
+def bench_memory_trie(fx: Fixture) -> float:
+    return _index_memory(fx, Trie)
+
+
+@benchmark("memory.index.radix", unit="B/contact")
+def bench_memory_radix(fx: Fixture) -> float:
+    return _index_memory(fx, RadixTrie)
+
+
+@benchmark("memory.index.sorted", unit="B/contact")
+def bench_memory_sorted(fx: Fixture) -> float:
+    return _index_memory(fx, SortedArrayIndex)
+
+
+# ---- 运行与记录 ----
+
+def measure(case: Case, repeat: int, warmup: int) -> List[float]:
+    """按用例取样，返回每个样本中平均每次操作的纳秒数
+    
+    与timeit一致，计时期间暂停循环垃圾回收；每个样本开始前先做一次完整回收。
+    """
+    if case.heavy:
+        repeat, warmup = min(repeat, HEAVY_REPEAT), 0
+    samples = []
+    for i in range(warmup + repeat):
+        state = case.setup()
+        gc.collect()
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter_ns()
+            case.run(state)
+            elapsed = time.perf_counter_ns() - start
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        case.teardown(state)
+        del state
+        if i >= warmup:
+            samples.append(elapsed / case.ops)
+    return samples
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """样本统计；value 取中位数，用于对比"""
+    return {
+        "value": statistics.median(samples),
+        "min": min(samples),
+        "mean": statistics.fmean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+
+def result_key(name: str, scale: Optional[int]) -> str:
+    return name if scale is None else f"{name}@{scale}"
+
+
+def format_value(value: float, unit: str) -> str:
+    """按量级格式化测量值"""
+    if unit != "ns/op":
+        return f"{value:,.1f} {unit}"
+    for limit, suffix, divisor in ((1e3, "ns", 1), (1e6, "µs", 1e3), (1e9, "ms", 1e6)):
+        if value < limit:
+            return f"{value / divisor:.2f}{suffix}/op"
+    return f"{value / 1e9:.3f}s/op"
+
+
+def select(pattern: Optional[str]) -> List[Benchmark]:
+    """按通配符（逗号分隔多个）筛选基准，保持登记顺序"""
+    if not pattern:
+        return list(BENCHMARKS.values())
+    patterns = pattern.split(",")
+    return [bench for bench in BENCHMARKS.values()
+            if any(fnmatch.fnmatchcase(bench.name, p) for p in patterns)]
+
+
+def run_suite(scales: List[int], repeat: int = 5, warmup: int = 1, pattern: Optional[str] = None,
+              seed: int = 0, log: Callable[[str], None] = print) -> Dict:
+    """在各规模下运行选中的基准，返回可写入JSON的结果"""
+    if repeat < 1 or warmup < 0:
+        raise ValueError("repeat 必须为正整数，warmup 不能为负数")
+    benchmarks = select(pattern)
+    results: Dict[str, Dict] = {}
+    workdir = tempfile.mkdtemp(prefix="contact-bench-")
+    try:
+        for scale in sorted(scales):
+            fx = Fixture(scale, seed, workdir)
+            log(f"== 规模 {scale} ==")
+            try:
+                for bench in benchmarks:
+                    if bench.max_scale is not None and scale > bench.max_scale:
+                        continue
+                    if not bench.scaled and scale != min(scales):
+                        continue
+                    entry = {"name": bench.name, "scale": scale if bench.scaled else None, "unit": bench.unit}
+                    made = bench.make(fx)
+                    if isinstance(made, Case):
+                        samples = measure(made, repeat, warmup)
+                        if bench.unit == THROUGHPUT:
+                            samples = [1e9 / sample for sample in samples]
+                        entry.update(ops=made.ops, samples=samples, **summarize(samples))
+                        spread = f"，离散 {entry['stdev'] / entry['value']:.0%}" if entry["value"] else ""
+                        detail = f"（{len(samples)} 个样本{spread}）"
+                    else:
+                        entry["value"] = made
+                        detail = ""
+                    key = result_key(bench.name, entry["scale"])
+                    results[key] = entry
+                    log(f"  {key:<36s} {format_value(entry['value'], bench.unit)}{detail}")
+            finally:
+                fx.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"version": RESULT_VERSION, "meta": environment(scales, repeat, warmup, seed), "results": results}
+
+
+def environment(scales: List[int], repeat: int, warmup: int, seed: int) -> Dict:
+    """记录运行环境与参数，便于判断两次结果是否可比"""
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, timeout=10,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scales": sorted(scales),
+        "repeat": repeat,
+        "warmup": warmup,
+        "seed": seed,
+    }
+
+
+def compare(base: Dict, new: Dict, threshold: float = 0.1) -> Tuple[List[Dict], List[Dict]]:
+    """对比两次结果，返回 (逐项对比, 回退项)
+    
+    比值按耗时计：各项数值越小越好，吞吐量（THROUGHPUT）取倒数；
+    比值超过 1 + threshold 为回退，低于 1 - threshold 为提升。只在一方出现的项不参与对比。
+    """
+    rows = []
+    for key, old in base["results"].items():
+        current = new["results"].get(key)
+        if current is None:
+            continue
+        base_value, new_value = old["value"], current["value"]
+        if old["unit"] == THROUGHPUT:
+            base_value, new_value = new_value, base_value
+        if base_value:
+            ratio = new_value / base_value
+        else:
+            ratio = float("inf") if new_value else 1.0
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 - threshold:
+            status = "improvement"
+        else:
+            status = "same"
+        rows.append({"key": key, "unit": old["unit"], "base": old["value"], "new": current["value"],
+                     "ratio": ratio, "status": status})
+    return rows, [row for row in rows if row["status"] == "regression"]
+
+
+def load_results(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        results = json.load(f)
+    if results.get("version") != RESULT_VERSION:
+        raise ValueError(f"{path} 的结果格式版本为 {results.get('version')}，需要 {RESULT_VERSION}")
+    return results
+
+
+def print_comparison(base: Dict, new: Dict, rows: List[Dict], threshold: float):
+    """打印对比表，只列出变化超过阈值的项，末尾汇总"""
+    labels = {"regression": "回退", "improvement": "提升"}
+    print(f"基准：{base['meta'].get('commit')}（{base['meta'].get('created')}）  "
+          f"对比：{new['meta'].get('commit')}（{new['meta'].get('created')}）  阈值 ±{threshold:.0%}")
+    for key in ("python", "platform", "cpu_count", "seed"):
+        if base["meta"].get(key) != new["meta"].get(key):
+            print(f"注意：两次运行的 {key} 不同（{base['meta'].get(key)} / {new['meta'].get(key)}），结果可能不可比")
+    for row in rows:
+        if row["status"] != "same":
+            print(f"  {labels[row['status']]}  {row['key']:<36s} {format_value(row['base'], row['unit']):>16s} -> "
+                  f"{format_value(row['new'], row['unit']):>16s}  {row['ratio'] - 1:+.1%}")
+    counts = {status: sum(1 for row in rows if row["status"] == status)
+              for status in ("regression", "improvement", "same")}
+    missing = set(base["results"]) ^ set(new["results"])
+    print(f"共对比 {len(rows)} 项：回退 {counts['regression']}，提升 {counts['improvement']}，"
+          f"持平 {counts['same']}" + (f"；{len(missing)} 项只在一方出现" if missing else ""))
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="通讯录系统性能基准测试")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    run = commands.add_parser("run", help="运行基准并写出JSON结果")
+    run.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)),
+                     help=f"逗号分隔的数据规模（默认 {','.join(map(str, DEFAULT_SCALES))}）")
+    run.add_argument("--repeat", type=int, default=5, help="每个用例的计时样本数（默认 5）")
+    run.add_argument("--warmup", type=int, default=1, help="每个用例正式取样前的预热次数（默认 1）")
+    run.add_argument("--filter", help="只运行名称匹配的基准，支持通配符，多个以逗号分隔（如 'find_*,bulk_load'）")
+    run.add_argument("--seed", type=int, default=0, help="数据生成的随机种子（默认 0）")
+    run.add_argument("--output", default="bench.json", help="结果文件（默认 bench.json）")
+    
+    cmp = commands.add_parser("compare", help="对比两次结果，有回退时退出码为1")
+    cmp.add_argument("base", help="基准结果文件")
+    cmp.add_argument("new", help="待对比的结果文件")
+    cmp.add_argument("--threshold", type=float, default=0.1, help="判定回退的相对变化阈值（默认 0.1，即10%%）")
+    
+    commands.add_parser("list", help="列出已登记的基准")
+    argv = sys.argv[1:] if argv is None else argv
+    return parser.parse_args(argv or ["run"])  # 不带参数时按默认参数运行
+
+
+def main(argv=None) -> int:
+    """主函数，返回退出码"""
+    args = parse_args(argv)
+    if args.command == "list":
+        for bench in BENCHMARKS.values():
+            if not bench.scaled:
+                limit = "，只在最小规模下运行"
+            elif bench.max_scale:
+                limit = f"，规模上限 {bench.max_scale}"
+            else:
+                limit = ""
+            print(f"{bench.name:<32s} {bench.unit}{limit}")
+        return 0
+    
+    if args.command == "compare":
+        base, new = load_results(args.base), load_results(args.new)
+        rows, regressions = compare(base, new, args.threshold)
+        print_comparison(base, new, rows, args.threshold)
+        return 1 if regressions else 0
+    
+    try:
+        scales = [int(scale) for scale in args.scales.split(",") if scale]
+    except ValueError:
+        scales = []
+    if not scales or min(scales) < 1:
+        raise SystemExit("--scales 须为逗号分隔的正整数")
+    if not select(args.filter):
+        raise SystemExit(f"没有名称匹配 '{args.filter}' 的基准，可用 list 查看")
+    results = run_suite(scales, args.repeat, args.warmup, args.filter, args.seed)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+    print(f"结果已写入 {args.output}（{len(results['results'])} 项）")
+    return 0
 
 
 if __name__ == "__main__":
-    performance_test()
-    benchmark_analysis()
+    sys.exit(main())
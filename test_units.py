@@ -4,8 +4,25 @@
 """
 
 import unittest
+import io
+import asyncio
+import gc
 import os
-from contact import ContactSystem, Contact, Trie
+import pickle
+import json
+import random
+import threading
+import sys
+import time
+from contextlib import redirect_stdout
+from itertools import islice
+from contact import ContactSystem, Contact, _reserve_ids, Trie, RadixTrie, SortedArrayIndex, AdaptiveIndex, PrefixCache, RWLock
+from pinyin import to_pinyin, to_initials, normalize_query
+from commands import CommandExecutor, format_tsv
+from cli import ContactCommandInterface, parse_args
+from server import ContactServer
+from client import ContactClient
+from shard import ShardedContactSystem
 
 
 class TestContact(unittest.TestCase):
@@ -17,6 +34,47 @@ class TestContact(unittest.TestCase):
         self.assertEqual(contact.name, "张三")
         self.assertEqual(contact.phone, "13800000001")
         self.assertEqual(contact.remark, "工作")
+    
+    def test_contact_ids_are_unique(self):
+        """测试字段相同的联系人拥有不同编号"""
+        a = Contact("张三", "13800000001")
+        b = Contact("张三", "13800000001")
+        self.assertEqual(a, b)
+        self.assertNotEqual(a.id, b.id)
+    
+    def test_reserved_ids_not_reused(self):
+        """测试其他线程同时创建联系人时，预留的编号段连续且不会再分配给新联系人"""
+        created = []
+        stop = threading.Event()
+        
+        def create():
+            while not stop.is_set():
+                created.extend(Contact("张三", "13800000001").id for _ in range(100))
+        workers = [threading.Thread(target=create) for _ in range(4)]
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # 频繁切换线程，让取号与预留交错
+        for worker in workers:
+            worker.start()
+        try:
+            firsts = [_reserve_ids(10) for _ in range(20000)]
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+            sys.setswitchinterval(interval)
+        reserved = [first + i for first in firsts for i in range(10)]
+        self.assertEqual(len(set(reserved)), len(reserved))
+        self.assertFalse(set(reserved) & set(created))
+        self.assertEqual(len(set(created)), len(created))
+        self.assertGreater(Contact("张三", "13800000001").id, max(reserved))
+    
+    def test_contact_slots_and_pickle(self):
+        """测试联系人不带实例字典，序列化后字段与编号不变"""
+        contact = Contact("张三", "13800000001", "工作")
+        self.assertFalse(hasattr(contact, "__dict__"))
+        copy = pickle.loads(pickle.dumps(contact))
+        self.assertEqual((copy, copy.id), (contact, contact.id))
+        self.assertNotEqual(contact, Contact("张三", "13800000001"))
 
 
 class TestContactSystem(unittest.TestCase):
@@ -31,8 +89,9 @@ class TestContactSystem(unittest.TestCase):
     
     def tearDown(self):
         """清理测试环境"""
-        if os.path.exists("contacts.json"):
-            os.remove("contacts.json")
+        for path in ("contacts.json", "contacts.jsonl"):
+            if os.path.exists(path):
+                os.remove(path)
     
     def test_add_contact(self):
         """测试添加联系人"""
@@ -71,6 +130,25 @@ class TestContactSystem(unittest.TestCase):
         self.assertEqual(count, 2)
         self.assertEqual(self.system.size, 0)
     
+    def test_delete_keeps_list_consistent(self):
+        """测试删除中间节点后链表与索引保持一致"""
+        self.system.add_contact("张三", "13800000001")
+        self.system.add_contact("李四", "13800000002")
+        self.system.add_contact("张三", "13800000003")
+        
+        count, _ = self.system.del_contact("13800000002")
+        self.assertEqual(count, 1)
+        self.assertEqual([c.phone for c in self.system.list_all()],
+                         ["13800000001", "13800000003"])
+        self.assertNotIn("13800000002", self.system.node_map)
+        
+        count, _ = self.system.del_contact("张三")
+        self.assertEqual(count, 2)
+        self.assertIsNone(self.system.head)
+        self.assertIsNone(self.system.tail)
+        self.assertEqual(self.system.node_map, {})
+        self.assertNotIn("张三", self.system.name_hash)
+    
     def test_delete_nonexistent(self):
         """测试删除不存在的联系人"""
         count, msg = self.system.del_contact("13800000001")
@@ -99,6 +177,131 @@ class TestContactSystem(unittest.TestCase):
         results = self.system.find_by_phone("139")
         self.assertEqual(len(results), 1)
     
+    def test_find_by_name_paginated(self):
+        """测试名字前缀分页查询"""
+        for i in range(5):
+            self.system.add_contact("张三", f"1380000000{i}")
+        self.system.add_contact("张四", "13900000000")
+        
+        page, cursor = self.system.find_by_name_page("张", 4)
+        self.assertEqual(len(page), 4)
+        self.assertIsNotNone(cursor)
+        rest = self.system.find_by_name("张", cursor=cursor)
+        self.assertEqual([c.phone for c in rest], ["13800000004", "13900000000"])
+        self.assertEqual(len(self.system.find_by_name("张", limit=2, offset=5)), 1)
+    
+    def test_cursor_after_earlier_delete(self):
+        """测试翻页之间删除同键下已返回的联系人，下一页不漏掉结果"""
+        for index_type in ContactSystem.INDEX_TYPES:
+            for use_index in (True, False):
+                system = ContactSystem(use_index=use_index, name_index_type=index_type)
+                for i in range(4):
+                    system.add_contact("张三", f"1380000000{i}")
+                page, cursor = system.find_by_name_page("张三", 2)
+                self.assertEqual([c.phone for c in page], ["13800000000", "13800000001"])
+                system.del_contact("13800000000")
+                rest = system.find_by_name("张三", cursor=cursor)
+                self.assertEqual([c.phone for c in rest], ["13800000002", "13800000003"], (index_type, use_index))
+    
+    def test_find_by_name_fuzzy(self):
+        """测试容错姓名查询：替换、插入、删除各算一处编辑，结果按距离排序"""
+        self.system.add_contact("张三", "13800000001")
+        self.system.add_contact("张三丰", "13800000002")
+        self.system.add_contact("张山", "13800000003")
+        self.system.add_contact("李四", "13800000004")
+        
+        results = self.system.find_by_name_fuzzy("张山")
+        self.assertEqual([c.name for c in results], ["张山", "张三"])
+        results = self.system.find_by_name_fuzzy("张山", 2)
+        self.assertEqual([c.name for c in results][:2], ["张山", "张三"])
+        self.assertEqual(sorted(c.name for c in results[2:]), sorted(["张三丰", "李四"]))
+        self.assertEqual(self.system.find_by_name_fuzzy("张", 0), [])
+        self.assertEqual(len(self.system.find_by_name_fuzzy("张三", 1, limit=2)), 2)
+        
+        plain = ContactSystem(use_index=False, use_phone_index=False)
+        for contact in self.system.list_all():
+            plain.add_contact(contact.name, contact.phone)
+        for query, max_edits in [("张山", 1), ("三丰", 1), ("李三", 2)]:
+            self.assertEqual([c.phone for c in plain.find_by_name_fuzzy(query, max_edits)],
+                             [c.phone for c in self.system.find_by_name_fuzzy(query, max_edits)])
+        with self.assertRaises(ValueError):
+            self.system.find_by_name_fuzzy("张三", -1)
+    
+    def test_find_by_phone_substring(self):
+        """测试号码子串查询：n元组索引与逐条扫描结果一致，并随删除同步"""
+        indexed = ContactSystem(use_phone_ngram_index=True)
+        for system in (self.system, indexed):
+            system.add_contact("张三", "13988880001")
+            system.add_contact("李四", "13800001234")
+            system.add_contact("王五", "18888881234")
+            system.add_contact("赵六", "88")
+        
+        for system in (self.system, indexed):
+            self.assertEqual([c.name for c in system.find_by_phone_substring("8888")], ["张三", "王五"])
+            self.assertEqual([c.name for c in system.find_by_phone_substring("1234")], ["李四", "王五"])
+            self.assertEqual([c.name for c in system.find_by_phone_substring("88", limit=1)], ["张三"])
+            self.assertEqual(system.find_by_phone_substring("8808"), [])
+            system.del_contact("王五")
+            self.assertEqual([c.name for c in system.find_by_phone_substring("1234")], ["李四"])
+        self.assertEqual(len(indexed.phone_grams.postings["880"]), 1)
+    
+    def test_find_by_remark(self):
+        """测试备注全文检索：多词AND、大小写不敏感、单字查询，索引随删除同步"""
+        indexed = ContactSystem(use_remark_index=True)
+        for system in (self.system, indexed):
+            system.add_contact("张三", "13800000001", "研发部 北京")
+            system.add_contact("李四", "13800000002", "市场部 上海")
+            system.add_contact("王五", "13800000003", "研发部 上海 VIP")
+            system.add_contact("赵六", "13800000004", "研")
+        
+        for system in (self.system, indexed):
+            self.assertEqual([c.name for c in system.find_by_remark("研发部")], ["张三", "王五"])
+            self.assertEqual([c.name for c in system.find_by_remark("研发 上海")], ["王五"])
+            self.assertEqual([c.name for c in system.find_by_remark("vip")], ["王五"])
+            self.assertEqual([c.name for c in system.find_by_remark("研")], ["张三", "王五", "赵六"])
+            self.assertEqual([c.name for c in system.find_by_remark("上海", limit=1)], ["李四"])
+            self.assertEqual(system.find_by_remark("研发 广州"), [])
+            system.del_contact("王五")
+            self.assertEqual([c.name for c in system.find_by_remark("上海")], ["李四"])
+        self.assertNotIn("vi", indexed.remark_grams.postings)
+    
+    def test_find_by_pinyin(self):
+        """测试按全拼与首字母前缀查询，删除后索引同步"""
+        self.system.add_contact("张三", "13800000001")
+        self.system.add_contact("章散", "13800000002")
+        self.system.add_contact("曾小明", "13800000003")
+        self.system.add_contact("李四", "13800000004")
+        
+        self.assertEqual([c.name for c in self.system.find_by_pinyin("zhangs")], ["张三", "章散"])
+        self.assertEqual([c.name for c in self.system.find_by_pinyin("Zeng Xiao")], ["曾小明"])
+        self.assertEqual([c.name for c in self.system.find_by_initials("zs")], ["张三", "章散"])
+        page, cursor = self.system.find_by_initials_page("z", 2)
+        self.assertEqual(len(page), 2)
+        self.assertEqual([c.name for c in self.system.find_by_initials("z", cursor=cursor)], ["曾小明"])
+        
+        self.system.del_contact("张三")
+        self.assertEqual([c.name for c in self.system.find_by_pinyin("zhang")], ["章散"])
+        self.assertEqual(self.system.pinyin_trie.count_prefix(""), 3)
+        
+        plain = ContactSystem(use_pinyin_index=False)
+        for contact in self.system.list_all():
+            plain.add_contact(contact.name, contact.phone)
+        for prefix in ("z", "zx", "li"):
+            self.assertEqual(plain.find_by_initials(prefix), self.system.find_by_initials(prefix))
+            self.assertEqual(plain.find_by_pinyin(prefix), self.system.find_by_pinyin(prefix))
+    
+    def test_count_by_prefix(self):
+        """测试前缀计数"""
+        self.system.add_contact("张三", "13800000001")
+        self.system.add_contact("张四", "13800000002")
+        self.system.add_contact("李五", "13900000001")
+        self.assertEqual(self.system.count_by_name("张"), 2)
+        self.assertEqual(self.system.count_by_phone("13"), 3)
+        self.system.del_contact("张三")
+        self.assertEqual(self.system.count_by_name("张"), 1)
+        self.assertEqual(self.system.count_by_phone("138"), 1)
+        self.assertEqual(self.system.count_by_name(""), 0)
+    
     def test_list_all(self):
         """测试列出所有联系人"""
         self.system.add_contact("张三", "13800000001")
@@ -126,6 +329,67 @@ class TestContactSystem(unittest.TestCase):
         all_contacts = new_system.list_all()
         self.assertEqual(len(all_contacts), 2)
     
+    def test_bulk_load(self):
+        """测试批量导入：去重、跳过无效记录，索引与逐条添加一致"""
+        self.system.add_contact("张三", "13800000001")
+        records = [
+            {"name": "张四", "phone": "13800000003", "remark": "工作"},
+            {"name": "张三", "phone": "13800000002"},
+            {"name": "李五", "phone": "13800000001"},  # 与已有号码重复
+            {"name": "王六", "phone": "13800000002"},  # 批内重复
+            {"name": "", "phone": "13800000004"},
+            {"name": "赵七", "phone": 13800000005},
+        ]
+        count, msg = self.system.bulk_load(records)
+        self.assertEqual(count, 2)
+        self.assertIn("跳过 4 条", msg)
+        self.assertEqual(self.system.size, 3)
+        self.assertEqual([c.phone for c in self.system.list_all()],
+                         ["13800000001", "13800000003", "13800000002"])
+        self.assertEqual([c.phone for c in self.system.find_by_name("张")],
+                         ["13800000001", "13800000002", "13800000003"])
+        self.assertEqual(self.system.count_by_phone("138"), 3)
+        self.assertEqual(self.system.phone_trie.root.count, 3)
+        
+        count, _ = self.system.del_contact("张三")
+        self.assertEqual(count, 2)
+        self.assertEqual(self.system.count_by_name("张"), 1)
+    
+    def test_save_and_load_jsonl(self):
+        """测试JSON Lines格式逐行保存与加载"""
+        self.system.add_contact("张三", "13800000001", "工作\n备注")
+        self.system.add_contact("李四", "13800000002")
+        
+        success, _ = self.system.save_to_file("contacts.jsonl")
+        self.assertTrue(success)
+        with open("contacts.jsonl", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        
+        new_system = ContactSystem(data_file="contacts.jsonl")
+        count, _ = new_system.load_from_file()
+        self.assertEqual(count, 2)
+        self.assertEqual(new_system.list_all()[0].remark, "工作\n备注")
+    
+    def test_load_legacy_array_format(self):
+        """测试旧版带缩进的JSON数组文件仍可导入"""
+        with open("contacts.json", "w", encoding="utf-8") as f:
+            json.dump([{"name": "张三", "phone": "13800000001", "remark": "工作"}],
+                      f, ensure_ascii=False, indent=2)
+        count, _ = self.system.load_from_file()
+        self.assertEqual(count, 1)
+        self.assertEqual(self.system.find_by_phone("138")[0].remark, "工作")
+    
+    def test_load_jsonl_with_bad_line(self):
+        """测试JSON Lines中途出错时保留已导入的记录并保持索引一致"""
+        with open("contacts.jsonl", "w", encoding="utf-8") as f:
+            f.write('{"name": "张三", "phone": "13800000001"}\n\n')
+            f.write('{"name": "李四", "phone": \n')
+        count, msg = self.system.load_from_file("contacts.jsonl")
+        self.assertEqual(count, 1)
+        self.assertIn("第 3 行", msg)
+        self.assertEqual(self.system.count_by_name("张"), 1)
+    
     def test_system_stats(self):
         """测试系统统计"""
         self.system.add_contact("张三", "13800000001")
@@ -134,6 +398,347 @@ class TestContactSystem(unittest.TestCase):
         stats = self.system.get_stats()
         self.assertEqual(stats["total_contacts"], 2)
         self.assertEqual(stats["unique_names"], 2)
+        self.assertGreater(stats["bytes_per_contact"], 0)
+    
+    def test_lazy_index_built_on_first_query(self):
+        """测试lazy模式下增删不建索引，首次前缀查询时构建"""
+        system = ContactSystem(index_mode="lazy")
+        system.add_contact("张三", "13800000001")
+        system.add_contact("张四", "13800000002")
+        system.del_contact("13800000002")
+        self.assertEqual(system.get_stats()["index_state"], "pending")
+        self.assertEqual(system.name_trie.count_prefix(""), 0)
+        
+        self.assertEqual([c.phone for c in system.find_by_name("张")], ["13800000001"])
+        stats = system.get_stats()
+        self.assertEqual(stats["index_state"], "ready")
+        self.assertIsNotNone(stats["index_build_seconds"])
+        system.add_contact("张五", "13800000003")
+        self.assertEqual(system.count_by_phone("138"), 2)
+    
+    def join_index_builder(self):
+        """等待后台索引构建线程结束"""
+        for thread in threading.enumerate():
+            if thread.name == "contact-index-builder":
+                thread.join()
+    
+    def test_index_backlog_applied_after_build(self):
+        """测试后台构建期间的增删在构建完成后补入索引，期间查询回退扫描"""
+        system = ContactSystem(index_mode="background")
+        for i in range(50):
+            system.add_contact(f"张{i}", f"138{i:08d}")
+        
+        # 让构建线程取得快照后停在建树之前
+        started, release = threading.Event(), threading.Event()
+        new_indexes = system._new_indexes
+        def gated():
+            started.set()
+            release.wait(5)
+            return new_indexes()
+        system._new_indexes = gated
+        
+        count, _ = system.load_from_file("no_such_file.json")
+        self.assertEqual(count, 0)
+        self.assertTrue(started.wait(5))
+        self.assertEqual(system.index_state, "building")
+        system.add_contact("李四", "13900000001")
+        system.del_contact("13800000000")
+        self.assertEqual(len(system.find_by_name("张")), 49)
+        self.assertEqual(system.count_by_phone("139"), 1)
+        
+        release.set()
+        self.join_index_builder()
+        self.assertEqual(system.index_state, "ready")
+        self.assertEqual(system.name_trie.count_prefix("张"), 49)
+        self.assertEqual(system.phone_trie.count_prefix("139"), 1)
+        self.assertEqual(system.name_trie.count_prefix(""), system.size)
+    
+    def test_background_index_after_load(self):
+        """测试background模式在加载后由后台线程建好索引"""
+        self.system.add_contact("张三", "13800000001")
+        self.system.save_to_file()
+        system = ContactSystem(index_mode="background")
+        system.load_from_file()
+        self.join_index_builder()
+        self.assertEqual(system.index_state, "ready")
+        self.assertEqual(system.phone_trie.count_prefix("138"), 1)
+    
+    def test_background_index_without_snapshot(self):
+        """测试快照缺失只有日志、或快照为映射的二进制文件时，background模式同样建好索引"""
+        files = ["background_test.json", "background_test.wal", "background_test.snap"]
+        try:
+            durable = ContactSystem(data_file="background_test.json", durable=True)
+            durable.add_contact("张三", "13800000001")
+            durable.close()
+            system = ContactSystem(data_file="background_test.json", durable=True, index_mode="background")
+            self.assertEqual(system.load_from_file()[0], 1)
+            self.join_index_builder()
+            self.assertEqual(system.index_state, "ready")
+            self.assertEqual(system.name_trie.count_prefix("张"), 1)
+            system.save_to_file("background_test.snap")
+            system.close()
+            
+            mapped = ContactSystem(index_mode="background")
+            mapped.load_from_file("background_test.snap")
+            self.assertIsNotNone(mapped.mapped)
+            mapped.add_contact("李四", "13900000001")
+            self.join_index_builder()
+            self.assertEqual(mapped.index_state, "ready")
+            self.assertEqual(mapped.name_trie.count_prefix(""), 2)
+            mapped.close()
+        finally:
+            for path in files:
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    def test_compact_mode_shares_strings(self):
+        """测试紧凑模式下重复的姓名共享同一字符串对象，备注不驻留"""
+        system = ContactSystem(compact=True)
+        system.add_contact("".join(["张", "三"]), "13800000001", "".join(["研发", "部"]))
+        system.add_contact("".join(["张", "三"]), "13800000002", "".join(["研发", "部"]))
+        first, second = system.list_all()
+        self.assertIs(first.name, second.name)
+        self.assertIsNot(first.remark, second.remark)
+        self.assertTrue(system.get_stats()["compact"])
+        self.assertFalse(hasattr(first, "__dict__"))
+
+
+class TestWriteAheadLog(unittest.TestCase):
+    """测试预写日志与快照压缩"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.files = ["wal_test.json", "wal_test.wal"]
+        self.tearDown()
+    
+    def tearDown(self):
+        """清理测试环境"""
+        for path in self.files:
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def open_system(self):
+        """模拟一次启动：加载快照并重放日志"""
+        system = ContactSystem(data_file="wal_test.json", durable=True)
+        system.load_from_file()
+        return system
+    
+    def test_replay_without_snapshot(self):
+        """测试未保存快照时重启可从日志恢复"""
+        system = self.open_system()
+        system.add_contact("张三", "13800000001", "工作")
+        system.add_contact("张三", "13800000002")
+        system.add_contact("李四", "13800000003")
+        system.del_contact("张三")
+        system.close()
+        
+        restored = self.open_system()
+        self.assertEqual([c.phone for c in restored.list_all()], ["13800000003"])
+        self.assertEqual(restored.count_by_name("张"), 0)
+        restored.close()
+    
+    def test_replay_prefix_delete(self):
+        """测试前缀删除只记一条日志，重放后结果相同"""
+        system = self.open_system()
+        for i in range(5):
+            system.add_contact("张三", f"1350012{i:04d}")
+        system.add_contact("李四", "13900000001")
+        system.del_by_phone_prefix("1350012")
+        system.add_contact("王五", "13500120009")
+        system.close()
+        with open("wal_test.wal", encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 8)
+        
+        restored = self.open_system()
+        self.assertEqual([c.phone for c in restored.list_all()], ["13900000001", "13500120009"])
+        restored.close()
+    
+    def test_compact_truncates_log(self):
+        """测试COMPACT写入新快照并清空日志"""
+        system = self.open_system()
+        system.add_contact("张三", "13800000001")
+        success, _ = system.compact_wal()
+        self.assertTrue(success)
+        self.assertEqual(os.path.getsize("wal_test.wal"), 0)
+        system.add_contact("李四", "13800000002")
+        system.close()
+        
+        restored = self.open_system()
+        self.assertEqual(restored.size, 2)
+        restored.close()
+    
+    def test_compact_keeps_mapped_snapshot(self):
+        """测试在映射的二进制快照上COMPACT后数据仍可查询"""
+        self.files.append("wal_test.snap")
+        system = ContactSystem(data_file="wal_test.snap", durable=True)
+        system.add_contact("张三", "13800000001")
+        system.add_contact("李四", "13800000002")
+        system.compact_wal()
+        system.close()
+        
+        restored = ContactSystem(data_file="wal_test.snap", durable=True)
+        restored.load_from_file()
+        self.assertIsNotNone(restored.mapped)
+        success, _ = restored.compact_wal()
+        self.assertTrue(success)
+        self.assertEqual(restored.size, 2)
+        self.assertEqual([c.name for c in restored.find_by_phone("138")], ["张三", "李四"])
+        restored.add_contact("王五", "13800000003")
+        restored.close()
+        
+        again = ContactSystem(data_file="wal_test.snap", durable=True)
+        again.load_from_file()
+        self.assertEqual(again.size, 3)
+        again.close()
+    
+    def test_bulk_import_is_logged(self):
+        """测试批量导入与加载其他文件写入日志，未保存快照就崩溃也能在重启后恢复"""
+        self.files += ["wal_import.jsonl", "wal_import.snap"]
+        source = ContactSystem()
+        source.add_contact("王五", "13700000001")
+        source.save_to_file("wal_import.jsonl")
+        source.save_to_file("wal_import.snap")
+        source.add_contact("赵六", "13600000001")
+        source.save_to_file("wal_import.snap")
+        
+        system = self.open_system()
+        system.bulk_load([{"name": "张三", "phone": "13800000001"}, {"name": "李四", "phone": "13900000001"}])
+        system.load_from_file("wal_import.jsonl")
+        system.load_from_file("wal_import.snap")
+        # 模拟崩溃：不调用close，也不写快照，直接重启
+        
+        restored = self.open_system()
+        self.assertEqual([c.name for c in restored.list_all()], ["张三", "李四", "王五", "赵六"])
+        restored.close()
+        system.close()
+        with open("wal_test.wal", encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 4)
+        
+        mapped = ContactSystem(data_file="wal_test.snap", durable=True)
+        self.files += ["wal_test.snap"]
+        mapped.load_from_file("wal_import.snap")
+        self.assertIsNone(mapped.mapped)
+        self.assertEqual(mapped.size, 2)
+        mapped.close()
+    
+    def test_replay_is_idempotent(self):
+        """测试快照已包含日志效果时（压缩中途崩溃）重放结果不变"""
+        system = self.open_system()
+        system.add_contact("张三", "13800000001")
+        system.del_contact("13800000001")
+        system.add_contact("李四", "13800000001")
+        system.add_contact("13800000009", "13800000002")  # 名字恰好是号码形式
+        system.save_to_file()  # 写了快照但没有截断日志
+        system.close()
+        
+        restored = self.open_system()
+        self.assertEqual(sorted((c.name, c.phone) for c in restored.list_all()),
+                         [("13800000009", "13800000002"), ("李四", "13800000001")])
+        restored.close()
+    
+    def test_torn_tail_is_dropped(self):
+        """测试末尾写了一半的日志记录被忽略并截断"""
+        system = self.open_system()
+        system.add_contact("张三", "13800000001")
+        system.close()
+        with open("wal_test.wal", "a", encoding="utf-8") as f:
+            f.write('["A","李四","1380')
+        
+        restored = self.open_system()
+        self.assertEqual(restored.size, 1)
+        restored.add_contact("王五", "13800000003")
+        restored.close()
+        
+        again = self.open_system()
+        self.assertEqual([c.name for c in again.list_all()], ["张三", "王五"])
+        again.close()
+    
+    def test_fsync_batching(self):
+        """测试按批次fsync"""
+        system = ContactSystem(data_file="wal_test.json", durable=True, fsync_every=3)
+        system.add_contact("张三", "13800000001")
+        system.add_contact("李四", "13800000002")
+        self.assertEqual(system._wal_unsynced, 2)
+        system.add_contact("王五", "13800000003")
+        self.assertEqual(system._wal_unsynced, 0)
+        system.close()
+
+
+class TestMappedSnapshot(unittest.TestCase):
+    """测试内存映射的二进制快照"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.path = "mapped_test.snap"
+        self.system = ContactSystem()
+        for name, phone, remark in [("张三", "13800000002", "研发部"), ("李四", "13900000001", ""),
+                                    ("张三", "13800000001", "工作"), ("张三丰", "13700000001", "")]:
+            self.system.add_contact(name, phone, remark)
+        success, _ = self.system.save_to_file(self.path)
+        self.assertTrue(success)
+        self.mapped = ContactSystem()
+        count, _ = self.mapped.load_from_file(self.path)
+        self.assertEqual(count, 4)
+    
+    def tearDown(self):
+        """清理测试环境"""
+        self.mapped.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+    
+    def test_list_page_from_mapping(self):
+        """测试映射上的分页列出与内存结果一致，游标在导入内存后仍可继续"""
+        for order in ContactSystem.LIST_ORDERS:
+            page, cursor = self.mapped.list_page(order, 2)
+            self.assertEqual(page, self.system.list_page(order, 2)[0], order)
+            self.assertEqual(self.mapped.list_page(order, 2, cursor)[0],
+                             self.system.list_all()[2:] if order == "insert" else
+                             sorted(self.system.list_all(), key=lambda c: getattr(c, order))[2:], order)
+        _, cursor = self.mapped.list_page("insert", 3)
+        self.mapped.add_contact("王五", "13600000001")
+        self.assertIsNone(self.mapped.mapped)
+        self.assertEqual([c.phone for c in self.mapped.list_page("insert", None, cursor)[0]],
+                         ["13700000001", "13600000001"])
+    
+    def test_queries_served_from_mapping(self):
+        """测试只读查询直接在映射上完成，结果与内存索引一致"""
+        self.assertIsNotNone(self.mapped.mapped)
+        self.assertEqual(self.mapped.get_stats()["storage"], "mmap")
+        self.assertEqual(self.mapped.get_stats()["unique_names"], 3)
+        for prefix in ["13", "138", "1380000000", "14"]:
+            self.assertEqual(self.mapped.find_by_phone(prefix), self.system.find_by_phone(prefix))
+            self.assertEqual(self.mapped.count_by_phone(prefix), self.system.count_by_phone(prefix))
+        for prefix in ["张", "张三", "李"]:
+            self.assertEqual(self.mapped.find_by_name(prefix), self.system.find_by_name(prefix))
+        self.assertEqual(self.mapped.list_all(), self.system.list_all())
+        
+        page, cursor = self.mapped.find_by_name_page("张", 1)
+        self.assertEqual(self.mapped.find_by_name("张", cursor=cursor), self.system.find_by_name("张")[1:])
+        self.assertIsNotNone(self.mapped.mapped)
+    
+    def test_write_materializes(self):
+        """测试首次写入时导入内存并保持数据完整"""
+        success, _ = self.mapped.add_contact("王五", "13800000001")
+        self.assertFalse(success)
+        self.assertIsNone(self.mapped.mapped)
+        self.assertEqual(self.mapped.size, 4)
+        count, _ = self.mapped.del_contact("张三")
+        self.assertEqual(count, 2)
+        self.assertEqual([c.name for c in self.mapped.find_by_name("张")], ["张三丰"])
+
+
+class TestPinyin(unittest.TestCase):
+    """测试拼音对照表"""
+    
+    def test_conversion(self):
+        """测试全拼、首字母与姓氏读音"""
+        self.assertEqual(to_pinyin("张三"), "zhangsan")
+        self.assertEqual(to_initials("张三"), "zs")
+        self.assertEqual(to_pinyin("吕布"), "lvbu")
+        self.assertEqual(to_pinyin("曾小明"), "zengxiaoming")
+        self.assertEqual(to_pinyin("明曾"), "mingceng")
+        self.assertEqual(to_initials("Tom 李"), "toml")
+        self.assertEqual(normalize_query("Zhang San'"), "zhangsan")
 
 
 class TestTrie(unittest.TestCase):
@@ -170,6 +775,948 @@ class TestTrie(unittest.TestCase):
         self.trie.remove("张三", contact)
         results = self.trie.search_prefix("张")
         self.assertEqual(len(results), 0)
+    
+    def test_search_page_with_cursor(self):
+        """测试按游标分页遍历，结果有序且不重复"""
+        phones = ["139", "1380", "138", "13801", "137", "1381"]
+        for phone in phones:
+            self.trie.insert(phone, Contact("张三", phone))
+        
+        collected = []
+        cursor = None
+        while True:
+            page, cursor = self.trie.search_page("13", 2, cursor=cursor)
+            collected.extend(c.phone for c in page)
+            if cursor is None:
+                break
+        self.assertEqual(collected, sorted(phones))
+        
+        # 游标对应的键被删除后仍能继续
+        page, cursor = self.trie.search_page("13", 3)
+        self.trie.remove("1380", page[-1])
+        rest = self.trie.search_prefix("13", cursor=cursor)
+        self.assertEqual([c.phone for c in rest], ["13801", "1381", "139"])
+    
+    def test_identical_contacts_kept_apart(self):
+        """测试字段相同的不同联系人按编号分别存储和删除"""
+        a = Contact("张三", "13800000001")
+        b = Contact("张三", "13800000001")
+        self.trie.insert("张三", a)
+        self.trie.insert("张三", b)
+        self.assertEqual(self.trie.count_prefix("张三"), 2)
+        self.trie.remove("张三", b)
+        results = self.trie.search_prefix("张三")
+        self.assertEqual(len(results), 1)
+        self.assertIs(results[0], a)
+    
+    def test_count_prefix(self):
+        """测试子树计数随插入删除更新"""
+        contacts = [Contact("张三", "1"), Contact("张三", "2"), Contact("张四", "3")]
+        for contact in contacts:
+            self.trie.insert(contact.name, contact)
+        self.trie.insert("张三", contacts[0])  # 重复插入不计数
+        self.assertEqual(self.trie.count_prefix("张"), 3)
+        self.assertEqual(self.trie.count_prefix("张三"), 2)
+        self.assertEqual(self.trie.count_prefix("李"), 0)
+        
+        self.trie.remove("张三", contacts[0])
+        self.trie.remove("张三", contacts[0])  # 重复删除不计数
+        self.assertEqual(self.trie.count_prefix("张"), 2)
+        self.trie.remove("张四", contacts[2])
+        self.assertNotIn("四", self.trie.root.children["张"].children)
+        self.assertEqual(self.trie.root.count, 1)
+    
+    def test_bulk_insert_matches_insert(self):
+        """测试有序批量插入与逐条插入得到相同的树和计数"""
+        pairs = sorted(((phone, Contact("张三", phone)) for phone in
+                        ["138", "1380", "13801", "139", "", "2", "1380"]), key=lambda p: p[0])
+        other = Trie()
+        for key, contact in pairs:
+            other.insert(key, contact)
+        self.trie.bulk_insert((key, [contact]) for key, contact in pairs)
+        for prefix in ["", "1", "13", "138", "1380", "2", "3"]:
+            self.assertEqual(self.trie.count_prefix(prefix), other.count_prefix(prefix))
+            self.assertEqual(self.trie.search_prefix(prefix), other.search_prefix(prefix))
+    
+    def test_search_prefix_limit_offset(self):
+        """测试 limit/offset"""
+        for i in range(10):
+            self.trie.insert(f"13{i}", Contact("张三", f"13{i}"))
+        results = self.trie.search_prefix("13", limit=3, offset=4)
+        self.assertEqual([c.phone for c in results], ["134", "135", "136"])
+        self.assertEqual(self.trie.search_prefix("14", limit=3), [])
+
+
+class TestRadixTrie(unittest.TestCase):
+    """测试路径压缩Trie树"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.trie = RadixTrie()
+    
+    def test_edges_are_compressed(self):
+        """测试单分支路径合并为一条边"""
+        contact = Contact("张三", "13800000001")
+        self.trie.insert("13800000001", contact)
+        self.assertEqual(list(self.trie.root.children), ["1"])
+        self.assertEqual(self.trie.root.children["1"].label, "13800000001")
+    
+    def test_split_and_merge(self):
+        """测试插入时拆分边、删除时合并边"""
+        c1 = Contact("张三", "13800000001")
+        c2 = Contact("李四", "13800000002")
+        self.trie.insert(c1.phone, c1)
+        self.trie.insert(c2.phone, c2)
+        mid = self.trie.root.children["1"]
+        self.assertEqual(mid.label, "1380000000")
+        self.assertEqual(sorted(mid.children), ["1", "2"])
+        self.assertEqual(self.trie.count_prefix("138"), 2)
+        
+        self.trie.remove(c1.phone, c1)
+        self.assertEqual(self.trie.root.children["1"].label, "13800000002")
+        self.assertEqual(self.trie.search_prefix("1380"), [c2])
+        self.trie.remove(c2.phone, c2)
+        self.assertEqual(self.trie.root.children, {})
+    
+    def test_matches_trie(self):
+        """测试查询、计数、分页结果与普通Trie一致"""
+        trie = Trie()
+        contacts = [Contact("张三", phone) for phone in
+                    ["138", "1380", "13801", "139", "1", "2", "13801"]]
+        for contact in contacts:
+            trie.insert(contact.phone, contact)
+            self.trie.insert(contact.phone, contact)
+        for prefix in ["1", "13", "138", "1380", "13802", "2"]:
+            self.assertEqual(self.trie.search_prefix(prefix), trie.search_prefix(prefix))
+            self.assertEqual(self.trie.count_prefix(prefix), trie.count_prefix(prefix))
+        page, cursor = self.trie.search_page("13", 2)
+        self.assertEqual(self.trie.search_prefix("13", cursor=cursor),
+                         trie.search_prefix("13", cursor=cursor))
+    
+    def test_system_with_radix_index(self):
+        """测试ContactSystem使用RadixTrie索引"""
+        system = ContactSystem(name_index_type="radix", phone_index_type="radix")
+        system.add_contact("张三", "13800000001")
+        system.add_contact("张三丰", "13800000002")
+        system.add_contact("李四", "13900000001")
+        self.assertEqual(len(system.find_by_name("张三")), 2)
+        self.assertEqual(system.count_by_phone("138"), 2)
+        system.del_contact("13800000001")
+        self.assertEqual([c.name for c in system.find_by_name("张")], ["张三丰"])
+        with self.assertRaises(ValueError):
+            ContactSystem(phone_index_type="btree")
+
+
+class TestIndexBackends(unittest.TestCase):
+    """测试有序数组、扫描与自适应索引后端"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.contacts = [Contact("张三", phone) for phone in
+                         ["138", "1380", "13801", "139", "1", "2", "13801"]]
+    
+    def test_backends_match_trie(self):
+        """测试各后端的查询、计数、分页与删除结果与Trie一致"""
+        trie = Trie()
+        for contact in self.contacts:
+            trie.insert(contact.phone, contact)
+        for backend in ("sorted", "scan", "auto"):
+            index = ContactSystem.INDEX_TYPES[backend]()
+            for contact in self.contacts:
+                index.insert(contact.phone, contact)
+            for prefix in ["1", "13", "138", "1380", "13802", "2", ""]:
+                self.assertEqual(index.search_prefix(prefix), trie.search_prefix(prefix), backend)
+                self.assertEqual(index.count_prefix(prefix), trie.count_prefix(prefix), backend)
+            page, cursor = index.search_page("13", 3)
+            self.assertEqual(cursor, trie.search_page("13", 3)[1])
+            self.assertEqual(index.search_prefix("13", cursor=cursor),
+                             trie.search_prefix("13", cursor=cursor))
+            index.remove("13801", self.contacts[2])
+            self.assertEqual([c.id for c in index.search_prefix("13801")], [self.contacts[6].id])
+    
+    def test_sorted_fuzzy_matches_trie(self):
+        """测试有序数组上的容错查询与Trie树结果一致"""
+        rng = random.Random(5)
+        contacts = [Contact("".join(rng.choice("张王李三四五丰") for _ in range(rng.randint(1, 4))), str(i))
+                    for i in range(300)]
+        trie, index = Trie(), SortedArrayIndex()
+        for contact in contacts:
+            trie.insert(contact.name, contact)
+        index.bulk_insert((contact.name, [contact]) for contact in sorted(contacts, key=lambda c: c.name))
+        for query, max_edits in [("张三", 1), ("王五丰", 2), ("李", 0), ("四四四四四", 1)]:
+            expected = sorted((d, key, c.id) for d, key, c in trie.iter_fuzzy(query, max_edits))
+            actual = sorted((d, key, c.id) for d, key, c in index.iter_fuzzy(query, max_edits))
+            self.assertEqual(actual, expected, query)
+    
+    def test_fuzzy_on_empty_index(self):
+        """测试空的或被删空的有序数组索引上容错查询返回空结果"""
+        self.assertEqual(list(SortedArrayIndex().iter_fuzzy("张三", 1)), [])
+        self.assertEqual(ContactSystem(name_index_type="sorted").find_by_name_fuzzy("张三", 1), [])
+        index = AdaptiveIndex()
+        index.bulk_insert((f"张{i:04d}", [Contact(f"张{i:04d}", str(i))]) for i in range(1000))
+        self.assertEqual(index.backend, "auto:sorted")
+        index.detach_prefix("")
+        self.assertEqual(list(index.iter_fuzzy("张三", 1)), [])
+    
+    def test_detach_prefix(self):
+        """测试各后端整体摘除前缀后，返回的联系人与剩余结果正确"""
+        for backend in ("trie", "radix", "sorted", "scan", "auto"):
+            index = ContactSystem.INDEX_TYPES[backend]()
+            for contact in self.contacts:
+                index.insert(contact.phone, contact)
+            removed = index.detach_prefix("138")
+            expected = [c.id for c in self.contacts if c.phone.startswith("138")]
+            self.assertEqual(sorted(c.id for c in removed), expected, backend)
+            self.assertEqual([c.phone for c in index.search_prefix("")], ["1", "139", "2"], backend)
+            self.assertEqual(index.count_prefix("13"), 1, backend)
+            self.assertEqual(index.detach_prefix("1380"), [], backend)
+            self.assertEqual(len(index.detach_prefix("")), 3, backend)
+            self.assertEqual(len(index), 0, backend)
+    
+    def test_radix_detach_inside_edge(self):
+        """测试压缩Trie在边的中间摘除时整条边连同子树摘下，并合并剩余的单分支"""
+        index = RadixTrie()
+        contacts = [Contact("张三", phone) for phone in ["13500120001", "13500120002", "13500999"]]
+        for contact in contacts:
+            index.insert(contact.phone, contact)
+        self.assertEqual(len(index.detach_prefix("1350012")), 2)
+        self.assertEqual(index.root.children["1"].label, "13500999")
+        self.assertEqual(index.search_prefix("135"), [contacts[2]])
+    
+    def test_sorted_bulk_insert_merges(self):
+        """测试有序数组批量导入与已有数据合并，同键内已有联系人在前"""
+        index = SortedArrayIndex()
+        index.insert("138", self.contacts[0])
+        index.bulk_insert([("1", [self.contacts[4]]), ("138", [self.contacts[1], self.contacts[0]])])
+        self.assertEqual(index.keys, ["1", "138", "138"])
+        self.assertEqual([c.id for c in index.search_prefix("138")],
+                         [self.contacts[0].id, self.contacts[1].id])
+    
+    def test_adaptive_choice(self):
+        """测试自适应索引按数据量与读写比例选择后端"""
+        self.assertEqual(AdaptiveIndex.choose(10, 0, 100), "scan")
+        self.assertEqual(AdaptiveIndex.choose(100000, 1000, 10), "sorted")
+        self.assertEqual(AdaptiveIndex.choose(100000, 500, 500), "trie")
+        
+        index = AdaptiveIndex()
+        index.bulk_insert((f"138{i:08d}", [Contact("张三", f"138{i:08d}")]) for i in range(1000))
+        self.assertEqual(index.backend, "auto:sorted")
+        self.assertEqual(index.switches, 0)
+        extra = [Contact("李四", f"139{i:08d}") for i in range(AdaptiveIndex.WINDOW)]
+        for contact in extra:
+            index.insert(contact.phone, contact)
+        self.assertEqual(index.backend, "auto:trie")
+        self.assertEqual(index.count_prefix("139"), len(extra))
+        self.assertEqual(len(index), 1000 + len(extra))
+    
+    def test_adaptive_concurrent_reads(self):
+        """测试多个线程并发查询时计数不丢失，同一窗口只迁移一次"""
+        index = AdaptiveIndex()
+        for i in range(1000):
+            index.insert(f"138{i:08d}", Contact("张三", f"138{i:08d}"))
+        self.assertEqual(index.backend, "auto:trie")
+        switches = index.switches
+        index.reads = index.writes = 0
+        per_thread = AdaptiveIndex.WINDOW // 8 - 1
+        errors = []
+        def reader():
+            for _ in range(per_thread):
+                if index.count_prefix("138") != 1000:
+                    errors.append(index.backend)
+        threads = [threading.Thread(target=reader) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual((index.reads, index.switches), (8 * per_thread, switches))
+        for _ in range(AdaptiveIndex.WINDOW - 8 * per_thread):
+            index.count_prefix("1")
+        self.assertEqual((index.backend, index.switches), ("auto:sorted", switches + 1))
+    
+    def test_system_with_auto_index(self):
+        """测试ContactSystem使用自适应索引"""
+        system = ContactSystem(name_index_type="auto", phone_index_type="sorted")
+        system.add_contact("张三", "13800000001")
+        system.add_contact("张三丰", "13800000002")
+        system.del_contact("13800000001")
+        self.assertEqual([c.name for c in system.find_by_name("张")], ["张三丰"])
+        self.assertEqual(system.count_by_phone("138"), 1)
+        stats = system.get_stats()
+        self.assertEqual(stats["name_index_backend"], "auto:scan")
+        self.assertEqual(stats["phone_index_backend"], "sorted")
+
+
+class TestPrefixCache(unittest.TestCase):
+    """测试前缀查询结果缓存"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.system = ContactSystem(cache_entries=8)
+        self.system.add_contact("张三", "13800000001")
+        self.system.add_contact("张四", "13800000002")
+        self.system.add_contact("李四", "13900000001")
+    
+    def test_cache_hit_returns_copy(self):
+        """测试重复查询命中缓存，且修改返回结果不影响缓存"""
+        first = self.system.find_by_name("张")
+        first.clear()
+        self.assertEqual(len(self.system.find_by_name("张")), 2)
+        stats = self.system.get_stats()
+        self.assertEqual((stats["cache_hits"], stats["cache_misses"]), (1, 1))
+    
+    def test_precise_invalidation(self):
+        """测试增删只淘汰受影响的前缀"""
+        self.system.find_by_name("张")
+        self.system.find_by_name("李")
+        self.system.find_by_phone("138")
+        self.system.add_contact("张五", "13700000001")
+        self.assertEqual(self.system.cache.invalidations, 1)
+        self.assertEqual(len(self.system.find_by_name("张")), 3)
+        self.assertEqual(len(self.system.find_by_name("李")), 1)
+        self.assertEqual(len(self.system.find_by_phone("138")), 2)
+        self.assertEqual(self.system.cache.hits, 2)
+        
+        self.system.del_contact("13800000001")
+        self.assertEqual(len(self.system.find_by_phone("138")), 1)
+        self.assertEqual(sorted(c.name for c in self.system.find_by_name("张")), ["张五", "张四"])
+    
+    def test_pages_cached_separately(self):
+        """测试分页参数不同的查询分别缓存且结果正确"""
+        page, cursor = self.system.find_by_phone_page("13", 2)
+        rest, _ = self.system.find_by_phone_page("13", None, cursor=cursor)
+        self.assertEqual(self.system.find_by_phone_page("13", 2), (page, cursor))
+        self.assertEqual(len(page) + len(rest), 3)
+        self.assertEqual(self.system.cache.hits, 1)
+    
+    def test_lru_and_byte_bounds(self):
+        """测试按条目数淘汰最久未用的条目，超出字节上限的结果不缓存"""
+        cache = PrefixCache(2)
+        cache.put(("name", "a", None, 0, None), [], None)
+        cache.put(("name", "b", None, 0, None), [], None)
+        cache.get(("name", "a", None, 0, None))
+        cache.put(("name", "c", None, 0, None), [], None)
+        self.assertEqual([key[1] for key in cache.entries], ["a", "c"])
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.by_prefix, {("name", "a"): {("name", "a", None, 0, None)},
+                                           ("name", "c"): {("name", "c", None, 0, None)}})
+        
+        small = PrefixCache(10, max_bytes=100)
+        small.put(("name", "a", None, 0, None), [Contact("张三", str(i)) for i in range(50)], None)
+        self.assertEqual((len(small.entries), small.bytes), (0, 0))
+    
+    def test_cache_disabled(self):
+        """测试cache_entries为0时关闭缓存"""
+        system = ContactSystem(cache_entries=0)
+        system.add_contact("张三", "13800000001")
+        self.assertEqual(len(system.find_by_name("张")), 1)
+        self.assertIsNone(system.cache)
+        self.assertFalse(system.get_stats()["cache_enabled"])
+    
+    def test_bulk_load_clears_cache(self):
+        """测试批量导入后不返回过期结果"""
+        self.system.find_by_name("王")
+        self.system.bulk_load([{"name": "王五", "phone": "13600000001"}])
+        self.assertEqual(len(self.system.find_by_name("王")), 1)
+
+
+class TestThreadSafety(unittest.TestCase):
+    """测试读写锁与线程安全模式"""
+    
+    def test_rwlock_reentrant(self):
+        """测试读写锁可重入，持读锁时升级为写锁报错"""
+        lock = RWLock()
+        lock.acquire_write()
+        lock.acquire_write()
+        lock.acquire_read()
+        lock.release_read()
+        lock.release_write()
+        lock.release_write()
+        lock.acquire_read()
+        lock.acquire_read()
+        self.assertRaises(RuntimeError, lock.acquire_write)
+        lock.release_read()
+        lock.release_read()
+        lock.acquire_write()
+        lock.release_write()
+    
+    def test_rwlock_excludes_writers(self):
+        """测试读者持锁期间写者等待，读者释放后写者才能进入"""
+        lock = RWLock()
+        events = []
+        lock.acquire_read()
+        writer = threading.Thread(target=lambda: (lock.acquire_write(), events.append("write"),
+                                                  lock.release_write()))
+        writer.start()
+        while not lock._waiting_writers:
+            time.sleep(0.001)
+        self.assertEqual(events, [])
+        # 另一线程的读者在有写者等待时让行
+        reader = threading.Thread(target=lambda: (lock.acquire_read(), events.append("read"),
+                                                  lock.release_read()))
+        reader.start()
+        reader.join(0.05)
+        self.assertEqual(events, [])
+        lock.release_read()
+        writer.join()
+        reader.join()
+        self.assertEqual(events, ["write", "read"])
+    
+    def test_concurrent_reads_and_writes(self):
+        """测试并发增删与查询不出错，结束后各索引与链表一致"""
+        system = ContactSystem(thread_safe=True, name_index_type="auto", phone_index_type="auto",
+                               use_phone_ngram_index=True)
+        errors = []
+        
+        def writer(base):
+            try:
+                for i in range(300):
+                    system.add_contact(f"张{i % 7}", f"1{base}{i:08d}")
+                    if i % 3 == 0:
+                        system.del_contact(f"1{base}{i // 2:08d}")
+            except Exception as e:
+                errors.append(e)
+        
+        def reader():
+            try:
+                for i in range(300):
+                    system.find_by_name("张", limit=20)
+                    system.find_by_phone(f"1{i % 4}")
+                    system.find_by_phone_substring("0001")
+                    system.list_all()
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=writer, args=(base,)) for base in range(4)]
+        threads += [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        contacts = system.list_all()
+        self.assertEqual(len(contacts), system.size)
+        self.assertEqual(system.count_by_name("张"), system.size)
+        self.assertEqual(sorted(c.phone for c in system.find_by_phone("1")),
+                         sorted(c.phone for c in contacts))
+        self.assertTrue(system.get_stats()["thread_safe"])
+
+
+class TestCommandExecutor(unittest.TestCase):
+    """测试命令执行器的结构化结果"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.executor = CommandExecutor(ContactSystem())
+    
+    def test_commands(self):
+        """测试各命令返回的字段"""
+        self.assertTrue(self.executor.execute("ADD 张三 13800000001 研发 北京")["ok"])
+        self.assertTrue(self.executor.execute("add 张四 13800000002")["ok"])
+        result = self.executor.execute("FIND_NAME 张 1")
+        self.assertEqual((result["command"], result["count"], result["more"]), ("FIND_NAME", 1, True))
+        self.assertEqual(result["contacts"][0], {"name": "张三", "phone": "13800000001", "remark": "研发 北京"})
+        self.assertEqual(self.executor.execute("COUNT_PHONE 138")["count"], 2)
+        self.assertEqual(self.executor.execute("FIND_PINYIN zs")["count"], 2)
+        self.assertEqual(self.executor.execute("STAT")["stats"]["total_contacts"], 2)
+        self.assertEqual(self.executor.execute("DEL 13800000001")["count"], 1)
+        self.assertEqual(self.executor.execute("LIST")["count"], 1)
+    
+    def test_errors(self):
+        """测试格式错误、未知命令与执行失败均返回ok为False"""
+        for line in ["", "BOGUS", "ADD 张三", "FIND_NAME 张 0", "FIND_FUZZY 张三 x", "DEL 13900000000", "COMPACT"]:
+            result = self.executor.execute(line)
+            self.assertFalse(result["ok"], line)
+            self.assertIn("error", result)
+        self.executor.execute("ADD 张三 13800000001")
+        self.assertFalse(self.executor.execute("ADD 李四 13800000001")["ok"])
+    
+    def test_save_path_requires_allow_paths(self):
+        """测试只有开启 allow_paths 时 SAVE 才接受文件名"""
+        self.executor.execute("ADD 张三 13800000001")
+        self.assertFalse(self.executor.execute("SAVE executor_test.json")["ok"])
+        self.assertFalse(os.path.exists("executor_test.json"))
+        local = CommandExecutor(self.executor.system, allow_paths=True)
+        try:
+            self.assertTrue(local.execute("SAVE executor_test.json")["ok"])
+            self.assertTrue(os.path.exists("executor_test.json"))
+        finally:
+            if os.path.exists("executor_test.json"):
+                os.remove("executor_test.json")
+    
+    def test_find_pinyin_dedup(self):
+        """测试全拼与首字母匹配的重复联系人按电话去重，去重后仍补满条数，映射快照上亦然"""
+        for name, phone in [("张三", "13800000001"), ("赵华", "13800000002"), ("子华", "13800000003")]:
+            self.executor.execute(f"ADD {name} {phone}")
+        path = "pinyin_test.snap"
+        self.assertTrue(self.executor.system.save_to_file(path)[0])
+        mapped = ContactSystem()
+        try:
+            mapped.load_from_file(path)
+            for executor in (self.executor, CommandExecutor(mapped)):
+                for line in ("FIND_PINYIN zh 3", "FIND_PINYIN zh"):
+                    result = executor.execute(line)
+                    self.assertEqual([c["name"] for c in result["contacts"]], ["张三", "赵华", "子华"], line)
+                    self.assertFalse(result["more"], line)
+        finally:
+            mapped.close()
+            os.remove(path)
+
+
+class TestCommandServer(unittest.IsolatedAsyncioTestCase):
+    """测试网络服务的流水线与多连接"""
+    
+    async def asyncSetUp(self):
+        """启动监听随机端口的服务"""
+        self.server = ContactServer(ContactSystem())
+        self.port = await self.server.start("127.0.0.1", 0)
+    
+    async def asyncTearDown(self):
+        await self.server.stop()
+    
+    async def test_pipeline(self):
+        """测试连续发送的命令按顺序得到回复"""
+        client = await ContactClient.connect("127.0.0.1", self.port)
+        commands = [f"ADD 张{i} 138{i:08d}" for i in range(200)] + ["COUNT_NAME 张", "FIND_PHONE 13800000 3"]
+        responses = await client.pipeline(commands)
+        self.assertEqual(len(responses), 202)
+        self.assertTrue(all(response["ok"] for response in responses))
+        self.assertEqual(responses[200]["count"], 200)
+        self.assertEqual([c["phone"] for c in responses[201]["contacts"]],
+                         ["13800000000", "13800000001", "13800000002"])
+        await client.close()
+    
+    async def test_shared_system(self):
+        """测试多个连接共享同一通讯录"""
+        clients = [await ContactClient.connect("127.0.0.1", self.port) for _ in range(5)]
+        await asyncio.gather(*(client.pipeline([f"ADD 用户{i}_{j} 1{i}{j:09d}" for j in range(50)])
+                               for i, client in enumerate(clients)))
+        self.assertEqual((await clients[0].request("COUNT_NAME 用户"))["count"], 250)
+        self.assertEqual((await clients[4].request("BOGUS"))["ok"], False)
+        for client in clients:
+            await client.close()
+    
+    async def test_save_rejects_path(self):
+        """测试远程客户端不能通过 SAVE 写任意路径"""
+        client = await ContactClient.connect("127.0.0.1", self.port)
+        response = await client.request("SAVE server_test_escape.json")
+        self.assertFalse(response["ok"])
+        self.assertFalse(os.path.exists("server_test_escape.json"))
+        await client.close()
+    
+    async def test_long_line_and_exit(self):
+        """测试超长命令返回错误并断开，EXIT关闭连接"""
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"ADD " + b"x" * (ContactServer.MAX_LINE + 10) + b"\n")
+        response = json.loads(await reader.readline())
+        self.assertFalse(response["ok"])
+        self.assertEqual(await reader.readline(), b"")
+        writer.close()
+        
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"\nEXIT\nSTAT\n")
+        self.assertEqual(await reader.readline(), b"")
+        writer.close()
+
+
+class TestBatchMode(unittest.TestCase):
+    """测试命令行批处理模式"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.data_file = "test_batch.json"
+        self.interface = ContactCommandInterface(data_file=self.data_file, quiet=True)
+    
+    def tearDown(self):
+        """清理测试文件"""
+        if os.path.exists(self.data_file):
+            os.remove(self.data_file)
+    
+    def test_json_output_and_summary(self):
+        """测试逐行输出JSON，跳过注释与空行，遇到EXIT停止并输出汇总"""
+        source = io.StringIO("# 初始化\nADD 张三 13800000001 研发\n\nADD 李四 13800000001\n"
+                             "FIND_PHONE 138\nSAVE\nEXIT\nLIST\n")
+        out, err = io.StringIO(), io.StringIO()
+        summary = self.interface.run_batch(source, "json", out, err)
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r["command"] for r in results], ["ADD", "ADD", "FIND_PHONE", "SAVE"])
+        self.assertEqual([r["ok"] for r in results], [True, False, True, True])
+        self.assertEqual(results[2]["contacts"][0]["name"], "张三")
+        self.assertEqual((summary["total"], summary["failed"]), (4, 1))
+        self.assertIn("共 4 条命令", err.getvalue())
+        self.assertTrue(os.path.exists(self.data_file))
+    
+    def test_tsv_output(self):
+        """测试制表符分隔的输出格式"""
+        out = io.StringIO()
+        self.interface.run_batch(io.StringIO("ADD 张三 13800000001 研发 北京\nFIND_NAME 张 1\nDEL 王五\n"),
+                                 "tsv", out, io.StringIO())
+        self.assertEqual(out.getvalue().splitlines(), [
+            "ok\tADD\t成功：已添加联系人 张三 (13800000001)",
+            "ok\tFIND_NAME\t1",
+            "\t张三\t13800000001\t研发 北京",
+            "error\tDEL\t错误：未找到联系人 '王五'",
+        ])
+        self.assertEqual(format_tsv({"command": "FIND_NAME", "ok": True, "count": 0, "more": True,
+                                     "contacts": []}), "ok\tFIND_NAME\t0\tmore")
+    
+    def test_interactive_uses_executor(self):
+        """测试交互界面经命令执行器执行，只负责渲染结果"""
+        out = io.StringIO()
+        with redirect_stdout(out):
+            for line in ["ADD 张三 13800000001 研发", "ADD 张四 13800000002", "ADD 李四 13800000001",
+                         "COUNT_NAME 张", "LIST 1", "FIND_NAME 王", "BOGUS"]:
+                self.interface.handle(line)
+        text = out.getvalue()
+        self.assertIn("✓ 成功：已添加联系人 张三 (13800000001)", text)
+        self.assertIn("✗ 错误：电话号码 13800000001 已存在", text)
+        self.assertIn("✓ 名字前缀为 '张' 的联系人共 2 个", text)
+        _, cursor = self.interface.system.list_page("insert", 1)
+        self.assertIn(f"下一页：LIST 1 after {cursor}", text)
+        self.assertIn("✗ 未找到符合条件的联系人", text)
+        self.assertIn("✗ 未知命令：'BOGUS'", text)
+    
+    def test_compact_option(self):
+        """测试 --compact 开启紧凑存储，STAT 显示该项"""
+        self.assertFalse(parse_args([]).compact)
+        args = parse_args(["--compact", "--data-file", self.data_file])
+        interface = ContactCommandInterface(data_file=args.data_file, compact=args.compact, quiet=True)
+        self.assertTrue(interface.system.compact)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            interface.handle("STAT")
+        self.assertIn("紧凑存储：         是", out.getvalue())
+
+
+class TestShardedSystem(unittest.TestCase):
+    """测试多进程分片通讯录与单个通讯录的结果一致"""
+    
+    def setUp(self):
+        """启动三个分片"""
+        self.sharded = ShardedContactSystem(3)
+        self.single = ContactSystem()
+    
+    def tearDown(self):
+        """关闭工作进程"""
+        self.sharded.close()
+    
+    def test_matches_single_system(self):
+        """测试随机增删后，前缀查询、分页与计数与单个通讯录一致"""
+        rng = random.Random(7)
+        records = [{"name": rng.choice("张王李") + rng.choice("一二三"), "phone": f"13{rng.randrange(10 ** 4):04d}"}
+                   for _ in range(300)]
+        self.assertEqual(self.sharded.bulk_load(records), self.single.bulk_load(records))
+        for i in range(200):
+            key = rng.choice([rng.choice(records)["phone"], rng.choice(records)["name"], f"13{i:04d}"])
+            if i % 3:
+                self.assertEqual(self.sharded.del_contact(key), self.single.del_contact(key), key)
+            else:
+                self.assertEqual(self.sharded.add_contact("赵一", key), self.single.add_contact("赵一", key))
+        
+        self.assertEqual(len(self.sharded), self.single.size)
+        for prefix in ["1", "13", "130", "1301"]:
+            self.assertEqual(self.sharded.find_by_phone(prefix), self.single.find_by_phone(prefix))
+            self.assertEqual(self.sharded.find_by_phone(prefix, 5, 3), self.single.find_by_phone(prefix, 5, 3))
+            self.assertEqual(self.sharded.count_by_phone(prefix), self.single.count_by_phone(prefix))
+        for prefix in ["张", "王二", "赵"]:
+            self.assertEqual(sorted(c.phone for c in self.sharded.find_by_name(prefix)),
+                             sorted(c.phone for c in self.single.find_by_name(prefix)))
+            self.assertEqual([c.name for c in self.sharded.find_by_name(prefix, 4)],
+                             [c.name for c in self.single.find_by_name(prefix, 4)])
+            self.assertEqual(self.sharded.count_by_name(prefix), self.single.count_by_name(prefix))
+        self.assertEqual(self.sharded.del_by_phone_prefix("130"), self.single.del_by_phone_prefix("130"))
+        self.assertEqual(self.sharded.del_by_name_prefix("张"), self.single.del_by_name_prefix("张"))
+        self.assertEqual(self.sharded.del_by_name_prefix("张"), self.single.del_by_name_prefix("张"))
+        self.assertEqual(len(self.sharded), self.single.size)
+    
+    def test_routing_and_errors(self):
+        """测试按电话路由、批量查询与工作进程中的异常"""
+        self.sharded.add_contact("张三", "13800000001")
+        shard = self.sharded.shard_of("13800000001")
+        self.assertEqual(self.sharded.get_stats()["shard_sizes"][shard], 1)
+        self.assertEqual([len(page) for page in self.sharded.find_by_phone_many(["138", "139"])], [1, 0])
+        self.assertRaises(ValueError, self.sharded.find_by_name, "张", None, -1)
+        self.assertRaises(ValueError, self.sharded._call, shard, "find_by_name", "张", -1)
+        self.assertEqual(len(self.sharded.list_all()), 1)
+        for options in ({"durable": True}, {"data_file": "shard_test.json"}):
+            self.assertRaises(ValueError, ShardedContactSystem, 2, **options)
+
+
+class TestSnapshot(unittest.TestCase):
+    """测试时间点只读视图"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.system = ContactSystem()
+        for i in range(100):
+            self.system.add_contact(f"张{i % 10}", f"138{i:08d}", f"备注{i}")
+    
+    def test_view_is_stable(self):
+        """测试快照不受之后的增删影响，遍历中途增删也一致"""
+        expected = self.system.list_all()
+        snapshot = self.system.snapshot()
+        for i in range(0, 100, 3):
+            self.system.del_contact(f"138{i:08d}")
+        self.system.add_contact("李四", "13900000001")
+        
+        iterator = iter(snapshot)
+        seen = [next(iterator) for _ in range(40)]
+        # 遍历进行到一半时删除已读过和尚未读到的联系人，再添加新联系人
+        for i in range(1, 100, 3):
+            self.system.del_contact(f"138{i:08d}")
+        self.system.add_contact("李五", "13900000002")
+        seen.extend(iterator)
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(snapshot), 100)
+        self.assertEqual(self.system.size, 100 - 67 + 2)
+    
+    def test_prefix_queries(self):
+        """测试快照中的前缀查询与创建时一致"""
+        expected_name = self.system.find_by_name("张1")
+        expected_phone = self.system.find_by_phone("1380000001", 5)
+        snapshot = self.system.snapshot()
+        self.system.del_contact("张1")
+        self.system.del_contact("13800000012")
+        self.system.add_contact("张1", "13800000999")
+        self.assertEqual(snapshot.find_by_name("张1"), expected_name)
+        self.assertEqual(snapshot.find_by_phone("1380000001", 5), expected_phone)
+        self.assertEqual(self.system.find_by_name("张1"), [Contact("张1", "13800000999")])
+    
+    def test_save_and_release(self):
+        """测试保存快照，释放后回收墓地，释放后不可再读"""
+        data_file = "test_snapshot.jsonl"
+        try:
+            with self.system.snapshot() as snapshot:
+                self.system.del_contact("张0")
+                self.assertEqual(self.system.get_stats()["snapshot_retained"], 10)
+                success, _ = snapshot.save_to_file(data_file)
+                self.assertTrue(success)
+            self.assertEqual(self.system.get_stats()["snapshot_retained"], 0)
+            self.assertRaises(ValueError, snapshot.list_all)
+            loaded = ContactSystem()
+            self.assertEqual(loaded.load_from_file(data_file)[0], 100)
+        finally:
+            if os.path.exists(data_file):
+                os.remove(data_file)
+        
+        # 未显式释放的快照被回收时同样释放
+        self.system.snapshot()
+        gc.collect()
+        self.assertEqual(self.system.get_stats()["snapshots"], 0)
+    
+    def test_concurrent_writer(self):
+        """测试另一线程持续增删时，快照遍历结果始终等于创建时的状态"""
+        system = ContactSystem(thread_safe=True)
+        for i in range(2000):
+            system.add_contact(f"王{i % 50}", f"137{i:08d}")
+        expected = system.list_all()
+        snapshot = system.snapshot()
+        stop = threading.Event()
+        
+        def writer():
+            i = 0
+            while not stop.is_set():
+                system.del_contact(f"137{random.randrange(2000):08d}")
+                system.add_contact("赵六", f"136{i:08d}")
+                i += 1
+        
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            for _ in range(5):
+                self.assertEqual(snapshot.list_all(), expected)
+            self.assertEqual([c.phone for c in snapshot.find_by_phone("1370000")],
+                             [c.phone for c in expected if c.phone.startswith("1370000")])
+        finally:
+            stop.set()
+            thread.join()
+        snapshot.close()
+
+
+class TestPrefixDelete(unittest.TestCase):
+    """测试按前缀批量删除"""
+    
+    def fill(self, system):
+        """号段 1350012 下 20 个号码，另有 10 个其他号码"""
+        for i in range(20):
+            system.add_contact(f"张{i % 3}", f"1350012{i:04d}")
+        for i in range(10):
+            system.add_contact(f"李{i}", f"1390000{i:04d}")
+    
+    def check_consistent(self, system):
+        """链表、散列表与各索引相互一致"""
+        contacts = system.list_all()
+        self.assertEqual(len(contacts), system.size)
+        self.assertEqual(set(system.phone_hash), {c.phone for c in contacts})
+        self.assertEqual(sum(len(bucket) for bucket in system.name_hash.values()), system.size)
+        self.assertEqual(sorted(c.phone for c in system.find_by_phone("1")), sorted(c.phone for c in contacts))
+        self.assertEqual(len(system.find_by_name("张")) + len(system.find_by_name("李")), system.size)
+        self.assertEqual(len(system.find_by_pinyin("zhang")) + len(system.find_by_pinyin("li")), system.size)
+    
+    def test_delete_by_phone_prefix(self):
+        """测试各索引后端与构建模式下按电话前缀删除"""
+        configs = [dict(name_index_type=t, phone_index_type=t) for t in ContactSystem.INDEX_TYPES]
+        configs += [dict(use_index=False, use_phone_index=False), dict(index_mode="lazy")]
+        for options in configs:
+            system = ContactSystem(**options)
+            self.fill(system)
+            self.assertEqual(system.del_by_phone_prefix("1350012"), (20, "成功：已删除 20 个联系人"))
+            self.assertEqual(system.size, 10)
+            self.check_consistent(system)
+            count, msg = system.del_by_phone_prefix("1350012")
+            self.assertEqual(count, 0, options)
+            self.assertIn("1350012", msg)
+    
+    def test_delete_by_name_prefix(self):
+        """测试按名字前缀删除，并同步电话索引"""
+        system = ContactSystem(use_phone_ngram_index=True, use_remark_index=True)
+        self.fill(system)
+        self.assertEqual(system.del_by_name_prefix("张")[0], 20)
+        self.assertEqual(system.count_by_phone("1350012"), 0)
+        self.assertEqual(system.find_by_phone_substring("0012"), [])
+        self.check_consistent(system)
+        self.assertEqual(system.del_by_name_prefix("")[0], 0)
+    
+    def test_invalidates_cache_and_keeps_snapshot(self):
+        """测试缓存的查询结果随删除失效，已有快照仍能看到删除前的联系人"""
+        system = ContactSystem()
+        self.fill(system)
+        self.assertEqual(len(system.find_by_phone("135", 100)), 20)
+        with system.snapshot() as snapshot:
+            system.del_by_phone_prefix("135")
+            self.assertEqual(system.find_by_phone("135", 100), [])
+            self.assertEqual(len(snapshot.list_all()), 30)
+            self.assertEqual(len(snapshot.find_by_phone("1350012")), 20)
+    
+    def test_command(self):
+        """测试 DEL_PREFIX_NAME/DEL_PREFIX_PHONE 命令"""
+        executor = CommandExecutor(ContactSystem())
+        self.fill(executor.system)
+        self.assertEqual(executor.execute("DEL_PREFIX_PHONE 1350012")["count"], 20)
+        self.assertEqual(executor.execute("del_prefix_name 李")["count"], 10)
+        self.assertFalse(executor.execute("DEL_PREFIX_NAME 李")["ok"])
+        self.assertFalse(executor.execute("DEL_PREFIX_PHONE")["ok"])
+
+
+class TestListPage(unittest.TestCase):
+    """测试按插入顺序、姓名或电话分页列出"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        rng = random.Random(3)
+        self.records = [(rng.choice("张王李赵") + rng.choice("一二三"), f"13{i * 7919 % 1000:04d}")
+                        for i in range(60)]
+    
+    def pages(self, system, order, limit):
+        """沿游标取完全部页"""
+        pages = []
+        cursor = None
+        while True:
+            page, cursor = system.list_page(order, limit, cursor)
+            pages.append(page)
+            if cursor is None:
+                return pages
+    
+    def test_orders_match_sorted_list(self):
+        """测试各索引配置下逐页取出的结果与对全部联系人排序一致"""
+        configs = [dict(name_index_type=t, phone_index_type=t) for t in ContactSystem.INDEX_TYPES]
+        configs += [dict(use_index=False, use_phone_index=False)]
+        for options in configs:
+            system = ContactSystem(**options)
+            for name, phone in self.records:
+                system.add_contact(name, phone)
+            everyone = system.list_all()
+            expected = {"insert": everyone,
+                        "name": sorted(everyone, key=lambda c: c.name),
+                        "phone": sorted(everyone, key=lambda c: c.phone)}
+            for order, contacts in expected.items():
+                pages = self.pages(system, order, 7)
+                self.assertEqual([c for page in pages for c in page], contacts, (order, options))
+                self.assertTrue(all(len(page) == 7 for page in pages[:-1]))
+            self.assertEqual(system.list_page("name")[0], expected["name"])
+    
+    def test_insertion_cursor_after_delete(self):
+        """测试游标所指的联系人被删除后，插入顺序从其后继续"""
+        system = ContactSystem()
+        for name, phone in self.records[:10]:
+            system.add_contact(name, phone)
+        page, cursor = system.list_page("insert", 4)
+        system.del_contact(page[-1].phone)
+        system.del_contact(system.list_all()[3].phone)
+        self.assertEqual(system.list_page("insert", 2, cursor)[0], system.list_all()[3:5])
+    
+    def test_cursor_after_many_deletes(self):
+        """测试删除过半联系人（插入顺序数组重建）后，游标仍从其后继续"""
+        system = ContactSystem()
+        for name, phone in self.records:
+            system.add_contact(name, phone)
+        page, cursor = system.list_page("insert", 10)
+        rest = system.list_all()[10:]
+        for contact in system.list_all()[9:45]:
+            system.del_contact(contact.phone)
+        self.assertEqual(system.list_page("insert", None, cursor)[0], rest[35:])
+    
+    def test_sorted_cursor_after_earlier_delete(self):
+        """测试同名联系人中已返回的一个被删除后，按姓名与电话分页不丢失后续联系人"""
+        for order in ("name", "phone"):
+            system = ContactSystem()
+            for i in range(6):
+                system.add_contact("张三", f"1380000000{i}")
+            page, cursor = system.list_page(order, 2)
+            system.del_contact(page[0].phone)
+            rest, _ = system.list_page(order, None, cursor)
+            self.assertEqual([c.phone for c in rest], [f"1380000000{i}" for i in range(2, 6)], order)
+    
+    def test_cursor_within_crowded_key(self):
+        """测试同名联系人很多时，经删除、重新挂回与新增后按姓名分页仍不重不漏"""
+        for index_type in ("trie", "radix"):
+            system = ContactSystem(name_index_type=index_type)
+            for i in range(300):
+                system.add_contact("张三", f"138{i:08d}")
+            pages = self.pages(system, "name", 40)
+            self.assertEqual([c.phone for page in pages for c in page], [f"138{i:08d}" for i in range(300)])
+            page, cursor = system.list_page("name", 100)
+            for i in range(50, 250, 2):
+                system.del_contact(f"138{i:08d}")
+            system.add_contact("张三", "13900000000")
+            rest, _ = system.list_page("name", None, cursor)
+            expected = [f"138{i:08d}" for i in range(100, 300) if i >= 250 or i % 2] + ["13900000000"]
+            self.assertEqual([c.phone for c in rest], expected, index_type)
+            trie = system.name_trie
+            entries = trie.iter_prefix("张", ("张三", page[-1].id), skip=5)
+            self.assertEqual([c for _, _, c in islice(entries, 10)], rest[5:15], index_type)
+            # 旧编号重新挂回后，之后的游标仍按编号定位
+            trie.remove("张三", rest[0])
+            trie.insert("张三", rest[0])
+            entries = trie.iter_prefix("张", ("张三", page[-1].id))
+            self.assertEqual([c for _, _, c in entries], rest, index_type)
+    
+    def test_invalid_cursor(self):
+        """测试无效的排序方式与游标"""
+        system = ContactSystem()
+        system.add_contact("张三", "13800000001")
+        system.add_contact("李四", "13800000002")
+        _, cursor = system.list_page("name", 1)
+        self.assertRaises(ValueError, system.list_page, "phone", 1, cursor)
+        self.assertRaises(ValueError, system.list_page, "name", 1, "不是游标")
+        self.assertRaises(ValueError, system.list_page, "remark")
+    
+    def test_command(self):
+        """测试 LIST 命令的排序、分页与游标"""
+        executor = CommandExecutor(ContactSystem())
+        for name, phone in self.records[:5]:
+            executor.system.add_contact(name, phone)
+        result = executor.execute("LIST by phone 3")
+        self.assertEqual((result["count"], result["more"]), (3, True))
+        rest = executor.execute(f"LIST by phone 3 after {result['cursor']}")
+        self.assertEqual((rest["count"], rest["more"]), (2, False))
+        self.assertNotIn("cursor", rest)
+        phones = [c["phone"] for c in result["contacts"] + rest["contacts"]]
+        self.assertEqual(phones, sorted(phone for _, phone in self.records[:5]))
+        self.assertEqual(executor.execute("LIST")["count"], 5)
+        self.assertIn(result["cursor"], format_tsv(result))
+        for line in ["LIST by", "LIST by remark", "LIST 0", "LIST 3 after", "LIST by name after abc"]:
+            self.assertFalse(executor.execute(line)["ok"], line)
 
 
 class TestSystemWithoutIndex(unittest.TestCase):
@@ -195,6 +1742,28 @@ class TestSystemWithoutIndex(unittest.TestCase):
         
         results = self.system.find_by_phone("138")
         self.assertEqual(len(results), 1)
+    
+    def test_pagination_matches_indexed(self):
+        """测试无索引回退路径的分页结果与索引一致"""
+        indexed = ContactSystem(use_index=True, use_phone_index=True)
+        for name, phone in [("张三", "13800000002"), ("张四", "13800000001"),
+                            ("张三", "13800000003"), ("李五", "13900000001")]:
+            self.system.add_contact(name, phone)
+            indexed.add_contact(name, phone)
+        
+        for system in (self.system, indexed):
+            page, cursor = system.find_by_phone_page("138", 2)
+            rest = system.find_by_phone("138", cursor=cursor)
+            self.assertEqual([c.phone for c in page + rest],
+                             ["13800000001", "13800000002", "13800000003"])
+            page, cursor = system.find_by_name_page("张", 1)
+            rest = system.find_by_name("张", cursor=cursor)
+            self.assertEqual([c.phone for c in page + rest],
+                             ["13800000002", "13800000003", "13800000001"])
+            self.assertEqual(system.count_by_name("张"), 3)
+            self.assertEqual(system.count_by_phone("138"), 3)
+            self.assertEqual([c.phone for c in system.find_by_phone("13", limit=2, offset=1)],
+                             ["13800000002", "13800000003"])
 
 
 def run_tests():
@@ -210,9 +1779,23 @@ def run_tests():
     
     # 添加所有测试
     suite.addTests(loader.loadTestsFromTestCase(TestContact))
+    suite.addTests(loader.loadTestsFromTestCase(TestPinyin))
     suite.addTests(loader.loadTestsFromTestCase(TestTrie))
+    suite.addTests(loader.loadTestsFromTestCase(TestRadixTrie))
+    suite.addTests(loader.loadTestsFromTestCase(TestIndexBackends))
+    suite.addTests(loader.loadTestsFromTestCase(TestPrefixCache))
+    suite.addTests(loader.loadTestsFromTestCase(TestThreadSafety))
+    suite.addTests(loader.loadTestsFromTestCase(TestCommandExecutor))
+    suite.addTests(loader.loadTestsFromTestCase(TestCommandServer))
+    suite.addTests(loader.loadTestsFromTestCase(TestBatchMode))
+    suite.addTests(loader.loadTestsFromTestCase(TestShardedSystem))
+    suite.addTests(loader.loadTestsFromTestCase(TestSnapshot))
+    suite.addTests(loader.loadTestsFromTestCase(TestPrefixDelete))
+    suite.addTests(loader.loadTestsFromTestCase(TestListPage))
     suite.addTests(loader.loadTestsFromTestCase(TestContactSystem))
     suite.addTests(loader.loadTestsFromTestCase(TestSystemWithoutIndex))
+    suite.addTests(loader.loadTestsFromTestCase(TestWriteAheadLog))
+    suite.addTests(loader.loadTestsFromTestCase(TestMappedSnapshot))
     
     # 运行测试
     runner = unittest.TextTestRunner(verbosity=2)